@@ -0,0 +1,276 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Times the parts of pyFish that grow with the size of a game: building a Map, processing a move
+log, processing move results, working out the distance tables and ContinentBot's continent
+utilities, and how many games of self-play against the Engine a core gets through a minute.
+Each is run on the examples in json-examples and on generated maps and move logs of increasing
+size, and the results are written as JSON so runs of different versions can be compared.
+
+    python Benchmark.py --output results.json
+    python Benchmark.py --quick --compare results.json"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from pyFish import Core, Distances, Engine
+from pyFish.Moves import *
+from ContinentBot import ContinentBot
+from RandomBot import RandomBot
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'json-examples')
+#The number of territories in the generated maps, and the number of moves in the generated logs.
+MAP_SIZES = (1000, 5000, 20000)
+LOG_SIZES = (100000, 500000)
+QUICK_MAP_SIZES = (1000,)
+QUICK_LOG_SIZES = (100000,)
+#The sizes of the generated maps the distance tables are worked out for. A table holds every pair
+#of territories and is worked out in pure Python, so the larger maps would take too long.
+DISTANCE_MAP_SIZES = (1000, 2000)
+QUICK_DISTANCE_MAP_SIZES = (1000,)
+#The number of games played against each other by each kind of bot, and the most turns each game is played for.
+SELF_PLAY_GAMES = 10
+QUICK_SELF_PLAY_GAMES = 3
+SELF_PLAY_TURNS = 500
+#The number of territories in each continent of a generated map.
+CONTINENT_SIZE = 12
+
+def load_example(name):
+    with open(os.path.join(EXAMPLES, name), encoding='utf-8') as example_file:
+        return json.load(example_file)
+
+def synthetic_details(number_of_territories, seed=0):
+    """A getDetails response for a map of the given size. The territories are laid out on a grid,
+    each borders the territories next to it and a few border one more at random, and continents
+    are blocks of about CONTINENT_SIZE territories."""
+    deal = random.Random(seed)
+    details = copy.deepcopy(load_example('getDetails.json'))
+    width = max(1, int(number_of_territories ** 0.5))
+    territories = [{'id': str(index + 1), 'name': 'Territory {0}'.format(index + 1), 'maxunits': '0'} for index in range(number_of_territories)]
+    borders = []
+    for index in range(number_of_territories):
+        neighbors = [index + 1 if (index + 1) % width else None, index + width]
+        if deal.random() < 0.2:
+            neighbors.append(deal.randrange(number_of_territories))
+        for neighbor in neighbors:
+            if neighbor is not None and neighbor < number_of_territories and neighbor != index:
+                borders.append({'a': str(index + 1), 'b': str(neighbor + 1)})
+                borders.append({'a': str(neighbor + 1), 'b': str(index + 1)})
+    #Blocks of block_rows by block_columns territories, as near to CONTINENT_SIZE as a rectangle allows.
+    block_rows = max(1, int(CONTINENT_SIZE ** 0.5))
+    block_columns = max(1, round(CONTINENT_SIZE / block_rows))
+    members = {}
+    for index in range(number_of_territories):
+        row, column = divmod(index, width)
+        members.setdefault((row // block_rows, column // block_columns), []).append(str(index + 1))
+    continents = [{'id': str(number), 'name': 'Continent {0}'.format(number), 'units': str(len(cids) // 3 + 1), 'cids': ','.join(cids)}
+                  for number, cids in enumerate(members.values(), 1)]
+    details['_content']['map']['_content']['territory'] = territories
+    details['_content']['board']['_content']['border'] = borders
+    details['_content']['continents']['_content']['continent'] = continents
+    return details
+
+def synthetic_log(number_of_moves, number_of_territories, number_of_players=3, seed=0):
+    """A list of move dictionaries shaped like a getHistory move log, made of turns of bonus units,
+    placements, attacks, captures and transfers."""
+    deal = random.Random(seed)
+    moves = [{'a': 'n', 's': '0', 'logver': '3'}] + [{'a': 'j', 's': str(player)} for player in range(number_of_players)] + [{'a': 's'}]
+    territory = lambda: str(deal.randrange(number_of_territories) + 1)
+    player = 0
+    while len(moves) < number_of_moves:
+        seat = str(player)
+        moves.append({'a': 'z', 's': seat, 'num': str(deal.randint(3, 12))})
+        for _ in range(deal.randint(1, 3)):
+            moves.append({'a': 'p', 's': seat, 'cid': territory(), 'num': str(deal.randint(1, 5))})
+        for _ in range(deal.randint(0, 12)):
+            attack_dice = ','.join(str(die) for die in sorted((deal.randint(1, 6) for _ in range(3)), reverse=True))
+            defend_dice = ','.join(str(die) for die in sorted((deal.randint(1, 6) for _ in range(2)), reverse=True))
+            defender = str(deal.randrange(number_of_players))
+            moves.append({'a': 'a', 's': seat, 'm': '', 'al': str(deal.randint(0, 2)), 'dl': str(deal.randint(0, 2)), 'fcid': territory(),
+                          'tcid': territory(), 'ad': attack_dice, 'dd': defend_dice, 'ds': defender})
+            if deal.random() < 0.3:
+                moves.append({'a': 'c', 's': seat, 'cid': territory(), 'ds': defender})
+        moves.append({'a': 'f', 's': seat, 'fcid': territory(), 'tcid': territory(), 'num': str(deal.randint(1, 5))})
+        if deal.random() < 0.1:
+            moves.append({'a': 'g', 's': seat, 'clist': str(deal.randrange(4))})
+        player = (player + 1) % number_of_players
+    moves = moves[:number_of_moves]
+    for move_id, move in enumerate(moves):
+        move['id'] = str(move_id)
+        move['t'] = str(1232121066 + move_id * 7)
+    return moves
+
+def measure(function, repeat):
+    """Run the function repeat times and return the times it took in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return times
+
+def result(name, size, items, times):
+    return {'name': name, 'size': size, 'repeat': len(times), 'min': min(times), 'mean': statistics.mean(times),
+            'median': statistics.median(times), 'per_item': min(times) / items if items else None}
+
+def map_arguments(details, number_of_players=3):
+    """The arguments Map is built with, with the territories dealt out between the players."""
+    players = {str(seat): Core.Player({'name': 'Player {0}'.format(seat), 'isturn': '0', 'active': '1', 'teamid': '-1',
+                                       'units': '0', 'profileid': '', 'id': str(seat)}) for seat in range(number_of_players)}
+    territories = details['_content']['map']['_content']['territory']
+    board_state = [{'id': territory['id'], 'playerid': str(index % number_of_players), 'units': '3'} for index, territory in enumerate(territories)]
+    return (territories, details['_content']['board']['_content']['border'], details['_content']['continents']['_content']['continent'],
+            board_state, players)
+
+def benchmark_map(name, details, repeat):
+    arguments = map_arguments(details)
+    def build():
+        for player in arguments[4].values():
+            player.territories = []
+        Core.Map(*arguments)
+    return result('map_construction', name, len(arguments[0]), measure(build, repeat))
+
+def benchmark_history(name, moves, repeat):
+    return result('process_history', name, len(moves), measure(lambda: History.process_history(moves), repeat))
+
+def benchmark_move_results(count, repeat):
+    """Process the attack result in json-examples count times on the example game."""
+    details = load_example('getDetails.json')
+    state = load_example('getState.json')
+    response = load_example('doMove-Attack2.json')
+    players = {player['id']: Core.Player(player) for player in state['_content']['players']['_content']['player']}
+    map = Core.Map(details['_content']['map']['_content']['territory'], details['_content']['board']['_content']['border'],
+                   details['_content']['continents']['_content']['continent'], state['_content']['board']['_content']['area'], players)
+    game = Core.Game('0', map, players, Core.Rules(details['_content']['rules']), None, '', [], Engine.EngineTransport({}))
+    #The example is an attack by player 1 on player 0.
+    from_territory = map.territories['1']
+    to_territory = next(iter(from_territory.attackable_neighbors.values()))
+    move = Moves.AttackMove(from_territory, to_territory, 3, True)
+    def process():
+        for _ in range(count):
+            from_territory.owner, from_territory.armies = players['1'], 20
+            to_territory.owner, to_territory.armies = players['0'], 10
+            players['0'].territories, players['1'].territories = [to_territory], [from_territory]
+            MoveResults.process_move_result(response, move, game)
+    return result('process_move_result', 'attack', count, measure(process, repeat))
+
+def benchmark_continent_utility(name, details, repeat):
+    """Time ContinentBot.calculate_continent_utility on a game dealt by the Engine on the map."""
+    engine = Engine.Engine.new_game(details, 3, 0)
+    bot = ContinentBot('benchmark', engine.current_player.name, 'seat={0}'.format(engine.current_player.id),
+                       transport=Engine.EngineTransport({'benchmark': engine}))
+    def calculate():
+        with contextlib.redirect_stdout(io.StringIO()):
+            bot.calculate_continent_utility()
+    return result('continent_utility', name, len(bot.game.map.continents), measure(calculate, repeat))
+
+def benchmark_distances(name, details, repeat):
+    """Time working out the DistanceTable of a map, without the tables already shared by other maps.
+    per_item is the time for each pair of territories and bytes the size of the tables."""
+    map = Core.Map(*map_arguments(details))
+    tables = []
+    times = measure(lambda: tables.append(Distances.DistanceTable(map)), repeat)
+    table = tables[-1]
+    benchmark_result = result('distance_table', name, table.size * table.size, times)
+    benchmark_result['bytes'] = sum(values.itemsize * len(values) for values in
+                                    (table.distances, table.next_hops, table.continent_distances, table.continent_next_hops))
+    return benchmark_result
+
+def benchmark_self_play(bot_class, games, repeat):
+    """Play games of three bot_class bots against each other on the example map with the Engine,
+    which answers their requests in the same process. per_item is the seconds a game takes and
+    games_per_minute the throughput of one core."""
+    details = load_example('getDetails.json')
+    def play():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in range(games):
+                Engine.play(Engine.Engine.new_game(details, 3, seed), {0: bot_class, 1: bot_class, 2: bot_class}, max_turns=SELF_PLAY_TURNS)
+    benchmark_result = result('self_play', bot_class.__name__, games, measure(play, repeat))
+    benchmark_result['games_per_minute'] = 60 / benchmark_result['per_item']
+    return benchmark_result
+
+def run(map_sizes=MAP_SIZES, log_sizes=LOG_SIZES, repeat=3, report=print, self_play_games=SELF_PLAY_GAMES,
+        distance_map_sizes=DISTANCE_MAP_SIZES):
+    results = []
+    def add(benchmark_result):
+        results.append(benchmark_result)
+        throughput = '  {0:.1f} games/min'.format(benchmark_result['games_per_minute']) if 'games_per_minute' in benchmark_result else ''
+        report('{name:<22}{size!s:>12}{min:>12.4f}s  {per_item}'.format(**benchmark_result) + throughput)
+
+    example_details = load_example('getDetails.json')
+    example_moves = load_example('getHistory.json')['_content']['movelog']['_content']['m']
+    add(benchmark_map('example', example_details, repeat))
+    for size in map_sizes:
+        add(benchmark_map(size, synthetic_details(size), repeat))
+    add(benchmark_history('example', example_moves, repeat))
+    for size in log_sizes:
+        add(benchmark_history(size, synthetic_log(size, 1000), repeat))
+    add(benchmark_move_results(1000, repeat))
+    add(benchmark_continent_utility('example', example_details, repeat))
+    for size in map_sizes:
+        add(benchmark_continent_utility(size, synthetic_details(size), repeat))
+    add(benchmark_distances('example', example_details, repeat))
+    for size in distance_map_sizes:
+        add(benchmark_distances(size, synthetic_details(size), repeat))
+    for bot_class in (RandomBot, ContinentBot):
+        add(benchmark_self_play(bot_class, self_play_games, repeat))
+    return results
+
+def compare(results, previous):
+    """Print how long each benchmark took against the same benchmark in an earlier run."""
+    earlier = {(entry['name'], str(entry['size'])): entry for entry in previous['results']}
+    for entry in results:
+        before = earlier.get((entry['name'], str(entry['size'])))
+        if before:
+            print('{0:<22}{1!s:>12}{2:>10.2f}x'.format(entry['name'], entry['size'], entry['min'] / before['min']))
+
+def version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Time pyFish on the examples and on generated maps and move logs.')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    parser.add_argument('--repeat', type=int, default=3, help='times to run each benchmark; the fastest is reported')
+    parser.add_argument('--quick', action='store_true', help='only run the smaller generated inputs')
+    arguments = parser.parse_args()
+    results = run(QUICK_MAP_SIZES if arguments.quick else MAP_SIZES, QUICK_LOG_SIZES if arguments.quick else LOG_SIZES, arguments.repeat,
+                  self_play_games=QUICK_SELF_PLAY_GAMES if arguments.quick else SELF_PLAY_GAMES,
+                  distance_map_sizes=QUICK_DISTANCE_MAP_SIZES if arguments.quick else DISTANCE_MAP_SIZES)
+    report = {'version': version(), 'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time(), 'results': results}
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=1)
+    if arguments.compare:
+        with open(arguments.compare, encoding='utf-8') as previous_file:
+            compare(results, json.load(previous_file))
+    return report
+
+if __name__ == "__main__":
+    main()
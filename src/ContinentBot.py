@@ -15,7 +15,9 @@
 #You should have received a copy of the GNU General Public License
 #along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 from pyFish import Core
+from pyFish import Odds
 from pyFish.Moves import *
 
 #You must provide values for the following variables
@@ -26,17 +28,23 @@ GAME_ID = '73888572'
 PLAYER_NAME = 'The Curmudgeon'
 #The cookie the bot will use to authenticate as PLAYER_NAME
 COOKIE = 'SESSID=21548ed928da03bb61bade292db94948; LAST=829925F678A3F7AB3A03F11EC9BCBB6800340380D4A4' 
+#The lowest chance of capturing a territory the bot will attack it with.
+ATTACK_ODDS = 0.5
+#Where the attack odds are saved, so a new process reads them instead of working them out again.
+#None keeps them in memory only, where they are still shared by every bot in the process.
+ODDS_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'odds-cache')
 
 """This bot attempts to capture continents."""
 class ContinentBot:
     
-    def __init__(self, game_id, player_name, cookie):
-        self.game = Core.initialize_game(game_id, cookie)
+    def __init__(self, game_id, player_name, cookie, transport=None):
+        self.game = Core.initialize_game(game_id, cookie, transport=transport)
         self.player = None
         for player_id, player in self.game.players.items():
             if(player.name == player_name):
                 self.player = player
                 break
+        self.odds = Odds.odds_for_rules(self.game.rules, cache_directory=ODDS_CACHE_DIRECTORY)
         
     def take_turn(self):
         continent_utilities = self.calculate_continent_utility()
@@ -82,7 +90,7 @@ class ContinentBot:
             if territory.owner == self.player:
                 for neighbor in territory.attackable_neighbors.values():
                     if neighbor.owner != self.player and neighbor in target_continent.territories.values():
-                        possible_territories[territory] = armies
+                        possible_territories[territory] = territory.armies
             for neighbor in territory.defendable_neighbors.values():
                 if neighbor.owner == self.player:
                     possible_territories[neighbor] = neighbor.armies
@@ -97,12 +105,17 @@ class ContinentBot:
         return self.game.execute_move(place_units_move)
     
     def find_attack_target(self, target_continent, attack_base):
-        """Find a neighbor of the territory we placed all the units on that is part of continent we want to take."""
-        if attack_base.armies > 3:
-            for neighbor in attack_base.attackable_neighbors.values():
-                if neighbor in target_continent.territories.values() and neighbor.owner != self.player:
-                    return neighbor
-        return None
+        """Find the neighbor of the territory we placed all the units on that is part of continent we want to take
+        and that we have the best chance of capturing. Nothing is attacked with odds below ATTACK_ODDS."""
+        attack_target = None
+        best_odds = ATTACK_ODDS
+        for neighbor in attack_base.attackable_neighbors.values():
+            if neighbor in target_continent.territories.values() and neighbor.owner != self.player:
+                odds = self.odds.win_probability(attack_base.armies - 1, neighbor.armies)
+                if odds >= best_odds:
+                    attack_target = neighbor
+                    best_odds = odds
+        return attack_target
     
     def attack(self, attack_target, attack_base):
         """Picks one of the attack_targets and attacks it continuously. It will also handle
@@ -121,46 +134,25 @@ class ContinentBot:
         This leans towards small, easy to defend territories and then weights them towards which ones you own the most of."""
         utilities = {}
         for continent in self.game.map.continents.values():
-            reachable = False
-            access_points = set()
-            neighbors = set()
-            border_territories = {}
-            territories_owned = 0
-            neutral_territories = 0
+            territories_owned = continent.owned_by(self.player)
             print(continent.name)
             print("    Bonus: {0}".format(continent.bonus))
             print("    Number of territories: {0}".format(len(continent.territories)))
-            for territory in continent.territories.values():
-                if territory.owner == self.player:
-                    territories_owned += 1
-                elif territory.owner == None:
-                    neutral_territories += 1
-                for neighbor in territory.defendable_neighbors.values():
-                    if neighbor not in continent.territories.values():
-                        border_territories.setdefault(territory, 0)
-                        border_territories[territory] = border_territories[territory] + 1
-                        access_points.add(territory)
-                        neighbors.add(neighbor)
-                    if neighbor.owner == self.player:
-                        reachable = True
-            print("    Total Access Points: {0}".format(len(access_points)))
-            print("    Total Neighbors: {0}".format(len(neighbors)))
-            
-            worst_neighbor_count = 0
-            for territory, number_of_outside_neighbors in border_territories.items():
-                if number_of_outside_neighbors > worst_neighbor_count:
-                    worst_neighbor_count = number_of_outside_neighbors
-            print("    Max outside neighbors: {0}".format(worst_neighbor_count))
+            print("    Total Access Points: {0}".format(len(continent.access_points)))
+            print("    Total Neighbors: {0}".format(len(continent.outside_neighbors)))
+            print("    Max outside neighbors: {0}".format(continent.worst_neighbor_count))
             print("    Territories owned: {0}".format(territories_owned))
             
             #If we own all of the territories set the utility to the smallest possible number. TODO: How to properly do this in Python?
             utility = -1000
-            if territories_owned != len(continent.territories) and reachable:
-                utility = continent.bonus - len(continent.territories) - len(access_points) - len(neighbors) - worst_neighbor_count + 2 * territories_owned + neutral_territories
+            if territories_owned != len(continent.territories) and continent.is_reachable_by(self.player):
+                utility = (continent.bonus - len(continent.territories) - len(continent.access_points) - len(continent.outside_neighbors)
+                           - continent.worst_neighbor_count + 2 * territories_owned + continent.owned_by(None))
             print("    Utility: {0}".format(utility))
             utilities[continent] = utility
         return utilities
                     
             
-bot = ContinentBot(GAME_ID, PLAYER_NAME, COOKIE)
-bot.take_turn()
\ No newline at end of file
+if __name__ == "__main__":
+    bot = ContinentBot(GAME_ID, PLAYER_NAME, COOKIE)
+    bot.take_turn()
@@ -15,9 +15,8 @@
 #You should have received a copy of the GNU General Public License
 #along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
 
-from pyFish import Core
 from pyFish.Moves import *
-from graph.base import Graph
+from pyFish.Graph import Graph
 from ContinentBot import ContinentBot
 
 #The id of the game the bot is to play. 
@@ -40,4 +39,4 @@ for neighbor in territory.attackable_neighbors.values():
 
 print 
 for edge in g.search_edges(start=territory):
-    print(edge.end.name.name)
\ No newline at end of file
+    print(edge.end.name)
\ No newline at end of file
@@ -0,0 +1,61 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+from pyFish import Core
+from pyFish import Planner
+from pyFish.Moves import *
+
+#You must provide values for the following variables
+
+#The id of the game the bot is to play. 
+GAME_ID = ''
+#The name of the player in the game the bot will be playing for.
+PLAYER_NAME = ''
+#The cookie the bot will use to authenticate as PLAYER_NAME
+COOKIE = '' 
+#The seconds the bot spends choosing its plan for a turn. Keep this well under the game's boot time.
+DECISION_TIME = 5.0
+#The processes plans are evaluated on, or None for one per core.
+PROCESSES = None
+
+#Shared by every bot in the process so the process pool is only started once.
+planner = Planner.Planner(PROCESSES, DECISION_TIME)
+
+"""This bot searches for the best plan for its whole turn before making any move."""
+class PlanningBot:
+    
+    def __init__(self, game_id, player_name, cookie, transport=None):
+        self.game = Core.initialize_game(game_id, cookie, transport=transport)
+        self.player = None
+        for player_id, player in self.game.players.items():
+            if(player.name == player_name):
+                self.player = player
+                break
+        
+    def take_turn(self):
+        """Execute a full turn."""
+        plan = planner.plan(self.game, self.player)
+        print('Plan: {0}'.format(plan))
+        Planner.execute_plan(self.game, plan)
+        if 'endturn' in self.game.possible_actions:
+            self.game.execute_move(Moves.EndTurnMove())
+        print("\r\nTurn Complete")
+            
+if __name__ == "__main__":
+    bot = PlanningBot(GAME_ID, PLAYER_NAME, COOKIE)
+    bot.take_turn()
+    planner.close()
@@ -32,8 +32,8 @@ COOKIE = ''
 It has no error handling."""
 class RandomBot:
     
-    def __init__(self, game_id, player_name, cookie):
-        self.game = Core.initialize_game(game_id, cookie)
+    def __init__(self, game_id, player_name, cookie, transport=None):
+        self.game = Core.initialize_game(game_id, cookie, transport=transport)
         self.player = None
         for player_id, player in self.game.players.items():
             if(player.name == player_name):
@@ -74,7 +74,7 @@ class RandomBot:
         territory_dict = {}
         while remaining_units > 0:
             for territory in self.player.territories:
-                territory_dict[territory] = 1
+                territory_dict[territory] = territory_dict.get(territory, 0) + 1
                 remaining_units -= 1
                 if remaining_units == 0:
                     break
@@ -107,5 +107,6 @@ class RandomBot:
                     free_transfer_move_result = self.game.execute_move(free_transfer_move) 
                 return attack_move_result
             
-bot = RandomBot(GAME_ID, PLAYER_NAME, COOKIE)
-bot.take_turn()
\ No newline at end of file
+if __name__ == "__main__":
+    bot = RandomBot(GAME_ID, PLAYER_NAME, COOKIE)
+    bot.take_turn()
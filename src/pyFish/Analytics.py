@@ -0,0 +1,255 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module adds up statistics for each player over many saved getHistory responses: how
+often their attacks capture, how lucky their dice were against what the dice rules lead to
+expect, the units they got from bonuses and cards, how long they took to move and the order
+they were eliminated in.
+
+The files are split into chunks that are read on a process pool. Each file is read a move at a
+time with a MoveLogReader, so no file is held in memory whole, and each worker adds up the
+files of a chunk before sending its totals back to be merged.
+
+    python -m pyFish.Analytics dumps/ --processes 8 --players players.json --csv totals.csv
+
+A move log only names players by seat, so by default a player is a seat. players.json can map
+the id of each game, the name of its file without the extension, to a dictionary of seat ids and
+player names, to add up each player over all of their games."""
+
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pyFish import Odds
+from pyFish.Moves import *
+
+#The seat id of neutral territories in a move log.
+NEUTRAL = '-1'
+#The actions a player makes themselves. The rest are made by the server, with the time of the move before.
+PLAYER_ACTIONS = frozenset('pafgu')
+#The number of files a worker reads before sending back its totals.
+FILES_PER_CHUNK = 64
+#The columns of the table, with the heading of each.
+TABLE_COLUMNS = (('player', 'Player'), ('games', 'Games'), ('wins', 'Wins'), ('attacks', 'Attacks'), ('captures', 'Captures'),
+                 ('capture_rate', 'Capture %'), ('attack_luck', 'Attack luck'), ('defence_luck', 'Defence luck'),
+                 ('bonus_units', 'Bonus units'), ('card_units', 'Card units'), ('mean_wait', 'Mean wait (s)'),
+                 ('eliminated', 'Eliminated'), ('mean_elimination', 'Mean elimination'))
+
+"""The totals for one player. Luck is in units: the losses dealt less the losses the dice rules
+lead to expect when attacking, and the expected losses less those taken when defending."""
+class PlayerTotals:
+
+    __slots__ = ('games', 'wins', 'attacks', 'attack_rolls', 'captures', 'defenders_killed', 'expected_defenders_killed',
+                 'defence_rolls', 'defenders_lost', 'expected_defenders_lost', 'bonus_units', 'card_units',
+                 'wait', 'waits', 'max_wait', 'eliminated', 'elimination_ranks')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def merge(self, other):
+        for name in self.__slots__:
+            if name == 'max_wait':
+                self.max_wait = max(self.max_wait, other.max_wait)
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def row(self, player):
+        return {'player': player,
+                'games': self.games,
+                'wins': self.wins,
+                'attacks': self.attacks,
+                'captures': self.captures,
+                'capture_rate': 100.0 * self.captures / self.attacks if self.attacks else None,
+                'attack_luck': self.defenders_killed - self.expected_defenders_killed,
+                'defence_luck': self.expected_defenders_lost - self.defenders_lost,
+                'bonus_units': self.bonus_units,
+                'card_units': self.card_units,
+                'mean_wait': self.wait / self.waits if self.waits else None,
+                'eliminated': self.eliminated,
+                'mean_elimination': self.elimination_ranks / self.eliminated if self.eliminated else None}
+
+def expected_defender_losses(attack_die_sides=6, defend_die_sides=6):
+    """The defending units each roll can be expected to kill, by the number of (attack, defend) dice."""
+    round_odds = Odds.odds_for_dice(attack_die_sides, defend_die_sides, max_units=1).round_odds
+    return {dice: min(dice) - sum(losses * chance for losses, chance in enumerate(odds)) for dice, odds in round_odds.items()}
+
+def analyze_moves(moves, totals, players=None, expected=None):
+    """Add the moves of one game, move dictionaries in the order they were made, to totals, a
+    dictionary of PlayerTotals by player. players maps seat ids to player names; seats not in it
+    are counted as 'seat N', and neutral territories as 'neutral'."""
+    expected = expected or expected_defender_losses()
+    players = players or {}
+    def totals_for(seat):
+        player = players.get(seat) or ('neutral' if seat == NEUTRAL else 'seat {0}'.format(seat))
+        player_totals = totals.get(player)
+        if player_totals is None:
+            player_totals = totals[player] = PlayerTotals()
+        return player_totals
+    last_seat = last_time = None
+    last_attack = None
+    eliminations = 0
+    for move in moves:
+        action = move['a']
+        seat = move.get('s')
+        time = int(move['t']) if 't' in move else None
+        if action in PLAYER_ACTIONS and seat is not None and seat != NEUTRAL and time is not None:
+            if seat != last_seat and last_seat is not None:
+                #The time the player took to make their first move after the last move of another player.
+                wait = time - last_time
+                player_totals = totals_for(seat)
+                player_totals.wait += wait
+                player_totals.waits += 1
+                player_totals.max_wait = max(player_totals.max_wait, wait)
+            last_seat, last_time = seat, time
+        if action == 'a':
+            attacker, defender = totals_for(seat), totals_for(move.get('ds'))
+            attack_dice = len([die for die in move.get('ad', '').split(',') if die])
+            defend_dice = len([die for die in move.get('dd', '').split(',') if die])
+            key = (seat, move.get('fcid'), move.get('tcid'))
+            #The rolls of one attack follow one another; a roll on a different border starts another.
+            if key != last_attack:
+                attacker.attacks += 1
+                last_attack = key
+            attacker.attack_rolls += 1
+            defender.defence_rolls += 1
+            killed = int(move.get('dl', 0))
+            attacker.defenders_killed += killed
+            defender.defenders_lost += killed
+            if attack_dice and defend_dice:
+                expected_killed = expected[min(attack_dice, Odds.MAX_ATTACK_DICE), min(defend_dice, Odds.MAX_DEFEND_DICE)]
+                attacker.expected_defenders_killed += expected_killed
+                defender.expected_defenders_lost += expected_killed
+            continue
+        last_attack = None
+        if action == 'c':
+            totals_for(seat).captures += 1
+        elif action == 'j':
+            totals_for(seat).games += 1
+        elif action == 'z':
+            totals_for(seat).bonus_units += int(move.get('num', 0))
+        elif action == 'u':
+            totals_for(seat).card_units += int(move.get('num', 0))
+        elif action == 'e':
+            eliminations += 1
+            player_totals = totals_for(move.get('es'))
+            player_totals.eliminated += 1
+            player_totals.elimination_ranks += eliminations
+        elif action == 'w':
+            totals_for(seat).wins += 1
+    return totals
+
+def analyze_file(path, totals, players=None, expected=None):
+    """Add the moves of a saved getHistory response to totals. Files ending in .gz are read
+    through gzip. The game id is the name of the file without its extensions."""
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as history_file:
+        return analyze_moves(History.MoveLogReader(history_file), totals, (players or {}).get(game_id(path)), expected)
+
+def game_id(path):
+    """The id of the game saved in a file, the name of the file without its extensions."""
+    return os.path.basename(path).split('.')[0]
+
+def _analyze_chunk(paths, players, die_sides):
+    totals = {}
+    expected = expected_defender_losses(*die_sides)
+    for path in paths:
+        analyze_file(path, totals, players, expected)
+    return totals
+
+def analyze(paths, processes=None, players=None, die_sides=(6, 6), files_per_chunk=FILES_PER_CHUNK):
+    """Add up the saved getHistory responses on a process pool and return a dictionary of
+    PlayerTotals by player. players maps game ids to dictionaries of seat ids and player names.
+    With processes=1 the files are read in this process. Each chunk is sent only the player names
+    of its own games."""
+    paths = list(paths)
+    players = players or {}
+    chunks = [paths[start:start + files_per_chunk] for start in range(0, len(paths), files_per_chunk)]
+    chunk_players = [{game_id(path): players[game_id(path)] for path in chunk if game_id(path) in players} for chunk in chunks]
+    totals = {}
+    if processes == 1 or len(chunks) <= 1:
+        results = (_analyze_chunk(chunk, names, die_sides) for chunk, names in zip(chunks, chunk_players))
+        return _merge(totals, results)
+    with ProcessPoolExecutor(processes) as executor:
+        return _merge(totals, executor.map(_analyze_chunk, chunks, chunk_players, [die_sides] * len(chunks)))
+
+def _merge(totals, results):
+    for partial in results:
+        for player, player_totals in partial.items():
+            if player in totals:
+                totals[player].merge(player_totals)
+            else:
+                totals[player] = player_totals
+    return totals
+
+def history_files(paths):
+    """The saved getHistory responses in the given files and directories, searching directories
+    for files ending in .json or .json.gz."""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(('.json', '.json.gz')):
+                        yield os.path.join(directory, name)
+        else:
+            yield path
+
+def table(totals):
+    """The rows of the table, one for each player, as dictionaries keyed by TABLE_COLUMNS."""
+    return [player_totals.row(player) for player, player_totals in sorted(totals.items())]
+
+def format_table(rows):
+    headings = [heading for _, heading in TABLE_COLUMNS]
+    lines = [[_format(row[name]) for name, _ in TABLE_COLUMNS] for row in rows]
+    widths = [max(len(cell) for cell in column) for column in zip(headings, *lines)]
+    return '\n'.join('  '.join(cell.rjust(width) if position else cell.ljust(width) for position, (cell, width) in enumerate(zip(line, widths)))
+                     for line in [headings] + lines)
+
+def _format(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{0:.2f}'.format(value)
+    return str(value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Add up statistics for each player over saved getHistory responses.')
+    parser.add_argument('paths', nargs='+', help='getHistory responses, or directories of them')
+    parser.add_argument('--processes', type=int, help='processes to read the files on; one per core by default')
+    parser.add_argument('--players', help='JSON file mapping game ids to dictionaries of seat ids and player names')
+    parser.add_argument('--die-sides', type=int, nargs=2, default=(6, 6), metavar=('ATTACK', 'DEFEND'))
+    parser.add_argument('--csv', help='file to write the table to as CSV, or - for standard output')
+    arguments = parser.parse_args()
+    players = None
+    if arguments.players:
+        with open(arguments.players, encoding='utf-8') as players_file:
+            players = json.load(players_file)
+    rows = table(analyze(history_files(arguments.paths), arguments.processes, players, tuple(arguments.die_sides)))
+    if arguments.csv:
+        with (open(arguments.csv, 'w', newline='', encoding='utf-8') if arguments.csv != '-' else contextlib.nullcontext(sys.stdout)) as csv_file:
+            writer = csv.DictWriter(csv_file, [name for name, _ in TABLE_COLUMNS])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        print(format_table(rows))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module keeps the move logs of many games in an archive on disk that can be searched
+without loading them. An archive is a directory of segment files. Each call to append writes one
+new segment holding the games given to it, and segments are never changed once written.
+
+A segment stores the columns of a MoveLog for all of its games one after another, a column
+giving the game of each row, and an index of the rows of each action. The segments are memory
+mapped and their columns read as NumPy arrays in place, so a query runs over the columns
+without a Python object being made for each move:
+
+    archive = Archive.HistoryArchive('archive')
+    archive.append([(game_id, board_id, History.process_history(moves))])
+    attacks = archive.query(History.AttackHistoryMove, map_id=board_id, attack_dice=3)
+    attacks.count(), attacks.column('attackers_lost').mean()
+
+The columns have the names and meaning of the MoveLog arrays. It requires NumPy.
+
+    python -m pyFish.Archive add archive --map 57 getHistory-*.json
+    python -m pyFish.Archive count archive --action a --attack-dice 3"""
+
+import argparse
+import glob
+import json
+import mmap
+import os
+import numpy
+from pyFish import Sections
+from pyFish.Odds import MAX_ATTACK_DICE, MAX_DEFEND_DICE
+from pyFish.Moves import *
+
+MAGIC = b'pyFishAr'
+VERSION = 1
+#The columns of a segment, with the section each is stored in and its type. The dice have a column for each die.
+COLUMNS = {'ids': (b'IDS ', numpy.int64, 1),
+           'timestamps': (b'TIME', numpy.int64, 1),
+           'actions': (b'ACTN', numpy.uint8, 1),
+           'player_ids': (b'PLYR', numpy.int32, 1),
+           'from_territories': (b'FROM', numpy.int32, 1),
+           'to_territories': (b'TO  ', numpy.int32, 1),
+           'units': (b'UNIT', numpy.int32, 1),
+           'attackers_lost': (b'ALST', numpy.int32, 1),
+           'defenders_lost': (b'DLST', numpy.int32, 1),
+           'other_player_ids': (b'OTHR', numpy.int32, 1),
+           'attack_dice': (b'ADCE', numpy.uint8, MAX_ATTACK_DICE),
+           'defend_dice': (b'DDCE', numpy.uint8, MAX_DEFEND_DICE),
+           #The position in the segment's game list of the game each row is from.
+           'games': (b'GAME', numpy.int32, 1)}
+
+"""An archive of move logs in a directory. Only one process should append to an archive at a
+time; any number can read it."""
+class HistoryArchive:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        #Segments that could not be closed yet, as arrays over them were still held. See close.
+        self.unclosed = []
+        #The segment each game is in and the position of the game in it, by game id.
+        self.game_index = {}
+        self.refresh()
+
+    def refresh(self):
+        """Open any segments appended since the archive was opened, including by other processes."""
+        opened = {segment.path for segment in self.segments}
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.segment'))):
+            if path not in opened:
+                segment = Segment(path)
+                self.segments.append(segment)
+                for position, game in enumerate(segment.games):
+                    self.game_index[game['id']] = (segment, position)
+
+    def append(self, games):
+        """Add games to the archive as a new segment. games is a list of (game id, map id, moves),
+        where moves is a MoveLog or a list of move dictionaries from getHistory. The map id is
+        whatever the games should be found by, such as the board id. A game already in the archive
+        raises a ValueError, since archived games are never changed."""
+        logs = []
+        for game_id, map_id, moves in games:
+            game_id = str(game_id)
+            if game_id in self.game_index or game_id in (log[0] for log in logs):
+                raise ValueError('Game {0} is already archived.'.format(game_id))
+            logs.append((game_id, map_id, moves if isinstance(moves, History.MoveLog) else History.process_history(moves)))
+        if not logs:
+            return
+        number = int(os.path.basename(self.segments[-1].path).split('.')[0]) + 1 if self.segments else 0
+        Segment.write(os.path.join(self.directory, '{0:08d}.segment'.format(number)), logs)
+        self.refresh()
+
+    def games(self, map_id=None):
+        """The ids of the archived games, or only those on the map."""
+        return [game_id for game_id, (segment, position) in self.game_index.items()
+                if map_id is None or segment.games[position]['map'] == map_id]
+
+    def move_log(self, game_id):
+        """The MoveLog of an archived game."""
+        segment, position = self.game_index[str(game_id)]
+        return segment.move_log(position)
+
+    def query(self, action=None, game_ids=None, map_id=None, player_id=None, attack_dice=None, defend_dice=None):
+        """Select the archived moves that match every condition given and return a Selection.
+        action is an action code such as 'a' or a HistoryMove class such as AttackHistoryMove, or
+        a list of them. A class stands for itself and all of its subclasses, so HistoryMove selects
+        every move. attack_dice and defend_dice are the number of dice rolled. An action that is not
+        known raises a ValueError."""
+        actions = _action_codes(action if isinstance(action, (list, tuple, set)) else [action]) if action is not None else None
+        game_ids = {str(game_id) for game_id in game_ids} if game_ids is not None else None
+        parts = []
+        for segment in self.segments:
+            games = [position for position, game in enumerate(segment.games)
+                     if (game_ids is None or game['id'] in game_ids) and (map_id is None or game['map'] == map_id)]
+            if not games:
+                continue
+            rows = segment.rows(actions, games if len(games) < len(segment.games) else None)
+            if player_id is not None:
+                rows = rows[segment.column('player_ids')[rows] == player_id]
+            if attack_dice is not None:
+                rows = rows[numpy.count_nonzero(segment.column('attack_dice')[rows], axis=1) == attack_dice]
+            if defend_dice is not None:
+                rows = rows[numpy.count_nonzero(segment.column('defend_dice')[rows], axis=1) == defend_dice]
+            if len(rows):
+                parts.append((segment, rows))
+        return Selection(parts)
+
+    def close(self):
+        """Close the segments. A segment with a column from Segment.column still held elsewhere can not
+        be closed yet; it is kept in unclosed and tried again the next time the archive is closed."""
+        self.unclosed = [segment for segment in self.unclosed + self.segments if not segment.close()]
+        self.segments = []
+        self.game_index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+"""One segment file of an archive, mapped into memory."""
+class Segment:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as segment_file:
+            self._map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.table = Sections.read_table(self._map, MAGIC, VERSION)
+        if self.table is None:
+            self._map.close()
+            raise ValueError('{0} is not a segment of this version of the archive.'.format(path))
+        meta = json.loads(self._section(b'META'))
+        #The id, map, first row and number of rows of each game.
+        self.games = meta['games']
+        self.extras = meta['extras']
+        self.rows_count = meta['rows']
+        self._columns = {}
+        #The rows of the segment ordered by action, with where the rows of each action code start.
+        self.action_rows = self._array(b'AROW', numpy.int64, 1, self.rows_count)
+        self.action_offsets = self._array(b'AOFF', numpy.int64, 1, 257)
+
+    @staticmethod
+    def write(path, logs):
+        """Write the (game id, map id, MoveLog) logs as a segment."""
+        games = []
+        extras = {}
+        start = 0
+        for game_id, map_id, log in logs:
+            games.append({'id': game_id, 'map': map_id, 'start': start, 'rows': len(log)})
+            extras.update({str(start + row): values for row, values in log.extras.items()})
+            start += len(log)
+        sections = [(b'META', json.dumps({'games': games, 'extras': extras, 'rows': start}, separators=(',', ':')).encode())]
+        for name, (section, dtype, width) in COLUMNS.items():
+            if name == 'games':
+                data = numpy.repeat(numpy.arange(len(logs), dtype=dtype), [len(log) for _, _, log in logs]).tobytes()
+            else:
+                data = b''.join(bytes(getattr(log, name)) for _, _, log in logs)
+            sections.append((section, data))
+        actions = numpy.frombuffer(b''.join(bytes(log.actions) for _, _, log in logs), dtype=numpy.uint8)
+        action_rows = numpy.argsort(actions, kind='stable').astype(numpy.int64)
+        action_offsets = numpy.zeros(257, dtype=numpy.int64)
+        action_offsets[1:] = numpy.cumsum(numpy.bincount(actions, minlength=256))
+        sections += [(b'AROW', action_rows.tobytes()), (b'AOFF', action_offsets.tobytes())]
+        Sections.write(path, MAGIC, VERSION, sections)
+
+    def _section(self, name):
+        offset, length = self.table[name]
+        return self._map[offset:offset + length]
+
+    def _array(self, name, dtype, width, rows):
+        offset, length = self.table[name]
+        values = numpy.frombuffer(self._map, dtype=dtype, count=rows * width, offset=offset)
+        return values.reshape(rows, width) if width > 1 else values
+
+    def column(self, name):
+        """A column of the segment as a read only array over the file, with a row for each move. The
+        segment can not be closed while the array is held, so copy it to keep it longer."""
+        values = self._columns.get(name)
+        if values is None:
+            section, dtype, width = COLUMNS[name]
+            values = self._columns[name] = self._array(section, dtype, width, self.rows_count)
+        return values
+
+    def rows(self, actions=None, games=None):
+        """The rows of moves with any of the action codes, of the games at the given positions,
+        in the order they were made. Either can be None to take every one."""
+        if actions is None:
+            rows = numpy.arange(self.rows_count, dtype=numpy.int64)
+        else:
+            rows = numpy.sort(numpy.concatenate([self.action_rows[self.action_offsets[ord(action)]:self.action_offsets[ord(action) + 1]]
+                                                 for action in actions] or [numpy.zeros(0, dtype=numpy.int64)]))
+        if games is not None:
+            rows = rows[numpy.isin(self.column('games')[rows], games)]
+        return rows
+
+    def move_log(self, position):
+        game = self.games[position]
+        start, end = game['start'], game['start'] + game['rows']
+        log = History.MoveLog()
+        for name in COLUMNS:
+            if name != 'games':
+                values = getattr(log, name)
+                data = self.column(name)[start:end].tobytes()
+                if isinstance(values, bytearray):
+                    values.extend(data)
+                else:
+                    values.frombytes(data)
+        log.extras = {int(row) - start: values for row, values in self.extras.items() if start <= int(row) < end}
+        return log
+
+    def close(self):
+        """Close the map of the file and return whether it could be. It can not while an array from
+        column is still held elsewhere."""
+        #The arrays over the map have to go before it can be closed.
+        self._columns = {}
+        self.action_rows = self.action_offsets = None
+        try:
+            self._map.close()
+        except BufferError:
+            return False
+        return True
+
+"""The moves a query selected, as the rows of each segment they are in."""
+class Selection:
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def count(self):
+        return sum(len(rows) for _, rows in self.parts)
+
+    def column(self, name):
+        """The values of a column for the selected moves, in one array. It is a copy, so it can be kept
+        after the archive is closed."""
+        arrays = [segment.column(name)[rows] for segment, rows in self.parts]
+        if not arrays:
+            section, dtype, width = COLUMNS[name]
+            return numpy.zeros((0, width) if width > 1 else 0, dtype=dtype)
+        return numpy.concatenate(arrays)
+
+    def game_ids(self):
+        """The id of the game of each selected move."""
+        ids = [numpy.array([game['id'] for game in segment.games], dtype=object)[segment.column('games')[rows]] for segment, rows in self.parts]
+        return numpy.concatenate(ids) if ids else numpy.zeros(0, dtype=object)
+
+    def moves(self):
+        """Yield a HistoryMove for each selected move. Unlike the rest of a Selection this makes
+        an object for every move, so it is best kept to small selections."""
+        for segment, rows in self.parts:
+            positions = segment.column('games')[rows]
+            log, log_position = None, None
+            for row, position in zip(rows.tolist(), positions.tolist()):
+                #Rows are in order, so the moves of a game come together and its MoveLog is built once.
+                if position != log_position:
+                    log, log_position = segment.move_log(position), position
+                yield log[row - segment.games[position]['start']]
+
+    def __len__(self):
+        return self.count()
+
+def _action_codes(actions):
+    """The action codes of a list of codes and HistoryMove classes."""
+    codes = set()
+    for action in actions:
+        if isinstance(action, type):
+            matching = [code for code, constructor in History.history_constructors.items() if issubclass(constructor, action)]
+        else:
+            matching = [action] if action in History.history_constructors else []
+        if not matching:
+            raise ValueError('unknown action {0!r}'.format(action))
+        codes.update(matching)
+    return sorted(codes)
+
+def _load_dump(path):
+    with open(path, 'rb') as dump_file:
+        return History.MoveLog(History.MoveLogReader(dump_file))
+
+def main():
+    parser = argparse.ArgumentParser(description='Add getHistory dumps to a history archive, or count the moves in one.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='archive getHistory responses saved as files named after their game id')
+    add.add_argument('archive')
+    add.add_argument('--map', required=True, help='id of the map the games were played on')
+    add.add_argument('dumps', nargs='+')
+    count = commands.add_parser('count', help='count the archived moves that match')
+    count.add_argument('archive')
+    count.add_argument('--action')
+    count.add_argument('--map')
+    count.add_argument('--player', type=int)
+    count.add_argument('--attack-dice', type=int)
+    count.add_argument('--defend-dice', type=int)
+    arguments = parser.parse_args()
+    with HistoryArchive(arguments.archive) as archive:
+        if arguments.command == 'add':
+            archive.append([(os.path.splitext(os.path.basename(path))[0], arguments.map, _load_dump(path)) for path in arguments.dumps])
+        else:
+            print(archive.query(arguments.action, map_id=arguments.map, player_id=arguments.player,
+                                attack_dice=arguments.attack_dice, defend_dice=arguments.defend_dice).count())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module stores a board in NumPy arrays so bots can evaluate many positions at once.
+Territories are numbered by Territory.index and players by Player.id, with -1 for neutral."""
+
+import numpy
+
+NEUTRAL = -1
+
+"""An array view of a Map. owners and armies hold the current state of each territory. The
+borders are stored in compressed sparse row form: the territories territory i can attack are
+attack_targets[attack_offsets[i]:attack_offsets[i + 1]], and the territories that can attack
+territory i are defend_sources[defend_offsets[i]:defend_offsets[i + 1]]. Continents are stored
+the same way in continent_offsets and continent_members."""
+class CompactBoard:
+
+    def __init__(self, map):
+        territories = sorted(map.territories.values(), key=lambda territory: territory.index)
+        self.territory_ids = [territory.id for territory in territories]
+        self.owners = numpy.array([_owner_id(territory.owner) for territory in territories], dtype=numpy.int32)
+        self.armies = numpy.array([territory.armies for territory in territories], dtype=numpy.int32)
+        self.attack_offsets, self.attack_targets = _csr([territory.attackable_neighbors.values() for territory in territories])
+        self.defend_offsets, self.defend_sources = _csr([territory.defendable_neighbors.values() for territory in territories])
+
+        continents = list(map.continents.values())
+        self.continent_ids = [continent.id for continent in continents]
+        self.continent_bonuses = numpy.array([continent.bonus for continent in continents], dtype=numpy.int32)
+        self.continent_offsets, self.continent_members = _csr([continent.territories.values() for continent in continents])
+        #Warfish allows continents to overlap. continent_of holds the first continent a territory is in, or -1.
+        self.continent_of = numpy.full(len(territories), -1, dtype=numpy.int32)
+        for continent_index in reversed(range(len(continents))):
+            self.continent_of[self.continent_members[self.continent_offsets[continent_index]:self.continent_offsets[continent_index + 1]]] = continent_index
+
+    def territory_changed(self, territory, previous_owner, previous_armies):
+        self.owners[territory.index] = _owner_id(territory.owner)
+        self.armies[territory.index] = territory.armies
+
+    def attackable(self, index):
+        """Indices of the territories the territory can attack."""
+        return self.attack_targets[self.attack_offsets[index]:self.attack_offsets[index + 1]]
+
+    def defendable(self, index):
+        """Indices of the territories that can attack the territory."""
+        return self.defend_sources[self.defend_offsets[index]:self.defend_offsets[index + 1]]
+
+    def owned_by(self, player_id, owners=None):
+        """A boolean array of the territories the player owns. owners defaults to the current board."""
+        return (self.owners if owners is None else owners) == player_id
+
+    def continents_held(self, player_id, owners=None):
+        """A boolean array of the continents the player owns completely."""
+        owned = self.owned_by(player_id, owners)[self.continent_members]
+        sizes = numpy.diff(self.continent_offsets)
+        member_continents = numpy.repeat(numpy.arange(len(sizes)), sizes)
+        counts = numpy.bincount(member_continents, weights=owned, minlength=len(sizes))
+        return (sizes > 0) & (counts == sizes)
+
+    def attack_edges(self, player_id, owners=None):
+        """Two arrays of the same length giving every border the player can attack across: the
+        territory attacked from and the territory attacked."""
+        owners = self.owners if owners is None else owners
+        sources = numpy.repeat(numpy.arange(len(self.territory_ids), dtype=numpy.int32), numpy.diff(self.attack_offsets))
+        mask = (owners[sources] == player_id) & (owners[self.attack_targets] != player_id)
+        return sources[mask], self.attack_targets[mask]
+
+    def copy_state(self):
+        """Copies of the owners and armies arrays that can be changed without touching the board."""
+        return self.owners.copy(), self.armies.copy()
+
+def _owner_id(owner):
+    return NEUTRAL if owner is None else owner.id
+
+def _csr(neighbor_lists):
+    offsets = numpy.zeros(len(neighbor_lists) + 1, dtype=numpy.int32)
+    indices = []
+    for position, neighbors in enumerate(neighbor_lists):
+        indices.extend(neighbor.index for neighbor in neighbors)
+        offsets[position + 1] = len(indices)
+    return offsets, numpy.array(indices, dtype=numpy.int32)
@@ -0,0 +1,218 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module keeps local copies of Warfish data so that bots do not have to download
+it again every time they are started."""
+
+import json
+import os
+from pyFish import Sections
+from pyFish.Moves import History
+
+MAGIC = b'pyFishHC'
+VERSION = 1
+#The MoveLog arrays in the order they are saved.
+_HISTORY_COLUMNS = ('ids', 'timestamps', 'actions', 'player_ids', 'from_territories', 'to_territories', 'units',
+                    'attackers_lost', 'defenders_lost', 'other_player_ids', 'attack_dice', 'defend_dice')
+#The size in bytes the journal of new moves can grow to before the whole log is saved as arrays again.
+MAX_JOURNAL_SIZE = 1024 * 1024
+
+"""Stores the move log of each game on disk. The moves are kept as the arrays of a MoveLog, in a
+file of sections as written by the Sections module, so a long log is loaded without parsing
+every move again. New moves are appended to a journal of one move per line beside it, and once
+the journal grows past MAX_JOURNAL_SIZE the whole log is saved as arrays and the journal emptied.
+A cache left by an earlier version, which kept every move in the journal, is read the same way."""
+class HistoryCache:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, game_id):
+        return os.path.join(self.directory, '{0}.moves'.format(game_id))
+
+    def journal_path(self, game_id):
+        return os.path.join(self.directory, '{0}.history'.format(game_id))
+
+    def load(self, game_id):
+        """Return the MoveLog stored for the game. The files are only opened for writing when the
+        last move of the journal was only partially written and has to be cut off, so a cache
+        that can not be written to is still loaded."""
+        log = self._read_moves(game_id)
+        if log is None:
+            #The arrays can not be read, so the journal after them is no use either. Both are downloaded again.
+            try:
+                self.clear(game_id)
+            except OSError:
+                pass
+            return History.MoveLog()
+        last_id = log.ids[-1] if len(log) else -1
+        try:
+            with open(self.journal_path(game_id), 'rb') as journal_file:
+                lines = journal_file.read().split(b'\n')
+        except FileNotFoundError:
+            return log
+        if lines[-1]:
+            #The last move was only partially written. Drop it so it is downloaded again.
+            valid_length = sum(len(line) + 1 for line in lines[:-1])
+            try:
+                with open(self.journal_path(game_id), 'rb+') as journal_file:
+                    journal_file.truncate(valid_length)
+            except OSError:
+                pass
+        moves = (json.loads(line) for line in lines[:-1])
+        #The journal may still hold moves already saved as arrays if saving them was interrupted.
+        log.extend(move for move in moves if int(move['id']) > last_id)
+        return log
+
+    def append(self, game_id, moves, log=None):
+        """Add moves to the end of the game's stored move log. When log, the whole MoveLog the moves
+        were added to, is given and the journal has grown past MAX_JOURNAL_SIZE, the log is saved
+        as arrays instead."""
+        if not moves:
+            return
+        with open(self.journal_path(game_id), 'a', encoding='utf-8') as journal_file:
+            journal_file.write(''.join(json.dumps(move, separators=(',', ':')) + '\n' for move in moves))
+            journal_size = journal_file.tell()
+        if log is not None and journal_size > MAX_JOURNAL_SIZE:
+            self.save(game_id, log)
+
+    def save(self, game_id, log):
+        """Replace the game's stored move log with the MoveLog and empty the journal."""
+        sections = [(b'XTRA', json.dumps({str(row): extras for row, extras in log.extras.items()}, separators=(',', ':')).encode())]
+        sections += [('H{0:03d}'.format(number).encode(), bytes(getattr(log, column))) for number, column in enumerate(_HISTORY_COLUMNS)]
+        Sections.write(self.path(game_id), MAGIC, VERSION, sections)
+        self._remove(self.journal_path(game_id))
+
+    def clear(self, game_id):
+        self._remove(self.path(game_id))
+        self._remove(self.journal_path(game_id))
+
+    def _read_moves(self, game_id):
+        """The MoveLog saved as arrays, empty if none has been saved, or None if the file can not be read."""
+        log = History.MoveLog()
+        try:
+            with open(self.path(game_id), 'rb') as moves_file:
+                view = memoryview(moves_file.read())
+        except FileNotFoundError:
+            return log
+        table = Sections.read_table(view, MAGIC, VERSION)
+        if table is None:
+            return None
+        try:
+            for number, column in enumerate(_HISTORY_COLUMNS):
+                offset, length = table['H{0:03d}'.format(number).encode()]
+                values = getattr(log, column)
+                #The dice are kept in bytearrays and the rest in arrays.
+                if isinstance(values, bytearray):
+                    values.extend(view[offset:offset + length])
+                else:
+                    values.frombytes(view[offset:offset + length])
+            offset, length = table[b'XTRA']
+            log.extras = {int(row): extras for row, extras in json.loads(bytes(view[offset:offset + length])).items()}
+        except (KeyError, ValueError):
+            return None
+        rows = len(log)
+        if (any(len(getattr(log, column)) != rows for column in _HISTORY_COLUMNS[:-2])
+                or len(log.attack_dice) != rows * History.MAX_ATTACK_DICE or len(log.defend_dice) != rows * History.MAX_DEFEND_DICE):
+            return None
+        return log
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+"""Stores the parts of getDetails that never change during a game: the territories, borders and
+continents of the map and the rules of the game. Maps are stored once per board so that every
+game played on the same map shares them. Map.distances keeps the hop distances of each map in
+the same directory. When the files take up more than max_size bytes the least recently used
+ones are removed."""
+class MapCache:
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def game_path(self, game_id):
+        return os.path.join(self.directory, '{0}.game'.format(game_id))
+
+    def map_path(self, board_id):
+        return os.path.join(self.directory, '{0}.map'.format(board_id))
+
+    def load(self, game_id):
+        """Return the cached details of the game in the same form as the getDetails response,
+        or None if they are not cached."""
+        game = self._read(self.game_path(game_id))
+        if game is None:
+            return None
+        board = self._read(self.map_path(game['boardid']))
+        if board is None:
+            return None
+        return {'_content': {'rules': game['rules'],
+                             'board': {'boardid': game['boardid'], '_content': {'border': board['border']}},
+                             'map': {'_content': {'territory': board['territory']}},
+                             'continents': {'_content': {'continent': board['continent']}}}}
+
+    def save(self, game_id, details):
+        """Store a getDetails response that includes the board, rules, map and continents sections."""
+        content = details['_content']
+        board_id = content['board']['boardid']
+        if not os.path.exists(self.map_path(board_id)):
+            self._write(self.map_path(board_id), {'border': content['board']['_content']['border'],
+                                                  'territory': content['map']['_content']['territory'],
+                                                  'continent': content['continents']['_content']['continent']})
+        self._write(self.game_path(game_id), {'boardid': board_id, 'rules': content['rules']})
+        self._evict()
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as cache_file:
+                value = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        #Loading a file marks it as recently used.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _write(self, path, value):
+        #Write to a temporary file first so a reader never sees a partial file.
+        temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(value, cache_file, separators=(',', ':'))
+        os.replace(temporary_path, path)
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.game', '.map', '.distances')):
+                status = entry.stat()
+                entries.append((status.st_mtime, status.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -16,9 +16,12 @@
 #along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
-import urllib.request
-from graph.base import Graph
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pyFish.Moves import *
+from pyFish import Distances, Metrics, Transport, Zobrist
+from pyFish.Graph import ReadOnlyGraph
 
 WARFISH_URL = 'http://216.169.106.90/war/services/rest'
 #WARFISH_URL = 'http://warfish.net/war/services/rest'
@@ -26,50 +29,198 @@ WARFISH_METHODS = {'details': 'warfish.tables.getDetails',
                    'state': 'warfish.tables.getState',
                    'history': 'warfish.tables.getHistory',
                    'doMove': 'warfish.tables.doMove'}
+#The number of moves requested in each call to getHistory.
+HISTORY_PAGE_SIZE = 1500
 NONE, LIGHT, MODERATE, FOGGY, VERY, EXTREME = range(6) 
 TURN_BASED, AUTO, BLIND_AT_ONCE = range(3)
 
-def initialize_game(game_id, cookie):
-    """Pulls down all of the game information from Warfish and creates a Game object."""
+logger = logging.getLogger(__name__)
+
+"""Raised when Warfish answers a request with a failure, such as a move that is not allowed."""
+class WarfishError(Exception):
+    
+    def __init__(self, code, message):
+        super().__init__('{0} (code {1})'.format(message, code))
+        self.code = code
+        self.message = message
+
+def check_response(response):
+    """Raise a WarfishError if a decoded Warfish response is a failure, otherwise return it."""
+    if response.get('stat') != 'ok':
+        error = response.get('err', {})
+        raise WarfishError(error.get('code'), error.get('msg', 'The request failed.'))
+    return response
+
+def initialize_game(game_id, cookie, history_cache=None, concurrent=False, transport=None, map_cache=None):
+    """Pulls down all of the game information from Warfish and creates a Game object.
+    If a HistoryCache is given only the moves made since the last time the game was
+    initialized are downloaded. With concurrent set the getDetails, getState and getHistory
+    requests are sent at the same time and each response is processed as soon as it arrives.
+    The transport is used for every request the game makes, including its moves. If a MapCache
+    is given and already holds the game's details getDetails is not requested."""
     
-    details = request_game_info(WARFISH_METHODS['details'], game_id, cookie, sections=('board', 'rules', 'map', 'continents'))
-    state = request_game_info(WARFISH_METHODS['state'], game_id, cookie, sections=('players', 'board', 'possibleactions'))
-    #TODO: Right now this assumes their are no more than 1500 moves. This is incorrect and needs fixed at some point.
-    history = request_game_info(WARFISH_METHODS['history'], game_id, cookie, additional_parameters={'start': '-1', 'num': '1500'})
+    requests = {'details': lambda: request_game_info(WARFISH_METHODS['details'], game_id, cookie, sections=('board', 'rules', 'map', 'continents'), transport=transport),
+                'state': lambda: request_game_info(WARFISH_METHODS['state'], game_id, cookie, sections=('players', 'board', 'possibleactions'), transport=transport),
+                'history': lambda: sync_history(game_id, cookie, history_cache, transport=transport)}
+    responses = {}
+    parts = {}
+    details = map_cache.load(game_id) if map_cache else None
+    if details:
+        del requests['details']
+        responses['details'] = details
+        _process_game_info('details', responses, parts)
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            futures = {executor.submit(request): name for name, request in requests.items()}
+            for future in as_completed(futures):
+                responses[futures[future]] = future.result()
+                _process_game_info(futures[future], responses, parts)
+    else:
+        for name, request in requests.items():
+            responses[name] = request()
+            _process_game_info(name, responses, parts)
+    if map_cache:
+        if not details:
+            map_cache.save(game_id, responses['details'])
+        parts['map'].distance_cache_directory = map_cache.directory
     
-    players = {player_info['id'] : Player(player_info) for player_info in state['_content']['players']['_content']['player']}
-    map = Map(details['_content']['map']['_content']['territory'], 
-              details['_content']['board']['_content']['border'],
-              details['_content']['continents']['_content']['continent'],
-              state['_content']['board']['_content']['area'],
-              players)
-    rules = Rules(details['_content']['rules'])  
-    history = History.process_history(history['_content']['movelog']['_content']['m'])
-    possible_actions = []
-    if '_content' in state['_content']['possibleactions']:
-        for action in state['_content']['possibleactions']['_content']['action']:
-            possible_actions.append(action['id'])
+    return Game(game_id, parts['map'], parts['players'], parts['rules'], parts['history'], cookie, parts['possible_actions'], transport, parts['lastmod'])
+
+def _process_game_info(name, responses, parts):
+    """Build the parts of a game that depend on the response that just arrived. The map is built once
+    both the details and the state have been received."""
     
-    return Game(game_id, map, players, rules, history, cookie, possible_actions)
+    if name == 'details':
+        parts['rules'] = Rules(responses['details']['_content']['rules'])
+    elif name == 'state':
+        state = responses['state']
+        parts['players'] = {player_info['id'] : Player(player_info) for player_info in state['_content']['players']['_content']['player']}
+        parts['possible_actions'] = _possible_actions(state['_content']['possibleactions'])
+        parts['lastmod'] = state['_content']['possibleactions'].get('lastmod')
+    elif name == 'history':
+        parts['history'] = History.process_history(responses['history'])
+    if name in ('details', 'state') and 'details' in responses and 'state' in responses:
+        details = responses['details']
+        parts['map'] = Map(details['_content']['map']['_content']['territory'], 
+                           details['_content']['board']['_content']['border'],
+                           details['_content']['continents']['_content']['continent'],
+                           responses['state']['_content']['board']['_content']['area'],
+                           parts['players'])
+
+def _possible_actions(possible_actions_dictionary):
+    if '_content' not in possible_actions_dictionary:
+        return []
+    return [action['id'] for action in possible_actions_dictionary['_content']['action']]
 
-def request_game_info(method, game_id, cookie, sections=None, additional_parameters=None):
-    """Make a request to Warfish and return the results as a dictionary."""
+def request_game_info(method, game_id, cookie, sections=None, additional_parameters=None, transport=None):
+    """Make a request to Warfish and return the results as a dictionary. The shared default
+    transport is used unless another is given."""
     
+    url = _game_info_url(method, game_id, sections, additional_parameters)
+    response, timing = _send(method, url, cookie, transport or Transport.default_transport)
+    Metrics.default_registry.record(method, *timing)
+    return response
+
+def _send(method, url, cookie, transport):
+    """Make a request and decode the response. Returns the response and the seconds the request
+    took, the size of the body and the seconds it took to decode. Failures are recorded in the
+    metrics and raised."""
+    started = time.perf_counter()
+    try:
+        if hasattr(transport, 'request'):
+            #The response is already a dictionary, so there is no body to measure or decode.
+            response = transport.request(url, {'Cookie': cookie})
+        else:
+            body = transport.get(url, {'Cookie': cookie})
+    except Exception as error:
+        Metrics.default_registry.record(method, time.perf_counter() - started, error=type(error).__name__)
+        raise
+    received = time.perf_counter()
+    if hasattr(transport, 'request'):
+        timing = (received - started, None, None)
+    else:
+        response = json.loads(bytes.decode(body))
+        timing = (received - started, len(body), time.perf_counter() - received)
+    if response.get('stat') != 'ok':
+        Metrics.default_registry.record(method, *timing, error=response.get('err', {}).get('code'))
+    return check_response(response), timing
+
+def open_game_info(method, game_id, cookie, sections=None, additional_parameters=None, transport=None):
+    """Make a request to Warfish and return a context manager giving the body of the response as a
+    binary file, read as it arrives when the transport supports it."""
+    
+    url = _game_info_url(method, game_id, sections, additional_parameters)
+    return Transport.open_url(transport or Transport.default_transport, url, {'Cookie': cookie})
+
+def _game_info_url(method, game_id, sections=None, additional_parameters=None):
     url = '{0}?_method={1}&gid={2}&_format=json'.format(WARFISH_URL, method, game_id)
     if sections:
         url += '&sections={0}'.format(','.join(sections))
     if additional_parameters:
         url += ''.join(['&%s=%s' % item for item in additional_parameters.items()])
-    request = urllib.request.Request(url, None, {'Cookie': cookie} )
-    response = urllib.request.urlopen(request)
-    return json.loads(bytes.decode(response.read()))
+    return url
+
+def sync_history(game_id, cookie, history_cache=None, page_size=HISTORY_PAGE_SIZE, transport=None, start=0):
+    """Return the list of move dictionaries for the game, oldest first. The move log is requested
+    a page at a time until the total reported by Warfish has been reached. When a HistoryCache
+    is given only the moves after the last one it holds are requested, they are added to it and
+    the MoveLog it holds is returned with them. Without one the moves from the move id start are
+    returned."""
+    
+    log = history_cache.load(game_id) if history_cache else None
+    new_moves = []
+    start = log.ids[-1] + 1 if log else start
+    while True:
+        response = request_game_info(WARFISH_METHODS['history'], game_id, cookie, additional_parameters={'start': start, 'num': page_size}, transport=transport)
+        movelog = response['_content']['movelog']
+        page = movelog['_content']['m'] if '_content' in movelog else []
+        new_moves.extend(page)
+        if len(page) == 0 or int(page[-1]['id']) + 1 >= int(movelog['total']):
+            break
+        start = int(page[-1]['id']) + 1
+    if history_cache:
+        log.extend(new_moves)
+        history_cache.append(game_id, new_moves, log)
+        return log
+    return new_moves
+
+def stream_history(game_id, cookie, start=0, page_size=HISTORY_PAGE_SIZE, transport=None):
+    """Yield the moves of the game as HistoryMove objects, oldest first, from the move with the id
+    start. Each page of getHistory is decoded a move at a time as it is read, so the first moves
+    are given before the rest have arrived and a caller can stop early without the whole log
+    being downloaded or held in memory. A page that does not give the total number of moves
+    raises a ValueError, as there is no telling whether the log goes on after it."""
+    
+    while True:
+        last_id = None
+        started = time.perf_counter()
+        with open_game_info(WARFISH_METHODS['history'], game_id, cookie, additional_parameters={'start': start, 'num': page_size}, transport=transport) as stream:
+            reader = History.MoveLogReader(stream)
+            for move_dictionary in reader:
+                last_id = int(move_dictionary['id'])
+                move = History.HistoryMove.from_dictionary(move_dictionary)
+                if move is not None:
+                    yield move
+            if reader.response is not None:
+                check_response(reader.response)
+        #The time to read and decode the whole page, not counting the time the caller spent on each move.
+        Metrics.default_registry.record(WARFISH_METHODS['history'], time.perf_counter() - started)
+        if last_id is None:
+            return
+        if reader.total is None:
+            raise ValueError('The getHistory response does not give the total number of moves.')
+        if last_id + 1 >= reader.total:
+            return
+        start = last_id + 1
 
 """Represents a Warfish game. This is currently limited to only supporting 
 a standard game of Risk. While Warfish allows customization of rules this is not currently supported."""
 class Game:
     
-    def __init__(self, id, map, players, rules, history, cookie, possible_actions):
-        """Initializes a game with the given map and players."""
+    def __init__(self, id, map, players, rules, history, cookie, possible_actions, transport=None, lastmod=None):
+        """Initializes a game with the given map and players. Moves are sent with the given
+        transport, or the shared default transport if there is none. lastmod is the lastmod of
+        the possible actions the state was read with."""
         self.id = id
         self.map = map
         self.players = players
@@ -78,24 +229,78 @@ class Game:
         self.cookie = cookie
         self.possible_actions = possible_actions
         self.last_move = None
+        self.transport = transport or Transport.default_transport
+        self.lastmod = lastmod
     
     def execute_move(self, move):
         complete_url = '{0}?_method={1}&gid={2}{3}&_format=json'.format(WARFISH_URL, WARFISH_METHODS['doMove'], self.id, move.to_query_string())
-        print(complete_url)
+        logger.debug('Sending move %s', complete_url)
         
-        request = urllib.request.Request(complete_url, None, {'Cookie': self.cookie} )
-        move_response = urllib.request.urlopen(request)
+        move_response, timing = _send(WARFISH_METHODS['doMove'], complete_url, self.cookie, self.transport)
+        #The move result brings the board up to date with the move, so the new lastmod is already seen.
+        self.lastmod = move_response['_content']['return']['_content'].get('possibleactions', {}).get('lastmod', self.lastmod)
          
-        move_result = MoveResults.process_move_result(json.loads(bytes.decode(move_response.read())), move, self)
+        started = time.perf_counter()
+        move_result = MoveResults.process_move_result(move_response, move, self)
+        Metrics.default_registry.record(WARFISH_METHODS['doMove'], *timing, processing_time=time.perf_counter() - started,
+                                        code=move_response['_content']['return'].get('code'), action=move.action_id)
         self.last_move = move
         return move_result
+    
+    def refresh(self):
+        """Bring the board, players and possible actions up to date with Warfish, and return whether
+        anything had changed. Only the possible actions are requested unless their lastmod differs
+        from the last one seen; then the players and board are requested and the changes are made
+        to the existing Map and Player objects."""
+        state = request_game_info(WARFISH_METHODS['state'], self.id, self.cookie, sections=('possibleactions',), transport=self.transport)
+        lastmod = state['_content']['possibleactions'].get('lastmod')
+        if lastmod is not None and lastmod == self.lastmod:
+            return False
+        state = request_game_info(WARFISH_METHODS['state'], self.id, self.cookie, sections=('players', 'board', 'possibleactions'), transport=self.transport)
+        self.update_state(state)
+        return True
+    
+    def save_snapshot(self, path):
+        """Save the whole game to a file it can be restored from quickly. See the Snapshot module."""
+        from pyFish import Snapshot
+        Snapshot.save(self, path)
+    
+    def update_state(self, state):
+        """Update the game from a getState response, changing only what differs."""
+        for player_info in state['_content']['players']['_content']['player']:
+            player = self.players.get(player_info['id'])
+            if player is None:
+                self.players[player_info['id']] = Player(player_info)
+                continue
+            player.is_turn = int(player_info['isturn']) != 0
+            player.active = int(player_info['active']) != 0
+            if player_info['units'] != '?':
+                player.reserve_units = int(player_info['units'])
+        self.map.update_board(state['_content']['board']['_content']['area'], self.players)
+        self.possible_actions = _possible_actions(state['_content']['possibleactions'])
+        self.lastmod = state['_content']['possibleactions'].get('lastmod')
 
 """A map in Warfish is made up of territories, which can be organized into continents."""
-class Map(Graph):
+class Map(ReadOnlyGraph):
     
     def __init__(self, map_dictionary, board_dictionary, continents_dictionary, board_state_dictionary, players_dictionary):
-        super().__init__()
-        self.territories = [self.add_node(Territory(item)) for item in map_dictionary]
+        self.territories = {}
+        #Objects with a territory_changed method that are told whenever a territory's owner or armies change.
+        self.listeners = []
+        self._compact_board = None
+        #Where the hop distances of the map are saved and read from, if anywhere. See distances.
+        self.distance_cache_directory = None
+        self._distance_table = None
+        self._territories_by_index = []
+        #The Zobrist hash of the owners and armies of every territory, kept up to date as they change.
+        self.zobrist_hash = 0
+        for index, item in enumerate(map_dictionary):
+            territory = Territory(item)
+            territory.index = index
+            territory.map = self
+            self.zobrist_hash ^= Zobrist.key(index, Zobrist.NEUTRAL, 0)
+            self.territories[territory.id] = territory
+            self._territories_by_index.append(territory)
         self.continents = {item['id'] : Continent(item, self.territories) for item in continents_dictionary}
         #Each board element has two ids. a is the attacking country and b is the defending country.
         for item in board_dictionary:
@@ -103,6 +308,8 @@ class Map(Graph):
             territory_b = self.territories[item['b']]
             territory_a.attackable_neighbors[territory_b.id] = territory_b
             territory_b.defendable_neighbors[territory_a.id] = territory_a
+        for continent in self.continents.values():
+            continent.index_borders()
         #Assign each territory an owner.
         for item in board_state_dictionary:
             #A playerid of -1 means the territory is neutral
@@ -114,6 +321,90 @@ class Map(Graph):
             if item['units'] != '?':
                 territory.armies = int(item['units'])
 
+    #The borders are kept in the territories, so the graph is read from them.
+    def nodes(self):
+        return self.territories.values()
+
+    def neighbors(self, territory):
+        return territory.attackable_neighbors.values()
+
+    def predecessors(self, territory):
+        return territory.defendable_neighbors.values()
+
+    def groups(self, player):
+        """The territories the player owns, in lists of territories joined by borders."""
+        return self.connected_components(key=lambda territory: territory.owner,
+                                         nodes=[territory for territory in self.territories.values() if territory.owner is player])
+
+    def update_board(self, board_state_dictionary, players_dictionary):
+        """Set the owners and armies of the territories from the board section of getState. Only the
+        territories that differ are changed, so listeners are told only about real changes."""
+        for item in board_state_dictionary:
+            territory = self.territories[item['id']]
+            owner = None if item['playerid'] == '-1' else players_dictionary[item['playerid']]
+            if territory.owner is not owner:
+                if territory.owner is not None and territory in territory.owner.territories:
+                    territory.owner.territories.remove(territory)
+                territory.owner = owner
+                if owner is not None:
+                    owner.territories.append(territory)
+            if item['units'] != '?' and territory.armies != int(item['units']):
+                territory.armies = int(item['units'])
+
+    def territory_changed(self, territory, previous_owner, previous_armies):
+        """Called by a territory after its owner or armies change."""
+        self.zobrist_hash = Zobrist.update(self.zobrist_hash, territory.index,
+                                           Zobrist.NEUTRAL if previous_owner is None else previous_owner.id, previous_armies,
+                                           Zobrist.NEUTRAL if territory.owner is None else territory.owner.id, territory.armies)
+        if previous_owner is not territory.owner:
+            for continent in territory.continents:
+                _move_count(continent.owner_counts, previous_owner, territory.owner)
+            for continent in territory.reaches:
+                _move_count(continent.reach_counts, previous_owner, territory.owner)
+        for listener in self.listeners:
+            listener.territory_changed(territory, previous_owner, previous_armies)
+
+    def compact_board(self):
+        """Return a CompactBoard for the map. It is built the first time it is asked for and kept
+        in sync with the territories after that. It requires NumPy."""
+        if self._compact_board is None:
+            from pyFish.Board import CompactBoard
+            self._compact_board = CompactBoard(self)
+            self.listeners.append(self._compact_board)
+        return self._compact_board
+
+    def distances(self):
+        """Return the DistanceTable of the map's layout. It is worked out the first time it is asked
+        for, unless a map with the same layout already has, or it is saved in distance_cache_directory."""
+        if self._distance_table is None:
+            self._distance_table = Distances.distances_for_map(self, self.distance_cache_directory)
+        return self._distance_table
+
+    def hop_distance(self, from_territory, to_territory):
+        """The fewest attacks it takes to get from one territory to another, or None if it can not be done."""
+        table = self.distances()
+        distance = table.distance(from_territory.index, to_territory.index)
+        return None if distance == table.unreachable else distance
+
+    def next_hop(self, from_territory, to_territory):
+        """The territory to attack first on the shortest way from one territory to another. This is
+        the from_territory itself when they are the same, and None when there is no way there."""
+        table = self.distances()
+        index = table.next_hop(from_territory.index, to_territory.index)
+        return None if index == table.unreachable else self._territories_by_index[index]
+
+    def continent_distance(self, from_territory, continent):
+        """The fewest attacks it takes to get from a territory to the nearest territory of a continent,
+        0 if it is in the continent, or None if it can not be done."""
+        table = self.distances()
+        distance = table.continent_distance(from_territory.index, continent.id)
+        return None if distance == table.unreachable else distance
+
+    def next_hop_to_continent(self, from_territory, continent):
+        table = self.distances()
+        index = table.continent_next_hop(from_territory.index, continent.id)
+        return None if index == table.unreachable else self._territories_by_index[index]
+
 """A continent represents a collection of territories that give a bonus when controlled by a single player."""
 class Continent:
     
@@ -123,23 +414,69 @@ class Continent:
         self.bonus = int(continent_dictionary['units'])
         self.territories = {}
         for id in continent_dictionary['cids'].split(','):
-            for key, value in territories.items():
-                if key == id:
-                    self.territories[key] = value
+            if id in territories:
+                self.territories[id] = territories[id]
+                territories[id].continents.append(self)
+        #The number of territories in the continent each player owns, with None for neutral. The map
+        #keeps these up to date as owners change.
+        self.owner_counts = {None: len(self.territories)}
+        #The territories in the continent that can be attacked from outside it, with the number of outside
+        #territories that can attack each one.
+        self.access_points = {}
+        #The territories outside the continent that can attack into it.
+        self.outside_neighbors = set()
+        #The number of territories that can attack into the continent each player owns, including
+        #territories in the continent.
+        self.reach_counts = {}
+        self.worst_neighbor_count = 0
+    
+    def index_borders(self):
+        """Work out the access points and neighbors of the continent. The map calls this once all of
+        the borders have been added."""
+        attackers = set()
+        for territory in self.territories.values():
+            for neighbor in territory.defendable_neighbors.values():
+                attackers.add(neighbor)
+                if neighbor.id not in self.territories:
+                    self.access_points[territory] = self.access_points.get(territory, 0) + 1
+                    self.outside_neighbors.add(neighbor)
+        for attacker in attackers:
+            attacker.reaches.append(self)
+        self.reach_counts = {None: len(attackers)}
+        for attacker in attackers:
+            if attacker.owner is not None:
+                _move_count(self.reach_counts, None, attacker.owner)
+        self.worst_neighbor_count = max(self.access_points.values(), default=0)
+    
+    def owned_by(self, player):
+        """The number of territories in the continent the player owns. None counts neutral territories."""
+        return self.owner_counts.get(player, 0)
+    
+    def is_held_by(self, player):
+        return self.owner_counts.get(player, 0) == len(self.territories)
+    
+    def is_reachable_by(self, player):
+        """Whether the player owns a territory that can attack a territory in the continent."""
+        return self.reach_counts.get(player, 0) > 0
+
+def _move_count(counts, previous_owner, owner):
+    counts[previous_owner] -= 1
+    counts[owner] = counts.get(owner, 0) + 1
                     
 """Represents a player in a game of Warfish."""
 class Player:
         
     def __init__(self, player_dictionary):
         self.name = player_dictionary['name']
-        self.is_turn = player_dictionary['isturn'] != 0
-        self.active = player_dictionary['active'] != 0
+        self.is_turn = int(player_dictionary['isturn']) != 0
+        self.active = int(player_dictionary['active']) != 0
         self.team_id = int(player_dictionary['teamid'])
         if player_dictionary['units'] != '?':
             self.reserve_units = int(player_dictionary['units'])  
         self.profile_id = player_dictionary['profileid']
         self.id = int(player_dictionary['id'])
         self.cards = ()
+        self.number_of_cards = 0
         self.territories = []
 
 """Warfish rules are highly customizable. The Rules class represents the rules
@@ -156,23 +493,23 @@ class Rules:
         self.pre_transfers = rules_dictionary['pretransfer']
         self.damage_dice_attack = rules_dictionary['afdie']
         self.damage_dice_defend = rules_dictionary['dfdie']
-        self.allow_abandon = rules_dictionary['allowabandon'] != 0
+        self.allow_abandon = int(rules_dictionary['allowabandon']) != 0
         self.card_scale = rules_dictionary['cardscale'].split(",")
         self.next_cards_worth = rules_dictionary['nextcardsworth'].split(",")
         self.num_reserves = rules_dictionary['numreserves']
-        self.allow_return_to_attack = rules_dictionary['returntoattack'] != 0
-        self.allow_return_to_placement = rules_dictionary['returntoplace'] != 0
+        self.allow_return_to_attack = int(rules_dictionary['returntoattack']) != 0
+        self.allow_return_to_placement = int(rules_dictionary['returntoplace']) != 0
         self.max_armies_per_country = rules_dictionary['maxpercountry']
         self.fog = rules_dictionary['fog']
         self.attack_die_sides = rules_dictionary['adie']
         self.defend_die_sides = rules_dictionary['ddie']
-        self.is_blind_at_once_play = rules_dictionary['baoplay'] != 0
-        self.is_team_game = rules_dictionary['teamgame'] != 0
-        self.allow_team_transfer = rules_dictionary['teamtransfer'] != 0
-        self.allow_continuous_attack = rules_dictionary['continuousattack'] != 0
+        self.is_blind_at_once_play = int(rules_dictionary['baoplay']) != 0
+        self.is_team_game = int(rules_dictionary['teamgame']) != 0
+        self.allow_team_transfer = int(rules_dictionary['teamtransfer']) != 0
+        self.allow_continuous_attack = int(rules_dictionary['continuousattack']) != 0
         self.boot_time = rules_dictionary['boottime']
-        self.is_card_capture = rules_dictionary['hascards'] != 0 #TODO: I am not positive that this is actually a setting for card capture. I need to play with it.
-        self.allow_team_place_units = rules_dictionary['teamplaceunits'] != 0
+        self.is_card_capture = int(rules_dictionary['hascards']) != 0 #TODO: I am not positive that this is actually a setting for card capture. I need to play with it.
+        self.allow_team_place_units = int(rules_dictionary['teamplaceunits']) != 0
         self.initial_unit_placement = rules_dictionary['uplace'] #I think this has to do with the initial unit placement mechanism used.
         self.card_sets_traded = rules_dictionary['cardsetstraded']
 
@@ -183,10 +520,38 @@ class Territory:
         self.name = territory_dictionary['name']
         self.max_units = territory_dictionary['maxunits'] 
         self.id = territory_dictionary['id']
-        self.owner = None
+        #The position of the territory in the map, counting from 0.
+        self.index = None
+        self.map = None
+        self._owner = None
+        self._armies = 0
         self.attackable_neighbors = {}
         self.defendable_neighbors = {}
-        self.armies = 0
+        #The continents the territory is in, and the continents it can attack a territory of.
+        self.continents = []
+        self.reaches = []
+
+    @property
+    def owner(self):
+        return self._owner
+
+    @owner.setter
+    def owner(self, owner):
+        previous_owner = self._owner
+        self._owner = owner
+        if self.map is not None:
+            self.map.territory_changed(self, previous_owner, self._armies)
+
+    @property
+    def armies(self):
+        return self._armies
+
+    @armies.setter
+    def armies(self, armies):
+        previous_armies = self._armies
+        self._armies = armies
+        if self.map is not None:
+            self.map.territory_changed(self, self._owner, previous_armies)
 
 """A turn is made up of a collection of moves."""
 class Turn:
@@ -0,0 +1,172 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module works out how many attacks it takes to get from every territory of a map to every
+other territory and to every continent, and the first attack to make on the way. The tables are
+worked out once for each map layout and kept in memory, and optionally on disk, so looking a
+distance up does not need a search. Territories are numbered by Territory.index.
+
+The tables hold a value for every pair of territories, 4 bytes a pair for maps of up to 65535
+territories and 8 bytes a pair above that, so a map of 20,000 territories takes about 1.6 GB.
+Only the tables of the last MAX_TABLES layouts asked for are kept here; a Map keeps its own
+table for as long as the Map is in use."""
+
+import array
+import collections
+import hashlib
+import os
+import threading
+
+#The distance to a territory that can not be reached, and the next hop towards it, in the 16 bit
+#tables of maps of up to UNREACHABLE territories and in the 32 bit tables of larger maps.
+UNREACHABLE = 0xFFFF
+WIDE_UNREACHABLE = 0xFFFFFFFF
+#The number of layouts whose tables are kept for other maps with the same layout.
+MAX_TABLES = 4
+
+_tables = collections.OrderedDict()
+_tables_lock = threading.Lock()
+
+def distances_for_map(map, cache_directory=None):
+    """Return the DistanceTable for the layout of a Map. Tables are shared by every map with the
+    same territories, borders and continents, and are read from and saved to cache_directory if
+    it is given."""
+    key = layout_key(map)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = DistanceTable.load(cache_directory, map) if cache_directory else None
+            if table is None:
+                table = DistanceTable(map)
+                if cache_directory:
+                    table.save(cache_directory)
+            _tables[key] = table
+            if len(_tables) > MAX_TABLES:
+                _tables.popitem(last=False)
+        _tables.move_to_end(key)
+        return table
+
+def table_format(size):
+    """The array typecode of the tables of a map with size territories, and the value for unreachable in them."""
+    return ('H', UNREACHABLE) if size <= UNREACHABLE else ('I', WIDE_UNREACHABLE)
+
+def layout_key(map):
+    """A name for the layout of the map that changes if any border or continent does."""
+    territories = sorted(map.territories.values(), key=lambda territory: territory.index)
+    layout = hashlib.sha1()
+    for territory in territories:
+        layout.update('{0}:{1};'.format(territory.id, ','.join(sorted(territory.attackable_neighbors))).encode())
+    for continent_id, continent in map.continents.items():
+        layout.update('{0}:{1};'.format(continent_id, ','.join(sorted(continent.territories))).encode())
+    return layout.hexdigest()
+
+"""The hop distances and next hops of a map layout. distances[i * size + j] is the number of attacks
+it takes to get from territory i to territory j, and next_hops[i * size + j] is the territory to
+attack first on the way. continent_distances and continent_next_hops hold the same for the
+nearest territory of each continent, with a row for each territory and a column for each
+continent in continent_ids. Both are unreachable, UNREACHABLE or WIDE_UNREACHABLE by the size
+of the map, when there is no way there."""
+class DistanceTable:
+
+    def __init__(self, map, tables=None):
+        self.key = layout_key(map)
+        territories = sorted(map.territories.values(), key=lambda territory: territory.index)
+        self.size = len(territories)
+        self.continent_ids = list(map.continents)
+        self.continent_columns = {continent_id: column for column, continent_id in enumerate(self.continent_ids)}
+        self.typecode, self.unreachable = table_format(self.size)
+        if tables is not None:
+            self.distances, self.next_hops, self.continent_distances, self.continent_next_hops = tables
+            return
+        neighbors = [[neighbor.index for neighbor in territory.attackable_neighbors.values()] for territory in territories]
+        self.distances = array.array(self.typecode, [self.unreachable]) * (self.size * self.size)
+        self.next_hops = array.array(self.typecode, [self.unreachable]) * (self.size * self.size)
+        for source in range(self.size):
+            self._search(source, neighbors)
+        self.continent_distances = array.array(self.typecode, [self.unreachable]) * (self.size * len(self.continent_ids))
+        self.continent_next_hops = array.array(self.typecode, [self.unreachable]) * (self.size * len(self.continent_ids))
+        for column, continent in enumerate(map.continents.values()):
+            members = [territory.index for territory in continent.territories.values()]
+            for source in range(self.size):
+                row = source * self.size
+                nearest = min(members, key=lambda member: self.distances[row + member], default=None)
+                if nearest is not None:
+                    self.continent_distances[source * len(self.continent_ids) + column] = self.distances[row + nearest]
+                    self.continent_next_hops[source * len(self.continent_ids) + column] = self.next_hops[row + nearest]
+
+    def _search(self, source, neighbors):
+        """Breadth first search from the source, remembering the first hop taken to each territory."""
+        row = source * self.size
+        unreachable = self.unreachable
+        self.distances[row + source] = 0
+        self.next_hops[row + source] = source
+        queue = collections.deque()
+        for neighbor in neighbors[source]:
+            if self.distances[row + neighbor] == unreachable:
+                self.distances[row + neighbor] = 1
+                self.next_hops[row + neighbor] = neighbor
+                queue.append(neighbor)
+        while queue:
+            territory = queue.popleft()
+            distance = self.distances[row + territory] + 1
+            first_hop = self.next_hops[row + territory]
+            for neighbor in neighbors[territory]:
+                if self.distances[row + neighbor] == unreachable:
+                    self.distances[row + neighbor] = distance
+                    self.next_hops[row + neighbor] = first_hop
+                    queue.append(neighbor)
+
+    def distance(self, from_index, to_index):
+        return self.distances[from_index * self.size + to_index]
+
+    def next_hop(self, from_index, to_index):
+        return self.next_hops[from_index * self.size + to_index]
+
+    def continent_distance(self, from_index, continent_id):
+        return self.continent_distances[from_index * len(self.continent_ids) + self.continent_columns[continent_id]]
+
+    def continent_next_hop(self, from_index, continent_id):
+        return self.continent_next_hops[from_index * len(self.continent_ids) + self.continent_columns[continent_id]]
+
+    @staticmethod
+    def path(directory, key):
+        return os.path.join(directory, '{0}.distances'.format(key))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory, self.key)
+        temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as distances_file:
+            for table in (self.distances, self.next_hops, self.continent_distances, self.continent_next_hops):
+                table.tofile(distances_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, directory, map):
+        """Read the table saved by save for the layout of the map, or return None if there is not one."""
+        values = array.array(table_format(len(map.territories))[0])
+        try:
+            with open(cls.path(directory, layout_key(map)), 'rb') as distances_file:
+                values.frombytes(distances_file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        size = len(map.territories)
+        continents = len(map.continents)
+        if len(values) != 2 * size * size + 2 * size * continents:
+            return None
+        splits = [0, size * size, 2 * size * size, 2 * size * size + size * continents, len(values)]
+        return cls(map, [values[start:end] for start, end in zip(splits, splits[1:])])
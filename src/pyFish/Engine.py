@@ -0,0 +1,520 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module plays a game of Warfish locally. The state of the game is kept in the same Map,
+Player and Rules objects the client uses, and every request is answered with a dictionary in
+the same form as the Warfish api would return."""
+
+import http.cookies
+import json
+import random
+import threading
+import time
+import urllib.parse
+from pyFish import Core
+from pyFish import Metrics
+from pyFish.Odds import MAX_ATTACK_DICE, MAX_DEFEND_DICE
+
+#The number of units placed on each territory when a new game is dealt.
+STARTING_UNITS = 3
+#After a capture this many units move in automatically. If more could follow a free transfer is offered.
+CAPTURE_UNITS = 3
+#The card types in the order of a hand. The first three match the card ids in the move log.
+CARD_TYPES = ('A', 'B', 'C', 'W')
+WILD = 3
+#A deck has this many cards of each type except wild, and two wilds.
+CARDS_PER_TYPE = 14
+WILD_CARDS = 2
+
+"""Raised when a move is not allowed by the rules or the state of the game."""
+class MoveError(Exception):
+    pass
+
+"""A game of Warfish that is played without the Warfish server. Only turn based play is supported."""
+class Engine:
+
+    def __init__(self, details, players, board_state, seed=None):
+        """Creates a game from a getDetails response, a dictionary of Player objects keyed by id
+        and the area list of a getState board."""
+        content = details['_content']
+        self.details = details
+        self.rules = Core.Rules(content['rules'])
+        self.players = players
+        self.map = Core.Map(content['map']['_content']['territory'],
+                            content['board']['_content']['border'],
+                            content['continents']['_content']['continent'],
+                            board_state,
+                            players)
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.log = []
+        #Each move in the log encoded as JSON, so the move log does not have to be encoded again for every getHistory.
+        self.encoded_log = []
+        self.lastmod = 0
+        self.seat_order = sorted(players.values(), key=lambda player: player.id)
+        self.current_player = None
+        self.possible_actions = []
+        self.attacks_made = 0
+        self.transfers_made = 0
+        self.last_attack = None
+        self.captured_this_turn = False
+        #The number of cards of each type in CARD_TYPES each player holds.
+        self.hands = {player.id: [0] * len(CARD_TYPES) for player in self.seat_order}
+        self.card_sets_traded = 0
+        self.card_scale = [int(worth) for worth in self.rules.card_scale]
+
+    @classmethod
+    def new_game(cls, details, number_of_players, seed=None):
+        """Deals the territories of the map out evenly between new players and starts the first turn."""
+        deal = random.Random(seed)
+        players = {}
+        for seat in range(number_of_players):
+            players[str(seat)] = Core.Player({'name': 'Player {0}'.format(seat), 'isturn': '0', 'active': '1',
+                                              'teamid': '-1', 'units': '0', 'profileid': '', 'id': str(seat)})
+        territory_ids = [territory['id'] for territory in details['_content']['map']['_content']['territory']]
+        deal.shuffle(territory_ids)
+        board_state = [{'id': territory_id, 'playerid': str(index % number_of_players), 'units': str(STARTING_UNITS)}
+                       for index, territory_id in enumerate(territory_ids)]
+        engine = cls(details, players, board_state, deal.random())
+        engine.record('n', 0, logver=3)
+        for player in engine.seat_order:
+            engine.record('j', player.id)
+        engine.record('s', None)
+        for area in board_state:
+            engine.record('t', area['playerid'], cid=area['id'], num=STARTING_UNITS)
+        engine.start_turn(engine.seat_order[0])
+        return engine
+
+    def record(self, action, player_id, **fields):
+        """Adds a move to the move log in the form getHistory returns it."""
+        entry = {'a': action, 'id': str(len(self.log)), 't': str(int(time.time()))}
+        if player_id is not None:
+            entry['s'] = str(player_id)
+        for key, value in fields.items():
+            entry[key] = str(value)
+        self.log.append(entry)
+        self.encoded_log.append(json.dumps(entry, separators=(',', ':')))
+
+    def start_turn(self, player):
+        """Gives the player their units for the turn and lets them place them."""
+        reserve_units = max(3, len(player.territories) // 3)
+        for continent in self.map.continents.values():
+            if continent.is_held_by(player):
+                reserve_units += continent.bonus
+        self.record('z', player.id, num=reserve_units)
+        #Card sets are turned in automatically, as many as the player holds.
+        card_set = self.card_set(player)
+        while card_set:
+            reserve_units += self.use_cards(player, card_set)
+            card_set = self.card_set(player)
+        self.current_player = player
+        player.is_turn = True
+        player.reserve_units = reserve_units
+        self.attacks_made = 0
+        self.transfers_made = 0
+        self.last_attack = None
+        self.captured_this_turn = False
+        self.possible_actions = ['placeunits']
+
+    @property
+    def next_cards_worth(self):
+        """The units the next card sets turned in are worth."""
+        return self.card_scale[self.card_sets_traded:] or self.card_scale[-1:]
+
+    def card_set(self, player):
+        """A list of the card types in a set the player can turn in, or None. A set is three cards of
+        the same type or one of each, and wild cards stand in for any type."""
+        hand = self.hands[player.id]
+        wilds = hand[WILD]
+        for card_type in range(WILD):
+            if hand[card_type] + wilds >= 3:
+                used = min(hand[card_type], 3)
+                return [card_type] * used + [WILD] * (3 - used)
+        held = [card_type for card_type in range(WILD) if hand[card_type]]
+        if len(held) + wilds >= 3:
+            return held + [WILD] * (3 - len(held))
+        return None
+
+    def use_cards(self, player, card_set):
+        """Turn in a set of cards and return the units it is worth."""
+        for card_type in card_set:
+            self.hands[player.id][card_type] -= 1
+        worth = self.next_cards_worth[0]
+        self.card_sets_traded += 1
+        self.record('u', player.id, clist=','.join(str(card_type) for card_type in card_set), num=worth)
+        return worth
+
+    def award_card(self, player):
+        """Give the player a card drawn from a full deck."""
+        draw = self.random.randrange(CARDS_PER_TYPE * WILD + WILD_CARDS)
+        card_type = WILD if draw >= CARDS_PER_TYPE * WILD else draw // CARDS_PER_TYPE
+        self.hands[player.id][card_type] += 1
+        self.record('g', player.id, clist=card_type)
+
+    def turn_actions(self):
+        """The actions available once the units for the turn have been placed."""
+        actions = []
+        num_attacks = int(self.rules.num_attacks)
+        if self.transfers_made == 0 and (num_attacks < 0 or self.attacks_made < num_attacks):
+            actions.append('attack')
+        if self.transfers_made < int(self.rules.num_transfers):
+            actions.append('transfer')
+        actions.append('endturn')
+        return actions
+
+    def do_move(self, player_id, parameters):
+        """Makes a move for the player and returns the doMove response. parameters are the
+        arguments from the query string of the move. A player_id of None makes the move for
+        the player whose turn it is."""
+        with self.lock:
+            player = self.current_player if player_id is None else self.players.get(str(player_id))
+            if player is None or player is not self.current_player:
+                raise MoveError('It is not your turn.')
+            action = parameters.get('action')
+            if action not in self.possible_actions:
+                raise MoveError('{0} is not a possible action.'.format(action))
+            if action != 'freetransfer':
+                self.last_attack = None
+            content = getattr(self, '_' + action)(player, parameters)
+            self.lastmod += 1
+            content['possibleactions'] = self.possible_actions_content(player)
+            content['pinfo'] = {'_content': {'player': [self.player_info(other) for other in self.seat_order],
+                                             'self': {'playerid': str(player.id)}}}
+            content['cinfo'] = self.cards_content(player)
+            return {'stat': 'ok', '_content': {'return': {'msg': 'success', 'code': '1', '_content': content}}}
+
+    def _placeunits(self, player, parameters):
+        territories = [self.territory(territory_id) for territory_id in parameters['clist'].split(',')]
+        units = [self.number(value) for value in parameters['ulist'].split(',')]
+        if len(territories) != len(units):
+            raise MoveError('clist and ulist must be the same length.')
+        if any(territory.owner is not player for territory in territories):
+            raise MoveError('Units can only be placed on your own territories.')
+        if any(number < 1 for number in units) or sum(units) > player.reserve_units:
+            raise MoveError('You do not have that many units to place.')
+        for territory, number in zip(territories, units):
+            territory.armies += number
+            self.record('p', player.id, cid=territory.id, num=number)
+        player.reserve_units -= sum(units)
+        if player.reserve_units == 0:
+            self.possible_actions = self.turn_actions()
+        return {}
+
+    def _attack(self, player, parameters):
+        from_territory = self.territory(parameters.get('fromcid'))
+        to_territory = self.territory(parameters.get('tocid'))
+        number_of_units = self.number(parameters.get('numunits'))
+        if from_territory.owner is not player or to_territory.owner is player:
+            raise MoveError('You can only attack from your own territory into another player\'s.')
+        if to_territory.id not in from_territory.attackable_neighbors:
+            raise MoveError('{0} can not attack {1}.'.format(from_territory.name, to_territory.name))
+        if number_of_units < 1 or number_of_units >= from_territory.armies:
+            raise MoveError('You do not have that many units to attack with.')
+
+        defender = to_territory.owner
+        defender_id = defender.id if defender else -1
+        info = {'defenderseatid': str(defender_id), 'attackerunits': str(number_of_units), 'defenderunits': str(to_territory.armies)}
+        attack_die_sides = int(self.rules.attack_die_sides)
+        defend_die_sides = int(self.rules.defend_die_sides)
+        rolls = []
+        total_attacker_losses = 0
+        total_defender_losses = 0
+        while number_of_units > total_attacker_losses and to_territory.armies > total_defender_losses:
+            attack_dice = sorted((self.random.randint(1, attack_die_sides) for _ in range(min(MAX_ATTACK_DICE, number_of_units - total_attacker_losses))), reverse=True)
+            defend_dice = sorted((self.random.randint(1, defend_die_sides) for _ in range(min(MAX_DEFEND_DICE, to_territory.armies - total_defender_losses))), reverse=True)
+            attacker_losses = 0
+            defender_losses = 0
+            #The defender wins ties.
+            for attack_die, defend_die in zip(attack_dice, defend_dice):
+                if attack_die > defend_die:
+                    defender_losses += 1
+                else:
+                    attacker_losses += 1
+            total_attacker_losses += attacker_losses
+            total_defender_losses += defender_losses
+            attack_dice = ','.join(str(die) for die in attack_dice)
+            defend_dice = ','.join(str(die) for die in defend_dice)
+            rolls.append({'defenderleft': str(to_territory.armies - total_defender_losses), 'defenddice': defend_dice,
+                          'defenderlosses': str(defender_losses), 'attackerlosses': str(attacker_losses), 'attackdice': attack_dice})
+            self.record('a', player.id, m='', al=attacker_losses, dl=defender_losses, fcid=from_territory.id, tcid=to_territory.id,
+                        ad=attack_dice, dd=defend_dice, ds=defender_id)
+            if parameters.get('continuous') != '1':
+                break
+        from_territory.armies -= total_attacker_losses
+        to_territory.armies -= total_defender_losses
+        self.attacks_made += 1
+        self.possible_actions = self.turn_actions()
+
+        results = {'totalattackerlosses': str(total_attacker_losses), 'totaldefenderlosses': str(total_defender_losses)}
+        if to_territory.armies == 0:
+            results['captured'] = '1'
+            results['eliminate'] = '0'
+            self.captured_this_turn = True
+            to_territory.owner = player
+            player.territories.append(to_territory)
+            if defender:
+                defender.territories.remove(to_territory)
+            #Taking a player's last territory when only they and the attacker are left ends the game,
+            #and no free transfer can follow, so every unit that can move in does.
+            ends_game = (defender is not None and not defender.territories and
+                         sum(1 for other in self.seat_order if other.active and other is not defender) == 1)
+            if from_territory.armies - 1 > CAPTURE_UNITS and not ends_game:
+                moved_units = CAPTURE_UNITS
+                self.last_attack = (from_territory, to_territory)
+                self.possible_actions.insert(0, 'freetransfer')
+            else:
+                moved_units = from_territory.armies - 1
+            #The units moved in are recorded, so a replay of the log does not have to work them out.
+            self.record('c', player.id, cid=to_territory.id, ds=defender_id, num=moved_units)
+            from_territory.armies -= moved_units
+            to_territory.armies = moved_units
+            if defender and not defender.territories:
+                results['eliminate'] = '1'
+                self.eliminate(player, defender)
+        return {'info': info,
+                'dice': {'adie': str(attack_die_sides), 'ddie': str(defend_die_sides)},
+                'results': results,
+                'attack': rolls}
+
+    def _freetransfer(self, player, parameters):
+        from_territory, to_territory = self.last_attack
+        number_of_units = self.number(parameters.get('numunits'))
+        if number_of_units < 0 or number_of_units >= from_territory.armies:
+            raise MoveError('You do not have that many units to transfer.')
+        from_territory.armies -= number_of_units
+        to_territory.armies += number_of_units
+        self.record('f', player.id, fcid=from_territory.id, tcid=to_territory.id, num=number_of_units)
+        self.last_attack = None
+        self.possible_actions = self.turn_actions()
+        return {}
+
+    def _transfer(self, player, parameters):
+        from_territory = self.territory(parameters.get('fromcid'))
+        to_territory = self.territory(parameters.get('tocid'))
+        number_of_units = self.number(parameters.get('numunits'))
+        if from_territory.owner is not player or to_territory.owner is not player:
+            raise MoveError('Units can only be transferred between your own territories.')
+        if to_territory.id not in from_territory.attackable_neighbors:
+            raise MoveError('{0} does not border {1}.'.format(from_territory.name, to_territory.name))
+        if number_of_units < 1 or number_of_units >= from_territory.armies:
+            raise MoveError('You do not have that many units to transfer.')
+        from_territory.armies -= number_of_units
+        to_territory.armies += number_of_units
+        self.record('f', player.id, fcid=from_territory.id, tcid=to_territory.id, num=number_of_units)
+        self.transfers_made += 1
+        self.possible_actions = self.turn_actions()
+        return {}
+
+    def _endturn(self, player, parameters):
+        if self.captured_this_turn and self.rules.is_card_capture:
+            self.award_card(player)
+        player.is_turn = False
+        seat = self.seat_order.index(player)
+        for offset in range(1, len(self.seat_order) + 1):
+            next_player = self.seat_order[(seat + offset) % len(self.seat_order)]
+            if next_player.active:
+                break
+        self.start_turn(next_player)
+        return {}
+
+    def eliminate(self, player, defender):
+        """Removes a player with no territories left from the game and ends it if only one player is left."""
+        defender.active = False
+        self.record('e', player.id, es=defender.id)
+        captured_cards = [card_type for card_type, number in enumerate(self.hands[defender.id]) for _ in range(number)]
+        if captured_cards:
+            for card_type in captured_cards:
+                self.hands[player.id][card_type] += 1
+            self.hands[defender.id] = [0] * len(CARD_TYPES)
+            self.record('h', player.id, ds=defender.id, clist=','.join(str(card_type) for card_type in captured_cards), num=len(captured_cards))
+        if sum(1 for other in self.seat_order if other.active) == 1:
+            self.record('w', player.id)
+            player.is_turn = False
+            self.current_player = None
+            self.possible_actions = []
+
+    @property
+    def is_over(self):
+        return self.current_player is None
+
+    def territory(self, territory_id):
+        try:
+            return self.map.territories[territory_id]
+        except KeyError:
+            raise MoveError('{0} is not a territory.'.format(territory_id))
+
+    def number(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise MoveError('{0} is not a number.'.format(value))
+
+    def possible_actions_content(self, player):
+        actions = self.possible_actions if player is self.current_player else []
+        return {'lastmod': str(self.lastmod), '_content': {'action': [{'id': action} for action in actions]}}
+
+    def get_details(self, sections=None):
+        """The getDetails response. Only the given sections are included if there are any."""
+        content = self.details['_content']
+        return {'stat': 'ok', '_content': {name: value for name, value in content.items() if not sections or name in sections}}
+
+    def get_state(self, player_id=None, sections=None):
+        """The getState response as the given player sees it. A player_id of None shows the game
+        as the player whose turn it is sees it."""
+        with self.lock:
+            player = self.current_player if player_id is None else self.players.get(str(player_id))
+            content = {}
+            if not sections or 'players' in sections:
+                content['players'] = {'_content': {'player': [self.player_info(other) for other in self.seat_order]}}
+            if not sections or 'board' in sections:
+                content['board'] = {'_content': {'area': [{'playerid': str(territory.owner.id) if territory.owner else '-1',
+                                                          'units': str(territory.armies),
+                                                          'id': territory.id} for territory in self.map.territories.values()]}}
+            if not sections or 'possibleactions' in sections:
+                content['possibleactions'] = self.possible_actions_content(player)
+            if not sections or 'cards' in sections:
+                content['cards'] = self.cards_content(None)
+            return {'stat': 'ok', '_content': content}
+
+    def cards_content(self, player):
+        """The cards section of getState, or the cinfo of doMove when the player is given."""
+        next_cards_worth = self.next_cards_worth
+        cards = {'cardsetstraded': str(self.card_sets_traded),
+                 'nextcardsworth': ','.join(str(worth) for worth in next_cards_worth),
+                 'worth': str(next_cards_worth[0]),
+                 '_content': {'player': [{'num': str(sum(self.hands[other.id])), 'id': str(other.id)} for other in self.seat_order]}}
+        if player is not None:
+            cards['_content']['self'] = {'num' + card_type: str(number) for card_type, number in zip(CARD_TYPES, self.hands[player.id])}
+        return cards
+
+    def player_info(self, player):
+        return {'name': player.name, 'isturn': '1' if player.is_turn else '0', 'active': '1' if player.active else '0',
+                'teamid': str(player.team_id), 'units': str(player.reserve_units), 'profileid': player.profile_id, 'id': str(player.id)}
+
+    def get_history(self, start=0, num=None):
+        """The getHistory response for the moves starting at the given move id."""
+        with self.lock:
+            start = max(int(start), 0)
+            moves = self.log[start:] if num is None else self.log[start:start + int(num)]
+            return {'stat': 'ok', '_content': {'movelog': {'total': str(len(self.log)), 'numreturned': str(len(moves)), '_content': {'m': moves}}}}
+
+    def get_encoded_history(self, start=0, num=None):
+        """The getHistory response already encoded as JSON."""
+        with self.lock:
+            start = max(int(start), 0)
+            moves = self.encoded_log[start:] if num is None else self.encoded_log[start:start + int(num)]
+            return '{{"stat":"ok","_content":{{"movelog":{{"total":"{0}","numreturned":"{1}","_content":{{"m":[{2}]}}}}}}}}'.format(
+                len(self.encoded_log), len(moves), ','.join(moves)).encode()
+
+def player_id_for_cookie(cookie):
+    """The player a request is made for. A cookie of seat=N plays as the player with id N and any
+    other cookie plays as the player whose turn it is, which is returned as None."""
+    try:
+        cookies = http.cookies.SimpleCookie(cookie or '')
+    except http.cookies.CookieError:
+        return None
+    return cookies['seat'].value if 'seat' in cookies else None
+
+def handle_request(engine, parameters, player_id=None):
+    """Answer a Warfish api call on a game. parameters are the arguments from the query string.
+    Moves that break the rules are answered with a failed response, as Warfish does."""
+    method = parameters.get('_method')
+    sections = parameters['sections'].split(',') if 'sections' in parameters else None
+    try:
+        if method == Core.WARFISH_METHODS['details']:
+            return engine.get_details(sections)
+        elif method == Core.WARFISH_METHODS['state']:
+            return engine.get_state(player_id, sections)
+        elif method == Core.WARFISH_METHODS['history']:
+            return engine.get_history(parameters.get('start', 0), parameters.get('num'))
+        elif method == Core.WARFISH_METHODS['doMove']:
+            return engine.do_move(player_id, parameters)
+        raise MoveError('{0} is not a supported method.'.format(method))
+    except MoveError as error:
+        return {'stat': 'fail', 'err': {'code': '0', 'msg': str(error)}}
+
+def encode_request(engine, parameters, player_id=None):
+    """Answer a Warfish api call like handle_request, encoded as JSON."""
+    if parameters.get('_method') == Core.WARFISH_METHODS['history']:
+        try:
+            return engine.get_encoded_history(parameters.get('start', 0), parameters.get('num'))
+        except ValueError:
+            pass
+    return json.dumps(handle_request(engine, parameters, player_id), separators=(',', ':')).encode()
+
+"""A transport that answers requests from local games in the same process instead of sending
+them to Warfish. games maps game ids to Engines. Requests made through Core are answered by
+request with the response dictionaries themselves, which share the engine's move dictionaries
+and must not be changed; get encodes them as JSON as Warfish would."""
+class EngineTransport:
+
+    def __init__(self, games):
+        self.games = games
+
+    def get(self, url, headers=None):
+        parameters = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+        engine = self.games.get(parameters.get('gid'))
+        if engine is None:
+            return json.dumps(self._missing(parameters), separators=(',', ':')).encode()
+        return encode_request(engine, parameters, player_id_for_cookie((headers or {}).get('Cookie')))
+
+    def request(self, url, headers=None):
+        parameters = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+        engine = self.games.get(parameters.get('gid'))
+        if engine is None:
+            return self._missing(parameters)
+        return handle_request(engine, parameters, player_id_for_cookie((headers or {}).get('Cookie')))
+
+    def _missing(self, parameters):
+        return {'stat': 'fail', 'err': {'code': '0', 'msg': 'There is no game {0}.'.format(parameters.get('gid'))}}
+
+def play(engine, bot_classes, game_id='local', max_turns=1000):
+    """Play a game to the end with bots, or until max_turns turns have been taken, and return the
+    number of turns taken. bot_classes maps player ids to bot classes like RandomBot and
+    ContinentBot. Each bot is created once, with the game id, player name, a cookie and a
+    transport that answers its requests from the engine, and plays each of its turns with
+    take_turn. Before every turn after its first the bot's Game is brought up to date with the
+    moves the other players made, straight from the engine."""
+    transport = EngineTransport({game_id: engine})
+    bots = {}
+    turns = 0
+    while not engine.is_over and turns < max_turns:
+        player = engine.current_player
+        with Metrics.default_registry.turn(game_id, player.id):
+            bot = bots.get(player.id)
+            if bot is None:
+                bot = bots[player.id] = bot_classes[player.id](game_id, player.name, 'seat={0}'.format(player.id), transport=transport)
+            else:
+                catch_up(engine, bot.game, player.id)
+            bot.take_turn()
+        if engine.current_player is player and not engine.is_over:
+            #The bot stopped without ending its turn, so it is ended for it.
+            engine.do_move(player.id, {'action': 'endturn'})
+        turns += 1
+    return turns
+
+def catch_up(engine, game, player_id):
+    """Bring a Game of the engine's game up to date, as the given player sees it, by changing its
+    existing objects with the engine's responses rather than requesting and decoding them."""
+    game.update_state(engine.get_state(player_id, ('players', 'board', 'possibleactions')))
+    #Captures add territories to the end of their owner's list. They are put back in map order, as
+    #a new Game lists them, so a bot plays just as it would on a Game created for the turn.
+    for player in game.players.values():
+        player.territories.sort(key=lambda territory: territory.index)
+    if game.history is not None:
+        start = game.history.ids[-1] + 1 if len(game.history) else 0
+        game.history.extend(engine.get_history(start)['_content']['movelog']['_content']['m'])
@@ -0,0 +1,147 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A small directed graph of any hashable objects, stored as adjacency lists.
+
+The traversals are in ReadOnlyGraph and only go through nodes, neighbors and predecessors, so a
+class that already keeps its edges somewhere else can subclass it and give just those three.
+Map does this to use the borders stored in its territories. Graph adds adjacency lists that
+nodes and edges can be added to.
+
+>>> graph = Graph()
+>>> for start, end in [('a', 'b'), ('b', 'c'), ('d', 'e')]:
+...     edge = graph.add_edge(start, end)
+>>> [(edge.start, edge.end) for edge in graph.search_edges('a')]
+[('a', 'b'), ('b', 'c')]
+>>> sorted(sorted(component) for component in graph.connected_components())
+[['a', 'b', 'c'], ['d', 'e']]"""
+
+import abc
+import collections
+
+"""An edge from one node to another."""
+class Edge:
+
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+"""A graph that can be searched but not changed. Subclasses give its nodes and edges."""
+class ReadOnlyGraph(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    def nodes(self):
+        pass
+
+    @abc.abstractmethod
+    def neighbors(self, node):
+        """The nodes there is an edge to from the node."""
+        pass
+
+    @abc.abstractmethod
+    def predecessors(self, node):
+        """The nodes there is an edge from to the node."""
+        pass
+
+    def edges(self, node):
+        return [Edge(node, neighbor) for neighbor in self.neighbors(node)]
+
+    def breadth_first(self, start, accept=None):
+        """Yield each node that can be reached from start, with the number of edges to it, nearest
+        first. If accept is given only the nodes it returns True for are passed through."""
+        depths = {start: 0}
+        queue = collections.deque([start])
+        while queue:
+            node = queue.popleft()
+            yield node, depths[node]
+            for neighbor in self.neighbors(node):
+                if neighbor not in depths and (accept is None or accept(neighbor)):
+                    depths[neighbor] = depths[node] + 1
+                    queue.append(neighbor)
+
+    def search_edges(self, start, accept=None):
+        """Yield the edge by which each node that can be reached from start is first reached, in
+        breadth first order."""
+        seen = {start}
+        queue = collections.deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbor in self.neighbors(node):
+                if neighbor not in seen and (accept is None or accept(neighbor)):
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+                    yield Edge(node, neighbor)
+
+    def connected_components(self, key=None, nodes=None):
+        """Group the nodes, all of them unless others are given, into lists that are joined by edges
+        in either direction. With key, nodes are only joined to nodes with the same key, so for a
+        Map key=lambda territory: territory.owner gives the groups of territories each player holds."""
+        nodes = self.nodes() if nodes is None else nodes
+        allowed = set(nodes)
+        seen = set()
+        components = []
+        for node in nodes:
+            if node in seen:
+                continue
+            node_key = key(node) if key else None
+            component = [node]
+            seen.add(node)
+            queue = collections.deque([node])
+            while queue:
+                current = queue.popleft()
+                for other in list(self.neighbors(current)) + list(self.predecessors(current)):
+                    if other not in seen and other in allowed and (key is None or key(other) == node_key):
+                        seen.add(other)
+                        component.append(other)
+                        queue.append(other)
+            components.append(component)
+        return components
+
+"""A graph stored as adjacency lists, that nodes and edges can be added to."""
+class Graph(ReadOnlyGraph):
+
+    def __init__(self):
+        self.adjacency = {}
+        self.reverse_adjacency = {}
+
+    def add_node(self, node):
+        if node not in self.adjacency:
+            self.adjacency[node] = []
+            self.reverse_adjacency[node] = []
+        return node
+
+    def add_edge(self, start, end):
+        self.add_node(start)
+        self.add_node(end)
+        self.adjacency[start].append(end)
+        self.reverse_adjacency[end].append(start)
+        return Edge(start, end)
+
+    def nodes(self):
+        return self.adjacency.keys()
+
+    def neighbors(self, node):
+        return self.adjacency[node]
+
+    def predecessors(self, node):
+        return self.reverse_adjacency[node]
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,143 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module records how long requests to Warfish take. Every request made through Core is
+recorded in default_registry with its latency, response size, JSON decode time and result, by
+Warfish method, and moves also record how long their MoveResult took to process. A bot can wrap
+each turn in registry.turn() to get the same figures added up for the turn.
+
+Each request, including moves, and each turn is also passed as a dictionary to the registry's exporters, such as
+a FileExporter or any function that takes one argument:
+
+    Metrics.default_registry.exporters.append(Metrics.FileExporter('metrics.jsonl'))"""
+
+import collections
+import contextlib
+import json
+import threading
+import time
+
+"""The totals for one Warfish method, or for one turn."""
+class Stats:
+
+    __slots__ = ('count', 'latency', 'max_latency', 'bytes', 'decode_time', 'processing_time', 'codes', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.bytes = 0
+        self.decode_time = 0.0
+        self.processing_time = 0.0
+        #The number of times each result code was returned, and each error code.
+        self.codes = collections.Counter()
+        self.errors = collections.Counter()
+
+    def add(self, latency, size, decode_time, processing_time, code, error):
+        self.count += 1
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.bytes += size or 0
+        self.decode_time += decode_time or 0.0
+        self.processing_time += processing_time or 0.0
+        if code is not None:
+            self.codes[code] += 1
+        if error is not None:
+            self.errors[error] += 1
+
+    def summary(self):
+        return {'count': self.count,
+                'latency': self.latency,
+                'mean_latency': self.latency / self.count if self.count else 0.0,
+                'max_latency': self.max_latency,
+                'bytes': self.bytes,
+                'decode_time': self.decode_time,
+                'processing_time': self.processing_time,
+                'codes': dict(self.codes),
+                'errors': dict(self.errors)}
+
+class MetricsRegistry:
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.methods = collections.defaultdict(Stats)
+        #Functions called with a dictionary for each request and turn.
+        self.exporters = []
+        self._lock = threading.Lock()
+        #Turns are kept per thread so bots playing in several threads do not mix their figures.
+        self._local = threading.local()
+
+    def record(self, method, latency, size=None, decode_time=None, processing_time=None, code=None, error=None, action=None):
+        """Record one request. code is the result code of a move and error the code of a failure."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.methods[method].add(latency, size, decode_time, processing_time, code, error)
+        turn = getattr(self._local, 'turn', None)
+        if turn is not None:
+            turn[1].add(latency, size, decode_time, processing_time, code, error)
+        if self.exporters:
+            self._export({'type': 'request', 'method': method, 'action': action, 'time': time.time(), 'latency': latency,
+                          'bytes': size, 'decode_time': decode_time, 'processing_time': processing_time, 'code': code, 'error': error})
+
+    @contextlib.contextmanager
+    def turn(self, game_id=None, player=None):
+        """Add up every request made in the thread inside the with block as one turn. The totals are
+        exported when the block ends and are given by the context manager."""
+        stats = Stats()
+        previous_turn = getattr(self._local, 'turn', None)
+        self._local.turn = (time.perf_counter(), stats)
+        try:
+            yield stats
+        finally:
+            started = self._local.turn[0]
+            self._local.turn = previous_turn
+            if self.enabled and self.exporters:
+                self._export(dict(stats.summary(), type='turn', game_id=game_id, player=player, time=time.time(),
+                                  duration=time.perf_counter() - started))
+
+    def _export(self, event):
+        for exporter in self.exporters:
+            exporter(event)
+
+    def snapshot(self):
+        """The totals for each method so far."""
+        with self._lock:
+            return {method: stats.summary() for method, stats in self.methods.items()}
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+
+"""Writes each event to a file as a line of JSON."""
+class FileExporter:
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            self.file.write(line)
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+#Records every request made through Core.
+default_registry = MetricsRegistry()
@@ -15,37 +15,211 @@
 #You should have received a copy of the GNU General Public License
 #along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
 
-"""This module is for processing the results from getHistory into objects."""
+"""This module is for processing the results from getHistory into objects.
+
+A move log is stored in a MoveLog, which keeps each field of every move in its own typed array
+rather than keeping an object per move. The HistoryMove classes are views of a single row of a
+MoveLog and are only created when a move is looked at."""
 
 import abc
+import array
+import codecs
+import itertools
+import json
+import logging
+import operator
+import re
+from pyFish.Odds import MAX_ATTACK_DICE, MAX_DEFEND_DICE
+
+logger = logging.getLogger(__name__)
+
+#Stored in an integer column when a move does not have that field.
+NO_VALUE = -2 ** 31
+_NO_DICE = {width: bytes(width) for width in (MAX_ATTACK_DICE, MAX_DEFEND_DICE)}
+
+#The number of characters read from a getHistory response at a time by a MoveLogReader.
+READ_SIZE = 64 * 1024
+_MOVES_START = re.compile(r'"m"\s*:\s*\[')
+_TOTAL = re.compile(r'"total"\s*:\s*"?(\d+)')
+_SEPARATORS = re.compile(r'[\s,]*')
 
-"""Abstract base class for each move in the history."""
+#The fields of a move dictionary that have a column of their own. Every other field is kept in MoveLog.extras.
+_COLUMN_FIELDS = frozenset(('a', 'id', 't', 's', 'fcid', 'cid', 'tcid', 'num', 'al', 'dl', 'ds', 'es', 'ad', 'dd'))
+
+"""The moves of a game in parallel arrays, one row per move. actions holds the action code of
+each move as a byte. Integer fields a move does not have are NO_VALUE, and unrolled dice are 0.
+Indexing a MoveLog returns HistoryMove views, and slicing it returns a list of them."""
+class MoveLog:
+    
+    def __init__(self, moves=()):
+        self.ids = array.array('q')
+        self.timestamps = array.array('q')
+        self.actions = bytearray()
+        self.player_ids = array.array('i')
+        self.from_territories = array.array('i')
+        self.to_territories = array.array('i')
+        self.units = array.array('i')
+        self.attackers_lost = array.array('i')
+        self.defenders_lost = array.array('i')
+        #The defending player of an attack, capture or card capture, or the eliminated player.
+        self.other_player_ids = array.array('i')
+        #MAX_ATTACK_DICE bytes a row, highest roll first, and MAX_DEFEND_DICE bytes a row.
+        self.attack_dice = bytearray()
+        self.defend_dice = bytearray()
+        #The rarely used fields of a move, such as the card list, as strings by row.
+        self.extras = {}
+        self.extend(moves)
+    
+    def append(self, move_dictionary):
+        """Add a move dictionary from getHistory. Returns the view of the new move, or None if the action is not known."""
+        length = len(self)
+        self.extend((move_dictionary,))
+        return self[length] if len(self) > length else None
+    
+    def extend(self, move_dictionaries):
+        #The bound methods are looked up once, as this runs for every move of every log loaded.
+        append_id, append_timestamp, append_player_id = self.ids.append, self.timestamps.append, self.player_ids.append
+        append_from, append_to, append_units = self.from_territories.append, self.to_territories.append, self.units.append
+        append_attackers_lost, append_defenders_lost = self.attackers_lost.append, self.defenders_lost.append
+        append_other_player_id = self.other_player_ids.append
+        actions, attack_dice, defend_dice = self.actions, self.attack_dice, self.defend_dice
+        for move in move_dictionaries:
+            action = move['a']
+            if action not in history_constructors:
+                logger.warning('%s is not implemented yet. %s', action, move)
+                continue
+            get = move.get
+            if len(move) > 3 and not _COLUMN_FIELDS.issuperset(move):
+                extras = {field: value for field, value in move.items() if field not in _COLUMN_FIELDS and value != ''}
+                if extras:
+                    self.extras[len(self.ids)] = extras
+            append_id(int(move['id']))
+            append_timestamp(int(move['t']))
+            actions += action.encode()
+            append_player_id(int(get('s', NO_VALUE)))
+            append_from(int(get('fcid', NO_VALUE)))
+            #The territory a capture, placement or selection is made on is kept with the territory moved to.
+            append_to(int(get('tcid') or get('cid', NO_VALUE)))
+            append_units(int(get('num', NO_VALUE)))
+            append_attackers_lost(int(get('al', NO_VALUE)))
+            append_defenders_lost(int(get('dl', NO_VALUE)))
+            append_other_player_id(int(get('ds') or get('es', NO_VALUE)))
+            if action == 'a':
+                attack_dice += _pack_dice(move['ad'], MAX_ATTACK_DICE)
+                defend_dice += _pack_dice(move['dd'], MAX_DEFEND_DICE)
+            else:
+                attack_dice += _NO_DICE[MAX_ATTACK_DICE]
+                defend_dice += _NO_DICE[MAX_DEFEND_DICE]
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('move log index out of range')
+        return history_constructors[chr(self.actions[index])](self, index)
+    
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+    
+    def rows(self, actions=None, player_id=None):
+        """The rows of the moves with one of the given action codes, such as 'ac' for attacks and
+        captures, made by the given player. Either can be left out. No views are created."""
+        if actions is None:
+            rows = range(len(self))
+        else:
+            rows = sorted(itertools.chain.from_iterable(self._rows_with_action(ord(action)) for action in actions))
+        if player_id is None:
+            return list(rows)
+        if actions is None:
+            return list(itertools.compress(rows, map(operator.eq, self.player_ids, itertools.repeat(player_id))))
+        return [row for row in rows if self.player_ids[row] == player_id]
+    
+    def _rows_with_action(self, action):
+        row = self.actions.find(action)
+        while row != -1:
+            yield row
+            row = self.actions.find(action, row + 1)
+    
+    def filter(self, actions=None, player_id=None):
+        """Views of the moves rows would return."""
+        return (self[row] for row in self.rows(actions, player_id))
+    
+    def count(self, action):
+        return self.actions.count(ord(action))
+
+def _pack_dice(dice, width):
+    if not dice:
+        return _NO_DICE[width]
+    rolls = [int(roll) for roll in dice.split(',')][:width]
+    return bytes(rolls + [0] * (width - len(rolls)))
+
+def _integer_field(column):
+    def get(self):
+        value = getattr(self.log, column)[self.row]
+        return None if value == NO_VALUE else value
+    return property(get)
+
+def _territory_field(column):
+    """Territory ids are given as strings, the same as the keys of Map.territories."""
+    def get(self):
+        value = getattr(self.log, column)[self.row]
+        return None if value == NO_VALUE else str(value)
+    return property(get)
+
+def _dice_field(column, width):
+    def get(self):
+        dice = getattr(self.log, column)[self.row * width:(self.row + 1) * width]
+        return tuple(roll for roll in dice if roll)
+    return property(get)
+
+def _extra_field(field):
+    return property(lambda self: self.log.extras.get(self.row, {}).get(field))
+
+"""Abstract base class for each move in the history. A move is a view of one row of a MoveLog."""
 class HistoryMove(metaclass=abc.ABCMeta):
     
-    @abc.abstractmethod
-    def __init__(self, id, unix_timestamp, player_id):
-        self.id = id
-        self.unix_timestamp = unix_timestamp
-        self.player_id = player_id
+    __slots__ = ('log', 'row')
+    
+    def __init__(self, log, row):
+        self.log = log
+        self.row = row
+    
+    @classmethod
+    def from_dictionary(cls, history_move_dictionary):
+        """The view of a single move dictionary from getHistory, in a MoveLog of its own."""
+        return MoveLog().append(history_move_dictionary)
+    
+    id = property(lambda self: self.log.ids[self.row])
+    unix_timestamp = property(lambda self: self.log.timestamps[self.row])
+    player_id = _integer_field('player_ids')
     
     @abc.abstractproperty
     def result_id(self):
         """The id of the move as it appears when getting the history."""
         raise NotImplementedError()
     
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__, self.id)
+    
 """The results from a past attack."""
 class AttackHistoryMove(HistoryMove):
-
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.border_mods = history_move_dictionary['m'] #m stands for border_mod, but I have no idea what that means
-        self.attackers_lost = history_move_dictionary['al']
-        self.defenders_lost = history_move_dictionary['dl']
-        self.from_territory_id = history_move_dictionary['fcid']
-        self.to_territory_id = history_move_dictionary['tcid']
-        self.attack_dice = history_move_dictionary['ad']
-        self.defend_dice = history_move_dictionary['dd']
-        self.defending_player_id = history_move_dictionary['ds']
+    
+    __slots__ = ()
+    
+    border_mods = _extra_field('m') #m stands for border_mod, but I have no idea what that means
+    attackers_lost = _integer_field('attackers_lost')
+    defenders_lost = _integer_field('defenders_lost')
+    from_territory_id = _territory_field('from_territories')
+    to_territory_id = _territory_field('to_territories')
+    attack_dice = _dice_field('attack_dice', MAX_ATTACK_DICE)
+    defend_dice = _dice_field('defend_dice', MAX_DEFEND_DICE)
+    defending_player_id = _integer_field('other_player_ids')
         
     @property
     def result_id(self):
@@ -54,10 +228,10 @@ class AttackHistoryMove(HistoryMove):
 """Describes a territory being captured."""
 class CaptureHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.captured_territory_id = history_move_dictionary['cid']
-        self.captured_player_id = history_move_dictionary['ds']
+    __slots__ = ()
+    
+    captured_territory_id = _territory_field('to_territories')
+    captured_player_id = _integer_field('other_player_ids')
 
     @property
     def result_id(self):
@@ -66,9 +240,9 @@ class CaptureHistoryMove(HistoryMove):
 """Describes a player being eliminated."""
 class EliminatePlayerHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.eliminated_player_id = history_move_dictionary['es']
+    __slots__ = ()
+    
+    eliminated_player_id = _integer_field('other_player_ids')
 
     @property
     def result_id(self):
@@ -77,9 +251,9 @@ class EliminatePlayerHistoryMove(HistoryMove):
 """Describes a new game that is created."""
 class CreateNewGameHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.log_version = history_move_dictionary['logver']
+    __slots__ = ()
+    
+    log_version = _extra_field('logver')
         
     @property
     def result_id(self):
@@ -88,8 +262,7 @@ class CreateNewGameHistoryMove(HistoryMove):
 """Move for when a user joins a game."""
 class JoinGameHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
+    __slots__ = ()
         
     @property
     def result_id(self):
@@ -98,8 +271,7 @@ class JoinGameHistoryMove(HistoryMove):
 """Assigns a player a seat position."""
 class AssignSeatPositionHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
+    __slots__ = ()
         
     @property
     def result_id(self):
@@ -108,8 +280,7 @@ class AssignSeatPositionHistoryMove(HistoryMove):
 """Start the Game"""
 class StartGameHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], None)
+    __slots__ = ()
         
     @property
     def result_id(self):
@@ -118,8 +289,10 @@ class StartGameHistoryMove(HistoryMove):
 """Territory selected as a neutral territory."""
 class NeutralTerritorySelectHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
+    __slots__ = ()
+    
+    territory_id = _territory_field('to_territories')
+    num_units = _integer_field('units')
         
     @property
     def result_id(self):
@@ -128,9 +301,9 @@ class NeutralTerritorySelectHistoryMove(HistoryMove):
 """Bonus units received."""
 class BonusUnitsHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.bonus_units = history_move_dictionary['num']
+    __slots__ = ()
+    
+    bonus_units = _integer_field('units')
         
     @property
     def result_id(self):
@@ -139,9 +312,9 @@ class BonusUnitsHistoryMove(HistoryMove):
 """A territory was selected."""
 class SelectTerritoryHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.territory_id = history_move_dictionary['cid']
+    __slots__ = ()
+    
+    territory_id = _territory_field('to_territories')
         
     @property
     def result_id(self):
@@ -150,10 +323,10 @@ class SelectTerritoryHistoryMove(HistoryMove):
 """Units were placed on a territory."""
 class PlaceUnitHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.territory_id = history_move_dictionary['cid']
-        self.num_units = history_move_dictionary['num']
+    __slots__ = ()
+    
+    territory_id = _territory_field('to_territories')
+    num_units = _integer_field('units')
         
     @property
     def result_id(self):
@@ -161,12 +334,12 @@ class PlaceUnitHistoryMove(HistoryMove):
 
 """Units were transferred."""
 class TransferHistoryMove(HistoryMove):
-
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.from_territory_id = history_move_dictionary['fcid']
-        self.to_territory_id = history_move_dictionary['tcid']
-        self.num_units = history_move_dictionary['num']
+    
+    __slots__ = ()
+    
+    from_territory_id = _territory_field('from_territories')
+    to_territory_id = _territory_field('to_territories')
+    num_units = _integer_field('units')
         
     @property
     def result_id(self):
@@ -174,10 +347,10 @@ class TransferHistoryMove(HistoryMove):
 
 """A card was awarded at the end of a turn."""
 class AwardedCardHistoryMove(HistoryMove):
-
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.card_id = history_move_dictionary['clist']
+    
+    __slots__ = ()
+    
+    card_id = _extra_field('clist')
         
     @property
     def result_id(self):
@@ -186,10 +359,10 @@ class AwardedCardHistoryMove(HistoryMove):
 """A set of cards was turned in."""
 class UseCardsHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.used_cards = history_move_dictionary['clist']
-        self.awarded_units = history_move_dictionary['num']
+    __slots__ = ()
+    
+    used_cards = _extra_field('clist')
+    awarded_units = _integer_field('units')
         
     @property
     def result_id(self):
@@ -198,11 +371,11 @@ class UseCardsHistoryMove(HistoryMove):
 """Cards were captured from a player."""
 class CaptureCardsHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
-        self.used_cards = history_move_dictionary['clist']
-        self.number_of_cards = history_move_dictionary['num']
-        self.cards_captured_from_id = history_move_dictionary['ds']
+    __slots__ = ()
+    
+    used_cards = _extra_field('clist')
+    number_of_cards = _integer_field('units')
+    cards_captured_from_id = _integer_field('other_player_ids')
         
     @property
     def result_id(self):
@@ -211,8 +384,7 @@ class CaptureCardsHistoryMove(HistoryMove):
 """The game was won."""
 class WinHistoryMove(HistoryMove):
     
-    def __init__(self, history_move_dictionary):
-        super().__init__(history_move_dictionary['id'], history_move_dictionary['t'], history_move_dictionary['s'])
+    __slots__ = ()
         
     @property
     def result_id(self):
@@ -235,16 +407,84 @@ history_constructors = dict(a=AttackHistoryMove,
                             y=NeutralTerritorySelectHistoryMove,
                             z=BonusUnitsHistoryMove)
 
-"""Turn the move history from the Warfish api call into a dictionary of move HistoryMove objects."""
+"""Reads the moves of a getHistory response from a binary file one at a time, so the response
+does not have to be held in memory to be decoded. Iterating gives each move dictionary as soon as
+it has been read. total is the total number of moves in the game, once iterating has started if
+it comes before the move array, or once the moves have all been read if it follows it.
+A response without a move array, such as a failure or an empty log, is decoded whole and kept in
+response."""
+class MoveLogReader:
+    
+    def __init__(self, stream, chunk_size=READ_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.total = None
+        self.response = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+    
+    def _read(self):
+        chunk = self.stream.read(self.chunk_size)
+        return self._decoder.decode(chunk, final=not chunk)
+    
+    def __iter__(self):
+        buffer = ''
+        while True:
+            match = _MOVES_START.search(buffer)
+            if match:
+                break
+            chunk = self._read()
+            if not chunk:
+                self.response = json.loads(buffer)
+                movelog = self.response.get('_content', {}).get('movelog', {})
+                self.total = int(movelog['total']) if 'total' in movelog else None
+                return
+            buffer += chunk
+        total = _TOTAL.search(buffer, 0, match.start())
+        self.total = int(total.group(1)) if total else None
+        
+        decode = json.JSONDecoder().raw_decode
+        position = match.end()
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    break
+                try:
+                    move, position = decode(buffer, position)
+                    yield move
+                    continue
+                except ValueError:
+                    #The move has only been partly read.
+                    pass
+            chunk = self._read()
+            if not chunk:
+                raise ValueError('The getHistory response ended in the middle of the move log.')
+            buffer = buffer[position:] + chunk
+            position = 0
+        #Read the rest of the response so the connection it came from can be reused. The total
+        #is looked for in it too, as nothing stops it from following the move array.
+        rest = [buffer[position:]]
+        chunk = self._read()
+        while chunk:
+            rest.append(chunk)
+            chunk = self._read()
+        if self.total is None:
+            total = _TOTAL.search(''.join(rest))
+            self.total = int(total.group(1)) if total else None
+
+"""Turn the move history from the Warfish api call into a MoveLog of the moves."""
 def process_history(move_dictionary):
-    """Process a dictionary of moves returned by making the getHistory Warfish API call."""
-    history = []
-    for item in move_dictionary:
-        try:
-            history.append(history_constructors[item['a']](item))
-        except KeyError:
-            print('{0} is not implemented yet. {1}'.format(item['a'], item))
-    return history
+    """Process a list of move dictionaries returned by making the getHistory Warfish API call. A
+    MoveLog, such as the one a HistoryCache holds, is returned as it is."""
+    return move_dictionary if isinstance(move_dictionary, MoveLog) else MoveLog(move_dictionary)
+
+def iterate_history(stream):
+    """Yield a HistoryMove for each move of the getHistory response read from a binary file. Each
+    move is in a MoveLog of its own, so only the moves the caller keeps stay in memory."""
+    for move_dictionary in MoveLogReader(stream):
+        move = HistoryMove.from_dictionary(move_dictionary)
+        if move is not None:
+            yield move
         
 if __name__ == "__main__":
     import doctest
@@ -18,49 +18,104 @@
 """This module provides classes for the results of moves."""
 
 import abc
+import logging
+
+logger = logging.getLogger(__name__)
+
+#The order card types are listed in when a player's hand is given.
+CARD_TYPES = ('A', 'B', 'C', 'W')
 
 class MoveResult(metaclass=abc.ABCMeta):
     
     @abc.abstractmethod
     def __init__(self, move_result_dictionary):
-        print(move_result_dictionary)
+        logger.debug('Move result %s', move_result_dictionary)
+        content = move_result_dictionary['_content']['return']['_content']
         self.result_code = move_result_dictionary['_content']['return']['code']
         self.result_message = move_result_dictionary['_content']['return']['msg']
         self.possible_actions = []
-        for action in move_result_dictionary['_content']['return']['_content']['possibleactions']['_content']['action']:
+        possible_actions = content.get('possibleactions', {})
+        for action in possible_actions.get('_content', {}).get('action', []):
             self.possible_actions.append(action['id'])
+        self.lastmod = possible_actions.get('lastmod')
+        #The player and card information Warfish sends back with every move.
+        self.player_infos = content['pinfo']['_content']['player'] if 'pinfo' in content else []
+        self.card_info = content.get('cinfo')
+        self.player_id = content['pinfo']['_content']['self']['playerid'] if 'pinfo' in content else None
        
-    @abc.abstractmethod
     def update_game_state(self, game):
-        raise NotImplementedError()
+        """Update the players, their cards and the possible actions from the move result. Subclasses
+        also update the board."""
+        for player_info in self.player_infos:
+            player = game.players.get(player_info['id'])
+            if player is None:
+                continue
+            player.is_turn = int(player_info['isturn']) != 0
+            player.active = int(player_info['active']) != 0
+            if player_info['units'] != '?':
+                player.reserve_units = int(player_info['units'])
+        if self.card_info:
+            for card_count in self.card_info['_content']['player']:
+                if card_count['id'] in game.players:
+                    game.players[card_count['id']].number_of_cards = int(card_count['num'])
+            hand = self.card_info['_content'].get('self')
+            if hand and self.player_id in game.players:
+                game.players[self.player_id].cards = tuple(card_type for card_type in CARD_TYPES for _ in range(int(hand.get('num' + card_type, 0))))
+            game.rules.next_cards_worth = self.card_info['nextcardsworth'].split(',')
+            game.rules.card_sets_traded = self.card_info['cardsetstraded']
+        game.possible_actions = list(self.possible_actions)
+        if self.lastmod is not None:
+            game.lastmod = self.lastmod
 
 class AttackMoveResult(MoveResult):
     
     def __init__(self, move_result_dictionary, attack_move):
         """Takes the results from the given attack move and creates a result object."""
         super().__init__(move_result_dictionary)
-        self.attackers_lost = int(move_result_dictionary['_content']['return']['_content']['results']['totalattackerlosses'])
-        self.defenders_lost = int(move_result_dictionary['_content']['return']['_content']['results']['totaldefenderlosses'])
-        if 'captured' in move_result_dictionary['_content']['return']['_content']['results']:
-            self.captured = move_result_dictionary['_content']['return']['_content']['results']['captured'] != '0'
+        content = move_result_dictionary['_content']['return']['_content']
+        self.attackers_lost = int(content['results']['totalattackerlosses'])
+        self.defenders_lost = int(content['results']['totaldefenderlosses'])
+        if 'captured' in content['results']:
+            self.captured = content['results']['captured'] != '0'
         else:
             self.captured = False
-        if 'eliminate' in move_result_dictionary['_content']['return']['_content']['results']:
-            self.defender_eliminated  = move_result_dictionary['_content']['return']['_content']['results']['eliminate'] != '0'
+        if 'eliminate' in content['results']:
+            self.defender_eliminated  = content['results']['eliminate'] != '0'
         else:
             self.defender_eliminated = False
         self.from_territory = attack_move.from_territory
         self.to_territory = attack_move.to_territory
         self.defending_player = attack_move.to_territory.owner
+        #The units on the defending territory before the attack as Warfish saw them, if it said.
+        self.defending_units = int(content['info']['defenderunits']) if 'info' in content else None
+        self.defending_player_id = content['info']['defenderseatid'] if 'info' in content else None
+        #Each roll of the attack as (attack dice, defend dice, attacker losses, defender losses, defenders left).
+        self.rolls = [(tuple(int(die) for die in roll['attackdice'].split(',')),
+                       tuple(int(die) for die in roll['defenddice'].split(',')),
+                       int(roll['attackerlosses']), int(roll['defenderlosses']), int(roll['defenderleft']))
+                      for roll in content.get('attack', [])]
     
     def update_game_state(self, game):
         """Update the game state from the attack. This involves updating the army counts and updating
-        the defending territory owner if it was captured."""
+        the defending territory owner if it was captured. The defender is taken from the attack info
+        and the defenders left from the last roll, so the board is right even if the defending
+        territory had changed since it was last seen."""
+        super().update_game_state(game)
+        if self.defending_player_id is not None:
+            self.defending_player = game.players.get(self.defending_player_id)
         self.from_territory.armies -= self.attackers_lost
-        self.to_territory.armies -= self.defenders_lost
+        if self.rolls:
+            self.to_territory.armies = self.rolls[-1][4]
+        elif self.defending_units is not None:
+            self.to_territory.armies = self.defending_units - self.defenders_lost
+        else:
+            self.to_territory.armies -= self.defenders_lost
         
         if self.captured:
+            if self.to_territory in getattr(self.defending_player, 'territories', ()):
+                self.defending_player.territories.remove(self.to_territory)
             self.to_territory.owner = self.from_territory.owner
+            self.to_territory.owner.territories.append(self.to_territory)
             
             if 'freetransfer' in self.possible_actions:
                 self.from_territory.armies = self.from_territory.armies - 3
@@ -69,7 +124,7 @@ class AttackMoveResult(MoveResult):
                 self.to_territory.armies = self.from_territory.armies - 1 
                 self.from_territory.armies = 1
                 
-            if self.defender_eliminated:
+            if self.defender_eliminated and self.defending_player:
                 self.defending_player.active = False
                  
 
@@ -81,6 +136,7 @@ class PlaceUnitsMoveResult(MoveResult):
         
     def update_game_state(self, game):
         """Update the board state by updating the number of armies on each territory after placing."""
+        super().update_game_state(game)
         for territory, armies in self.territories_dict.items():
             territory.armies += armies
 
@@ -91,6 +147,7 @@ class FreeTransferMoveResult(MoveResult):
         self.moved_units = free_transfer_move.number_of_armies
         
     def update_game_state(self, game):
+        super().update_game_state(game)
         #The last move should be an attack move. If the last move is None then that means
         #the bot was started on the free transfer phase and does not have enough information
         #to update the board state.
@@ -98,9 +155,29 @@ class FreeTransferMoveResult(MoveResult):
             game.last_move.from_territory.armies -= self.moved_units
             game.last_move.to_territory.armies += self.moved_units
 
+class TransferMoveResult(MoveResult):
+    
+    def __init__(self, move_result_dictionary, transfer_move):
+        super().__init__(move_result_dictionary)
+        self.from_territory = transfer_move.from_territory
+        self.to_territory = transfer_move.to_territory
+        self.moved_units = transfer_move.number_of_units
+        
+    def update_game_state(self, game):
+        super().update_game_state(game)
+        self.from_territory.armies -= self.moved_units
+        self.to_territory.armies += self.moved_units
+
+class EndTurnMoveResult(MoveResult):
+    
+    def __init__(self, move_result_dictionary, end_turn_move):
+        super().__init__(move_result_dictionary)
+
 move_result_constructors = dict(attack=AttackMoveResult,
+                                endturn=EndTurnMoveResult,
                                 placeunits=PlaceUnitsMoveResult,
-                                freetransfer=FreeTransferMoveResult) 
+                                freetransfer=FreeTransferMoveResult,
+                                transfer=TransferMoveResult) 
 
 def process_move_result(move_result_dictionary, move, game):
     """After taking a move Warfish returns information about that move as json. This takes
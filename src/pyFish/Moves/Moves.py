@@ -48,7 +48,7 @@ class PlaceUnitsMove:
     
     def to_query_string(self):
         query_string = '&action={0}'.format(self.action_id)
-        territory_ids = {territory.id for territory in self.territory_dict.keys()}
+        territory_ids = [territory.id for territory in self.territory_dict.keys()]
         query_string += '&clist={0}'.format(','.join(territory_ids)) + '&ulist={0}'.format(','.join([str(value) for value in self.territory_dict.values()]))
         return query_string
 
@@ -66,6 +66,21 @@ class FreeTransferMove:
     def to_query_string(self):
         return '&action={0}&numunits={1}'.format(self.action_id, self.number_of_armies)
 
+"""Move units between two of your own territories that border each other, in the transfer phase of a turn."""
+class TransferMove:
+    
+    def __init__(self, from_territory, to_territory, number_of_units):
+        self.from_territory = from_territory
+        self.to_territory = to_territory
+        self.number_of_units = number_of_units
+    
+    @property
+    def action_id(self):
+        return 'transfer'
+    
+    def to_query_string(self):
+        return '&action={0}&fromcid={1}&tocid={2}&numunits={3}'.format(self.action_id, self.from_territory.id, self.to_territory.id, self.number_of_units)
+
 """Ends your turn."""
 class EndTurnMove:
     
@@ -0,0 +1,281 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module calculates the exact odds of a continuous attack. The odds for every pair of
+attacking and defending unit counts are worked out once per set of dice rules and kept in
+memory, and optionally on disk, so looking one up does not need any calculation. The chances
+of winning and the expected losses of larger armies are worked out the first time they are asked
+for, so a large stack is never treated as a smaller one.
+
+>>> odds = BattleOdds(6, 6, max_units=10)
+>>> round(odds.win_probability(3, 2), 4)
+0.656
+>>> round(odds.win_probability(10, 1) + odds.lose_probability(10, 1), 4)
+1.0
+>>> round(odds.win_probability(9, 30), 4) == round(BattleOdds(6, 6, max_units=30).win_probability(9, 30), 4)
+True"""
+
+import array
+import itertools
+import os
+import threading
+
+#The most dice each side can roll in one round of an attack.
+MAX_ATTACK_DICE = 3
+MAX_DEFEND_DICE = 2
+#The largest number of attacking or defending units tables are built for by default.
+DEFAULT_MAX_UNITS = 100
+#The chances of winning and expected losses are extended by at least this many units a side at a time.
+GROWTH = 64
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def odds_for_rules(rules, max_units=DEFAULT_MAX_UNITS, cache_directory=None):
+    """Return the BattleOdds for the dice of a Rules object. Tables are shared by every game
+    with the same dice, and are read from and saved to cache_directory if it is given."""
+    return odds_for_dice(int(rules.attack_die_sides), int(rules.defend_die_sides), max_units, cache_directory)
+
+def install(odds):
+    """Share a BattleOdds with every later game in this process with the same dice. A process pool
+    can pass it as the initializer of its workers, with a table from the parent process, so the
+    workers do not each build the table again."""
+    with _tables_lock:
+        _tables.setdefault((odds.attack_die_sides, odds.defend_die_sides, odds.max_units), odds)
+
+def odds_for_dice(attack_die_sides, defend_die_sides, max_units=DEFAULT_MAX_UNITS, cache_directory=None):
+    key = (attack_die_sides, defend_die_sides, max_units)
+    with _tables_lock:
+        odds = _tables.get(key)
+        if odds is None:
+            odds = BattleOdds.load(cache_directory, *key) if cache_directory else None
+            if odds is None:
+                odds = BattleOdds(*key)
+                if cache_directory:
+                    odds.save(cache_directory)
+            _tables[key] = odds
+        return odds
+
+"""The outcome of a continuous attack by a number of attacking units on a number of defending
+units, for every pair up to max_units. An attack goes on until one side has no units left.
+win_probability, lose_probability and expected_losses extend their tables to larger armies as
+they are asked about them; outcome_distribution is only kept up to max_units."""
+class BattleOdds:
+
+    def __init__(self, attack_die_sides=6, defend_die_sides=6, max_units=DEFAULT_MAX_UNITS, outcomes=None):
+        self.attack_die_sides = attack_die_sides
+        self.defend_die_sides = defend_die_sides
+        self.max_units = max_units
+        self.round_odds = {(attack_dice, defend_dice): _round_odds(attack_die_sides, defend_die_sides, attack_dice, defend_dice)
+                           for attack_dice in range(1, MAX_ATTACK_DICE + 1) for defend_dice in range(1, MAX_DEFEND_DICE + 1)}
+        #The outcomes of the attack of a units on d units are stored at offsets[a * (max_units + 1) + d].
+        #The first a values are the chances the attacker wins with 1 to a units left and the next d
+        #are the chances the defender holds with 1 to d units left.
+        self.offsets = array.array('q', [0])
+        for attackers in range(max_units + 1):
+            for defenders in range(max_units + 1):
+                self.offsets.append(self.offsets[-1] + attackers + defenders)
+        self.outcomes = outcomes if outcomes is not None else self._calculate()
+        size = (max_units + 1) ** 2
+        wins = array.array('d', bytes(8 * size))
+        expected_attacker_losses = array.array('d', bytes(8 * size))
+        expected_defender_losses = array.array('d', bytes(8 * size))
+        for attackers in range(max_units + 1):
+            for defenders in range(max_units + 1):
+                position = attackers * (max_units + 1) + defenders
+                start = self.offsets[position]
+                attacker_left = self.outcomes[start:start + attackers]
+                defender_left = self.outcomes[start + attackers:start + attackers + defenders]
+                wins[position] = sum(attacker_left)
+                expected_attacker_losses[position] = attackers - sum(left * chance for left, chance in enumerate(attacker_left, 1))
+                expected_defender_losses[position] = defenders - sum(left * chance for left, chance in enumerate(defender_left, 1))
+        #The attacker rows and defender columns of the tables, and the chance of winning and the
+        #expected losses of each side at attackers * columns + defenders. They are replaced together
+        #when they grow, so a thread reading them never sees a mix of sizes.
+        self.totals = (max_units + 1, max_units + 1, wins, expected_attacker_losses, expected_defender_losses)
+        self._growing = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_growing']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._growing = threading.Lock()
+
+    def _calculate(self):
+        size = self.max_units + 1
+        outcomes = {}
+        for attackers in range(size):
+            for defenders in range(size):
+                if attackers == 0 or defenders == 0:
+                    outcome = [0.0] * (attackers + defenders)
+                    if outcome:
+                        outcome[-1] = 1.0
+                    outcomes[attackers, defenders] = outcome
+                    continue
+                attack_dice = min(MAX_ATTACK_DICE, attackers)
+                defend_dice = min(MAX_DEFEND_DICE, defenders)
+                attacker_wins = [0.0] * attackers
+                defender_holds = [0.0] * defenders
+                for attacker_losses, chance in enumerate(self.round_odds[attack_dice, defend_dice]):
+                    if chance == 0:
+                        continue
+                    next_attackers = attackers - attacker_losses
+                    next_defenders = defenders - (min(attack_dice, defend_dice) - attacker_losses)
+                    next_outcome = outcomes[next_attackers, next_defenders]
+                    for left in range(next_attackers):
+                        attacker_wins[left] += chance * next_outcome[left]
+                    for left in range(next_defenders):
+                        defender_holds[left] += chance * next_outcome[next_attackers + left]
+                outcomes[attackers, defenders] = attacker_wins + defender_holds
+        values = array.array('d')
+        for attackers in range(size):
+            for defenders in range(size):
+                values.extend(outcomes[attackers, defenders])
+        return values
+
+    def _totals(self, attackers, defenders):
+        """The totals tables, grown to hold the armies if they do not yet, and the position of the armies in them."""
+        if attackers < 0 or defenders < 0:
+            raise ValueError('Unit counts can not be negative.')
+        totals = self.totals
+        if attackers >= totals[0] or defenders >= totals[1]:
+            totals = self._grow(attackers + 1, defenders + 1)
+        return totals, attackers * totals[1] + defenders
+
+    def _grow(self, rows, columns):
+        """Extend the totals tables to at least rows attackers and columns defenders, working the new
+        entries out from the smaller armies each round of the attack can leave."""
+        with self._growing:
+            old_rows, old_columns, old_wins, old_attacker_losses, old_defender_losses = self.totals
+            if rows <= old_rows and columns <= old_columns:
+                return self.totals
+            rows = rows + GROWTH if rows > old_rows else old_rows
+            columns = columns + GROWTH if columns > old_columns else old_columns
+            wins = array.array('d', bytes(8 * rows * columns))
+            attacker_losses = array.array('d', bytes(8 * rows * columns))
+            defender_losses = array.array('d', bytes(8 * rows * columns))
+            for attackers in range(rows):
+                for defenders in range(columns):
+                    position = attackers * columns + defenders
+                    if attackers < old_rows and defenders < old_columns:
+                        old_position = attackers * old_columns + defenders
+                        wins[position] = old_wins[old_position]
+                        attacker_losses[position] = old_attacker_losses[old_position]
+                        defender_losses[position] = old_defender_losses[old_position]
+                        continue
+                    if attackers == 0 or defenders == 0:
+                        wins[position] = 1.0 if attackers else 0.0
+                        continue
+                    attack_dice = min(MAX_ATTACK_DICE, attackers)
+                    defend_dice = min(MAX_DEFEND_DICE, defenders)
+                    compared = min(attack_dice, defend_dice)
+                    win = attacker_lost = defender_lost = 0.0
+                    for attacker_losses_this_round, chance in enumerate(self.round_odds[attack_dice, defend_dice]):
+                        if chance == 0:
+                            continue
+                        defender_losses_this_round = compared - attacker_losses_this_round
+                        next_position = (attackers - attacker_losses_this_round) * columns + defenders - defender_losses_this_round
+                        win += chance * wins[next_position]
+                        attacker_lost += chance * (attacker_losses_this_round + attacker_losses[next_position])
+                        defender_lost += chance * (defender_losses_this_round + defender_losses[next_position])
+                    wins[position] = win
+                    attacker_losses[position] = attacker_lost
+                    defender_losses[position] = defender_lost
+            self.totals = (rows, columns, wins, attacker_losses, defender_losses)
+            return self.totals
+
+    def win_probability(self, attackers, defenders):
+        """The chance that attackers units capture a territory held by defenders units."""
+        totals, position = self._totals(attackers, defenders)
+        return totals[2][position]
+
+    def lose_probability(self, attackers, defenders):
+        return 1.0 - self.win_probability(attackers, defenders) if defenders else 0.0
+
+    def expected_losses(self, attackers, defenders):
+        """The number of units each side can expect to lose, as an (attacker, defender) tuple."""
+        totals, position = self._totals(attackers, defenders)
+        return totals[3][position], totals[4][position]
+
+    def outcome_distribution(self, attackers, defenders):
+        """Two lists: the chances the attacker wins with 1, 2, ... attackers units left and the
+        chances the defender holds with 1, 2, ... defenders units left. Armies of more than
+        max_units raise a ValueError, as only the totals are kept for them."""
+        if attackers < 0 or defenders < 0:
+            raise ValueError('Unit counts can not be negative.')
+        if attackers > self.max_units or defenders > self.max_units:
+            raise ValueError('Outcomes are only kept for armies of up to {0} units.'.format(self.max_units))
+        start = self.offsets[attackers * (self.max_units + 1) + defenders]
+        return (self.outcomes[start:start + attackers].tolist(),
+                self.outcomes[start + attackers:start + attackers + defenders].tolist())
+
+    @staticmethod
+    def path(directory, attack_die_sides, defend_die_sides, max_units):
+        return os.path.join(directory, 'odds-{0}-{1}-{2}-{3}-{4}.bin'.format(attack_die_sides, defend_die_sides,
+                                                                               MAX_ATTACK_DICE, MAX_DEFEND_DICE, max_units))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory, self.attack_die_sides, self.defend_die_sides, self.max_units)
+        temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as odds_file:
+            self.outcomes.tofile(odds_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, directory, attack_die_sides, defend_die_sides, max_units=DEFAULT_MAX_UNITS):
+        """Read a table saved by save, or return None if there is not one."""
+        path = cls.path(directory, attack_die_sides, defend_die_sides, max_units)
+        outcomes = array.array('d')
+        try:
+            with open(path, 'rb') as odds_file:
+                outcomes.frombytes(odds_file.read())
+        except FileNotFoundError:
+            return None
+        expected_length = sum(attackers + defenders for attackers in range(max_units + 1) for defenders in range(max_units + 1))
+        if len(outcomes) != expected_length:
+            return None
+        return cls(attack_die_sides, defend_die_sides, max_units, outcomes)
+
+def _round_odds(attack_die_sides, defend_die_sides, attack_dice, defend_dice):
+    """The chances of the attacker losing 0, 1, ... units in one round. The highest dice are
+    compared in pairs and the defender wins ties."""
+    comparisons = min(attack_dice, defend_dice)
+    attack_rolls = _top_dice(attack_die_sides, attack_dice, comparisons)
+    defend_rolls = _top_dice(defend_die_sides, defend_dice, comparisons)
+    total = (attack_die_sides ** attack_dice) * (defend_die_sides ** defend_dice)
+    losses = [0] * (comparisons + 1)
+    for attack_roll, attack_count in attack_rolls.items():
+        for defend_roll, defend_count in defend_rolls.items():
+            attacker_losses = sum(1 for attack_die, defend_die in zip(attack_roll, defend_roll) if attack_die <= defend_die)
+            losses[attacker_losses] += attack_count * defend_count
+    return [count / total for count in losses]
+
+def _top_dice(sides, dice, keep):
+    """How many ways each combination of the highest keep dice can be rolled."""
+    counts = {}
+    for roll in itertools.product(range(1, sides + 1), repeat=dice):
+        top = tuple(sorted(roll, reverse=True)[:keep])
+        counts[top] = counts.get(top, 0) + 1
+    return counts
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,167 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Plays many games from one process. An Orchestrator is given a bot class, like RandomBot or
+ContinentBot, and the games to play, and keeps one bot, and so one Game, for each game for as
+long as it runs. Each game is polled with Game.refresh, which costs a single small request while
+nothing has changed, and whenever it is our turn the bot's take_turn is run.
+
+The games are scheduled on an asyncio event loop, but the requests themselves are not
+non-blocking. The bots and Core make blocking requests through a transport, and making them
+asynchronous would mean rewriting every bot, so each poll and each turn runs on a thread from a
+fixed pool and the loop only waits for them. Each bot is given a LimitedTransport, so no more
+than max_in_flight requests are ever sent at once, however many games are being played. The
+shared default transport is left alone.
+
+    python -m pyFish.Orchestrator --bot ContinentBot --games games.json --max-in-flight 16
+
+where games.json is a list of objects with the game_id, player_name and cookie of each game."""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pyFish import Metrics, Transport
+
+#Seconds between polls of a game while it is not our turn.
+DEFAULT_POLL_INTERVAL = 60
+DEFAULT_MAX_IN_FLIGHT = 16
+
+logger = logging.getLogger(__name__)
+
+"""Wraps another transport so that no more than max_in_flight requests are sent through it at
+once. Requests over the limit wait for one of the others to finish."""
+class LimitedTransport:
+
+    def __init__(self, transport, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.transport = transport
+        self.max_in_flight = max_in_flight
+        self._available = threading.BoundedSemaphore(max_in_flight)
+
+    def get(self, url, headers=None):
+        with self._available:
+            return self.transport.get(url, headers)
+
+    @contextlib.contextmanager
+    def open(self, url, headers=None):
+        #A streamed response holds its request until the body has been read.
+        with self._available:
+            with Transport.open_url(self.transport, url, headers) as body:
+                yield body
+
+"""A game the orchestrator plays, with the bot playing it once it has been created."""
+class GameEntry:
+
+    def __init__(self, game_id, player_name, cookie):
+        self.game_id = game_id
+        self.player_name = player_name
+        self.cookie = cookie
+        self.bot = None
+        self.turns = 0
+        self.finished = False
+
+class Orchestrator:
+
+    def __init__(self, bot_class, games, transport=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 poll_interval=DEFAULT_POLL_INTERVAL, max_workers=None):
+        """games is a list of (game_id, player_name, cookie). Requests are sent with the given
+        transport, or a new HTTPTransport with a pool of max_in_flight connections if there is none,
+        and it is passed to each bot as its transport argument, like the bots in this package take.
+        A transport that is given keeps its own limits, so an HTTPTransport with a smaller pool_size
+        than max_in_flight sends no more than pool_size requests to a host at once. max_workers is the number of
+        threads polls and turns run on, by default twice max_in_flight so threads busy thinking
+        do not leave the request limit unused."""
+        self.bot_class = bot_class
+        self.games = [GameEntry(*game) for game in games]
+        self.transport = LimitedTransport(transport or Transport.HTTPTransport(pool_size=max_in_flight), max_in_flight)
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers or 2 * max_in_flight
+        self._stopping = None
+
+    async def run(self):
+        """Play every game until each one is over or stop is called."""
+        self._stopping = asyncio.Event()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pyFish-game')
+        try:
+            await asyncio.gather(*(self._play(entry, executor) for entry in self.games))
+        finally:
+            executor.shutdown(wait=True)
+
+    def stop(self):
+        """Stop polling. Turns that have started are played to the end."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _play(self, entry, executor):
+        loop = asyncio.get_running_loop()
+        #Polls are spread out so games added together are not all polled at the same moment.
+        await self._wait(random.uniform(0, self.poll_interval))
+        while not entry.finished and not self._stopping.is_set():
+            try:
+                await loop.run_in_executor(executor, self._poll, entry)
+            except Exception:
+                logger.exception('Game %s could not be played', entry.game_id)
+            if not entry.finished:
+                await self._wait(self.poll_interval)
+
+    async def _wait(self, seconds):
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+
+    def _poll(self, entry):
+        """Bring the game up to date and play a turn if it is ours. Runs on a worker thread."""
+        if entry.bot is None:
+            entry.bot = self.bot_class(entry.game_id, entry.player_name, entry.cookie, transport=self.transport)
+        else:
+            entry.bot.game.refresh()
+        game, player = entry.bot.game, entry.bot.player
+        if not player.active or not any(other.active for other in game.players.values() if other is not player):
+            logger.info('Game %s is over after %d turns', entry.game_id, entry.turns)
+            entry.finished = True
+            return
+        if game.possible_actions:
+            with Metrics.default_registry.turn(entry.game_id, player.id):
+                entry.bot.take_turn()
+            entry.turns += 1
+
+def load_games(path):
+    with open(path, encoding='utf-8') as games_file:
+        return [(game['game_id'], game['player_name'], game['cookie']) for game in json.load(games_file)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many Warfish games with one bot from a single process.')
+    parser.add_argument('--bot', default='ContinentBot', help='module with a bot class of the same name')
+    parser.add_argument('--games', required=True, help='JSON list of objects with the game_id, player_name and cookie of each game')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT, help='most requests sent at once')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='seconds between polls of each game')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    bot_class = getattr(importlib.import_module(arguments.bot), arguments.bot)
+    orchestrator = Orchestrator(bot_class, load_games(arguments.games), max_in_flight=arguments.max_in_flight,
+                                poll_interval=arguments.poll_interval)
+    try:
+        asyncio.run(orchestrator.run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
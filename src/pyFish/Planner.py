@@ -0,0 +1,319 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module searches for a good plan for a whole turn: where to place the reserve units, a
+chain of attacks out from there and a transfer to finish with. Candidate plans are scored
+against a copy of the board in plain lists, using the exact odds from the Odds module to weigh
+every way the chain of attacks can end, and the best plan found is returned once the time
+budget runs out. The most promising candidates are tried first, so a short budget still gives
+a sensible plan and a longer one, or more processes, a better one.
+
+    planner = Planner(processes=4, budget=5)
+    plan = planner.plan(game, player)
+    execute_plan(game, plan)
+
+The budget should be kept well under Rules.boot_time, since the moves still have to be sent
+after the plan is chosen. The first plan also builds the odds tables for the game's dice, which
+takes a moment the budget does not cover, and the worker processes are started with a copy of
+them."""
+
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pyFish import Distances, Odds, Zobrist
+from pyFish.Moves import *
+
+#Seconds a plan is searched for by default.
+DEFAULT_BUDGET = 5.0
+#The number of plans sent to a worker at a time. Small batches let the search stop close to its deadline.
+BATCH_SIZE = 32
+#The territories considered for placing the reserve units, the longest chain of attacks tried
+#and the number of targets tried at each step of a chain.
+MAX_BASES = 6
+MAX_ATTACKS = 5
+BRANCHING = 3
+#How much a unit left open to attack counts against a plan, against a unit of income.
+EXPOSURE_WEIGHT = 0.25
+#How much owning part of a continent counts, against holding it.
+PROGRESS_WEIGHT = 0.5
+
+#The values of boards already valued in this process, keyed by map layout, player and board hash.
+values = Zobrist.TranspositionTable()
+
+"""A plan for a turn. placement maps territory ids to the units placed there, attacks is a list
+of (from id, to id) made in order with everything but one unit moving into each capture, and
+fortify is a (from id, to id, units) transfer or None. score is set once the plan is evaluated."""
+class TurnPlan:
+
+    def __init__(self, placement, attacks, fortify=None, score=None):
+        self.placement = placement
+        self.attacks = attacks
+        self.fortify = fortify
+        self.score = score
+
+    def __repr__(self):
+        return 'TurnPlan({0!r}, {1!r}, {2!r}, score={3!r})'.format(self.placement, self.attacks, self.fortify, self.score)
+
+"""The board as seen by one player, reduced to lists of numbers so it can be copied and sent
+to worker processes cheaply. Territories are numbered by Territory.index."""
+class Position:
+
+    def __init__(self, map, player, rules=None):
+        territories = sorted(map.territories.values(), key=lambda territory: territory.index)
+        self.territory_ids = [territory.id for territory in territories]
+        self.owners = [territory.owner.id if territory.owner is not None else -1 for territory in territories]
+        self.armies = [territory.armies for territory in territories]
+        self.attackable = [tuple(neighbor.index for neighbor in territory.attackable_neighbors.values()) for territory in territories]
+        self.defendable = [tuple(neighbor.index for neighbor in territory.defendable_neighbors.values()) for territory in territories]
+        self.continents = [(continent.bonus, tuple(territory.index for territory in continent.territories.values()))
+                           for continent in map.continents.values()]
+        self.layout = Distances.layout_key(map)
+        self.zobrist_hash = map.zobrist_hash
+        self.player_id = player.id
+        self.reserve_units = getattr(player, 'reserve_units', 0)
+        self.dice = (int(rules.attack_die_sides), int(rules.defend_die_sides)) if rules else (6, 6)
+
+    def value(self, owners, armies):
+        """How good the board is for the player: their income next turn and their progress toward
+        the continents they do not hold, less the units their border territories are short of the
+        strongest neighbor that could attack them."""
+        me = self.player_id
+        owned = sum(1 for owner in owners if owner == me)
+        if owned == 0:
+            return float('-inf')
+        income = max(3, owned // 3)
+        progress = 0.0
+        for bonus, members in self.continents:
+            held = sum(1 for index in members if owners[index] == me)
+            if held == len(members):
+                income += bonus
+            elif members:
+                progress += bonus * (held / len(members)) ** 2
+        exposure = 0
+        for index, owner in enumerate(owners):
+            if owner == me:
+                threat = max((armies[other] - 1 for other in self.defendable[index] if owners[other] != me and owners[other] != -1), default=0)
+                exposure += max(0, threat - armies[index])
+        return income + PROGRESS_WEIGHT * progress - EXPOSURE_WEIGHT * exposure
+
+    def cached_value(self, board, value):
+        """The value of the board with the given hash from the value table, or from calling value."""
+        return values.lookup((self.layout, self.player_id, board), value)
+
+def candidate_plans(position):
+    """Yield plans for the turn, the most promising first. Every placement territory with an
+    enemy neighbor is a base, the strongest first, and from each base every chain of attacks up
+    to MAX_ATTACKS long on the weakest BRANCHING neighbors at each step is a plan. Bases take
+    turns so the first plans cover all of them."""
+    me = position.player_id
+    owners, armies = position.owners, position.armies
+    bases = [index for index, owner in enumerate(owners) if owner == me and any(owners[other] != me for other in position.attackable[index])]
+    bases.sort(key=lambda index: armies[index] - min(armies[other] for other in position.attackable[index] if owners[other] != me), reverse=True)
+    if not bases:
+        yield TurnPlan({}, [])
+        return
+    per_base = [_chains(position, base) for base in bases[:MAX_BASES]]
+    for plans in itertools.zip_longest(*per_base):
+        for plan in plans:
+            if plan is not None:
+                yield plan
+
+def _chains(position, base):
+    placement = {position.territory_ids[base]: position.reserve_units} if position.reserve_units > 0 else {}
+    yield TurnPlan(placement, [])
+    me, owners, armies = position.player_id, position.owners, position.armies
+    #Breadth first, so the short chains from a base come before the long ones.
+    chains = [(base, [], {base})]
+    for _ in range(MAX_ATTACKS):
+        longer = []
+        for current, chain, visited in chains:
+            targets = [other for other in position.attackable[current] if owners[other] != me and other not in visited]
+            targets.sort(key=lambda other: armies[other])
+            for target in targets[:BRANCHING]:
+                attacks = chain + [(current, target)]
+                yield TurnPlan(placement, [(position.territory_ids[start], position.territory_ids[end]) for start, end in attacks])
+                longer.append((target, attacks, visited | {target}))
+        chains = longer
+
+def evaluate(position, plan, odds=None):
+    """Score the plan by the expected value of the board at the end of the turn. The chain of
+    attacks can stop at any attack that fails, and each of those endings is weighted by its chance.
+    The plan's fortify step is chosen here: the better of no transfer and moving the most units
+    from a territory no enemy borders toward the territory the chain ends on, or the frontier.
+    The board's hash is kept up to date as the plan is played out, so a board already valued for
+    another plan is looked up in the value table instead of valued again."""
+    odds = odds or Odds.odds_for_dice(*position.dice)
+    index_of = {territory_id: index for index, territory_id in enumerate(position.territory_ids)}
+    me = position.player_id
+    owners, armies = list(position.owners), list(position.armies)
+    board = position.zobrist_hash
+    def change(board, index, owner, units):
+        board = Zobrist.update(board, index, owners[index], armies[index], owner, units)
+        owners[index], armies[index] = owner, units
+        return board
+    for territory_id, units in plan.placement.items():
+        index = index_of[territory_id]
+        board = change(board, index, owners[index], armies[index] + units)
+    score = 0.0
+    reach = 1.0
+    for from_id, to_id in plan.attacks:
+        start, end = index_of[from_id], index_of[to_id]
+        if owners[start] != me or owners[end] == me or armies[start] < 2:
+            break
+        attackers, defenders = armies[start] - 1, armies[end]
+        win = odds.win_probability(attackers, defenders)
+        attackers_lost, defenders_lost = odds.expected_losses(attackers, defenders)
+        if win < 1.0:
+            #The chain ends here with the defender holding on. Every defender left is left in a loss.
+            held = max(1, round((defenders - defenders_lost) / (1.0 - win)))
+            failed = Zobrist.update(Zobrist.update(board, start, me, armies[start], me, 1), end, owners[end], armies[end], owners[end], held)
+            def failed_value():
+                failed_armies = list(armies)
+                failed_armies[start], failed_armies[end] = 1, held
+                return position.value(owners, failed_armies)
+            score += reach * (1.0 - win) * position.cached_value(failed, failed_value)
+        if win == 0.0:
+            reach = 0.0
+            break
+        #Every attacker left is left in a win.
+        left = (attackers - attackers_lost) / win
+        board = change(board, start, me, 1)
+        board = change(board, end, me, max(1, round(left)))
+        reach *= win
+    if reach > 0.0:
+        fortify = _fortify(position, owners, armies)
+        plain = position.cached_value(board, lambda: position.value(owners, armies))
+        fortified = plain
+        if fortify is not None:
+            start, end, units = index_of[fortify[0]], index_of[fortify[1]], fortify[2]
+            board = change(board, start, me, armies[start] - units)
+            board = change(board, end, me, armies[end] + units)
+            fortified = position.cached_value(board, lambda: position.value(owners, armies))
+        if fortified > plain:
+            plan.fortify = fortify
+            score += reach * fortified
+        else:
+            plan.fortify = None
+            score += reach * plain
+    plan.score = score
+    return plan
+
+def _fortify(position, owners, armies):
+    """The transfer of all but one unit from the strongest territory no enemy borders to an own
+    neighbor, preferring one that borders an enemy. None if there is nothing to move."""
+    me = position.player_id
+    frontier = lambda index: any(owners[other] != me for other in position.defendable[index])
+    interior = [index for index, owner in enumerate(owners) if owner == me and armies[index] > 1 and not frontier(index)]
+    if not interior:
+        return None
+    start = max(interior, key=lambda index: armies[index])
+    neighbors = [other for other in position.attackable[start] if owners[other] == me]
+    if not neighbors:
+        return None
+    end = max(neighbors, key=lambda other: (frontier(other), -armies[other]))
+    return (position.territory_ids[start], position.territory_ids[end], armies[start] - 1)
+
+def _evaluate_batch(position, plans):
+    odds = Odds.odds_for_dice(*position.dice)
+    return [evaluate(position, plan, odds) for plan in plans]
+
+class Planner:
+
+    def __init__(self, processes=None, budget=DEFAULT_BUDGET, batch_size=BATCH_SIZE):
+        """Plans are evaluated on a pool of processes, one per core unless another number is
+        given. With processes=1 they are evaluated in the calling process. The pool is started
+        the first time it is needed and kept for later turns."""
+        self.processes = processes or os.cpu_count() or 1
+        self.budget = budget
+        self.batch_size = batch_size
+        self._executor = None
+
+    def plan(self, game, player, budget=None):
+        """Return the best TurnPlan for the player found within the budget in seconds, or this
+        planner's budget. The game's map is not changed."""
+        deadline = time.monotonic() + (self.budget if budget is None else budget)
+        position = Position(game.map, player, game.rules)
+        candidates = candidate_plans(position)
+        #The first candidate is always scored, so there is a plan however short the budget.
+        best = evaluate(position, next(candidates))
+        batches = iter(lambda: list(itertools.islice(candidates, self.batch_size)), [])
+        if self.processes == 1:
+            for batch in batches:
+                for plan in batch:
+                    if time.monotonic() >= deadline:
+                        return best
+                    best = max(best, evaluate(position, plan), key=lambda plan: plan.score)
+            return best
+        if self._executor is None:
+            #The workers are given the odds tables scoring the first plan built, instead of each building their own.
+            self._executor = ProcessPoolExecutor(self.processes, initializer=Odds.install, initargs=(Odds.odds_for_dice(*position.dice),))
+        pending = set()
+        try:
+            #Two batches a process keep every process busy while results are collected.
+            for batch in itertools.islice(batches, 2 * self.processes):
+                pending.add(self._executor.submit(_evaluate_batch, position, batch))
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    best = max([best] + future.result(), key=lambda plan: plan.score)
+                    batch = next(batches, None)
+                    if batch:
+                        pending.add(self._executor.submit(_evaluate_batch, position, batch))
+        finally:
+            #Batches still running are left to finish on their own; their results are not waited for.
+            for future in pending:
+                future.cancel()
+        return best
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def execute_plan(game, plan):
+    """Make the moves of the plan that are still possible on the game, and return the last move
+    result. The chain of attacks stops at the first attack that does not capture its territory,
+    and every capture is followed by moving all but one unit in."""
+    territories = game.map.territories
+    move_result = None
+    if plan.placement and 'placeunits' in game.possible_actions:
+        move_result = game.execute_move(Moves.PlaceUnitsMove({territories[territory_id]: units for territory_id, units in plan.placement.items()}))
+    for from_id, to_id in plan.attacks:
+        from_territory, to_territory = territories[from_id], territories[to_id]
+        if 'attack' not in game.possible_actions or from_territory.armies < 2 or to_territory.owner is from_territory.owner:
+            break
+        move_result = game.execute_move(Moves.AttackMove(from_territory, to_territory, from_territory.armies - 1, True))
+        if not move_result.captured:
+            break
+        if 'freetransfer' in move_result.possible_actions and from_territory.armies > 1:
+            move_result = game.execute_move(Moves.FreeTransferMove(from_territory.armies - 1))
+    if plan.fortify and 'transfer' in game.possible_actions:
+        from_territory, to_territory = territories[plan.fortify[0]], territories[plan.fortify[1]]
+        units = min(plan.fortify[2], from_territory.armies - 1)
+        if units > 0 and from_territory.owner is to_territory.owner:
+            move_result = game.execute_move(Moves.TransferMove(from_territory, to_territory, units))
+    return move_result
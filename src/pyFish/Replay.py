@@ -0,0 +1,191 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module rebuilds the board of a game as it was at any point in its move log, by playing
+the moves of the log onto a Map. The board is saved every checkpoint_interval moves, so going
+to any point plays at most that many moves.
+
+The log does not say how many units move into a captured territory. They are worked out the
+same way the Engine does it: three units if the attacking territory has more than four, which
+is followed by a free transfer, and otherwise all but one."""
+
+import array
+from pyFish import Core, Engine
+from pyFish.Moves import History
+
+DEFAULT_CHECKPOINT_INTERVAL = 100
+#The units put on a territory when it is given to a player at the start of the game, for logs
+#whose selections do not record them. The Engine records them.
+SELECT_UNITS = 1
+
+"""A saved board: the owner and units of each territory by Territory.index, with -1 for neutral,
+and the reserve units, active flag and number of cards of each player, in the order of
+Replay.players."""
+class BoardState:
+
+    __slots__ = ('position', 'owners', 'armies', 'reserve_units', 'active', 'cards')
+
+    def __init__(self, position, owners, armies, reserve_units, active, cards):
+        self.position = position
+        self.owners = owners
+        self.armies = armies
+        self.reserve_units = reserve_units
+        self.active = active
+        self.cards = cards
+
+class Replay:
+
+    def __init__(self, details, log, players=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, select_units=SELECT_UNITS):
+        """details is a getDetails response and log is a MoveLog, or a list of move dictionaries
+        from getHistory. Moves added to a MoveLog later can be replayed too. The players are made
+        from the seats in the log; if a dictionary of players is given, such as Game.players,
+        their names are used."""
+        self.log = log if isinstance(log, History.MoveLog) else History.MoveLog(log)
+        self.checkpoint_interval = checkpoint_interval
+        self.select_units = select_units
+        seats = sorted({player_id for player_id in self.log.player_ids if player_id >= 0})
+        for player_id in (players or {}):
+            if int(player_id) not in seats:
+                seats.append(int(player_id))
+        self.players = {}
+        for seat in seats:
+            name = players[str(seat)].name if players and str(seat) in players else 'Player {0}'.format(seat)
+            self.players[str(seat)] = Core.Player({'name': name, 'isturn': '0', 'active': '1', 'teamid': '-1',
+                                                   'units': '0', 'profileid': '', 'id': str(seat)})
+        self.cards = dict.fromkeys(self.players, 0)
+        self.map = Core.Map(details['_content']['map']['_content']['territory'],
+                            details['_content']['board']['_content']['border'],
+                            details['_content']['continents']['_content']['continent'],
+                            [], self.players)
+        self.territories = sorted(self.map.territories.values(), key=lambda territory: territory.index)
+        self._territories_by_number = {int(territory.id): territory for territory in self.territories}
+        #The number of moves of the log that have been played onto the map.
+        self.position = 0
+        #checkpoints[k] is the board after k * checkpoint_interval moves.
+        self.checkpoints = [self.board_state()]
+
+    def seek(self, position):
+        """Set the map to the board after the first position moves of the log, and return it. The
+        board after the whole log is at len(log), and negative positions count back from there."""
+        if position < 0:
+            position += len(self.log)
+        if not 0 <= position <= len(self.log):
+            raise IndexError('There are only {0} moves in the log.'.format(len(self.log)))
+        #Start from the nearest checkpoint at or before the position unless the map is already closer.
+        checkpoint = self.checkpoints[min(position // self.checkpoint_interval, len(self.checkpoints) - 1)]
+        if self.position > position or self.position < checkpoint.position:
+            self.restore(checkpoint)
+        while self.position < position:
+            self._play(self.position)
+            self.position += 1
+            if self.position == len(self.checkpoints) * self.checkpoint_interval:
+                self.checkpoints.append(self.board_state())
+        return self.map
+
+    def state_at(self, position):
+        """The BoardState after the first position moves."""
+        self.seek(position)
+        return self.board_state()
+
+    def board_state(self):
+        return BoardState(self.position,
+                          array.array('i', [territory.owner.id if territory.owner else -1 for territory in self.territories]),
+                          array.array('i', [territory.armies for territory in self.territories]),
+                          array.array('i', [player.reserve_units for player in self.players.values()]),
+                          [player.active for player in self.players.values()],
+                          array.array('i', self.cards.values()))
+
+    def restore(self, state):
+        """Set the map and players to a BoardState."""
+        players_by_id = {player.id: player for player in self.players.values()}
+        for territory, owner, armies in zip(self.territories, state.owners, state.armies):
+            owner = players_by_id.get(owner)
+            if territory.owner is not owner:
+                territory.owner = owner
+            if territory.armies != armies:
+                territory.armies = armies
+        for (player_id, player), reserve_units, active, cards in zip(self.players.items(), state.reserve_units, state.active, state.cards):
+            player.reserve_units = reserve_units
+            player.active = active
+            self.cards[player_id] = cards
+        self.position = state.position
+
+    def apply_to(self, game, position=None):
+        """Set the owners and units of a Game's territories, and the reserve units and active flags
+        of its players, to the board after the first position moves, the whole log by default. This
+        brings a game whose view of the board has drifted back in line with its history."""
+        self.seek(len(self.log) if position is None else position)
+        for player in game.players.values():
+            player.territories = []
+        for territory in self.territories:
+            game_territory = game.map.territories[territory.id]
+            owner = game.players.get(str(territory.owner.id)) if territory.owner else None
+            if game_territory.owner is not owner:
+                game_territory.owner = owner
+            if game_territory.armies != territory.armies:
+                game_territory.armies = territory.armies
+            if owner:
+                owner.territories.append(game_territory)
+        for player_id, player in self.players.items():
+            if player_id in game.players:
+                game.players[player_id].reserve_units = player.reserve_units
+                game.players[player_id].active = player.active
+
+    def _play(self, row):
+        log = self.log
+        action = chr(log.actions[row])
+        player = self.players.get(str(log.player_ids[row]))
+        units = log.units[row]
+        if action in 'acfpty':
+            to_territory = self._territories_by_number[log.to_territories[row]]
+        if action in 'af':
+            from_territory = self._territories_by_number[log.from_territories[row]]
+
+        if action == 'y':
+            to_territory.owner = None
+            to_territory.armies = units
+        elif action == 't':
+            to_territory.owner = player
+            to_territory.armies = units if units != History.NO_VALUE else self.select_units
+        elif action == 'z':
+            player.reserve_units += units
+        elif action == 'p':
+            to_territory.armies += units
+            player.reserve_units = max(0, player.reserve_units - units)
+        elif action == 'a':
+            from_territory.armies -= log.attackers_lost[row]
+            to_territory.armies -= log.defenders_lost[row]
+        elif action == 'c':
+            #The territory was captured by the last attack. Only the Engine records the units moved in.
+            from_territory = self._territories_by_number[log.from_territories[log.actions.rfind(b'a', 0, row)]]
+            moved_units = units if units != History.NO_VALUE else min(Engine.CAPTURE_UNITS, from_territory.armies - 1)
+            to_territory.owner = player
+            from_territory.armies -= moved_units
+            to_territory.armies = moved_units
+        elif action == 'f':
+            from_territory.armies -= units
+            to_territory.armies += units
+        elif action == 'e':
+            self.players[str(log.other_player_ids[row])].active = False
+        elif action == 'g':
+            self.cards[str(player.id)] += 1
+        elif action == 'u':
+            self.cards[str(player.id)] -= len(log.extras.get(row, {}).get('clist', '').split(','))
+            player.reserve_units += units
+        elif action == 'h':
+            self.cards[str(player.id)] += units
+            self.cards[str(log.other_player_ids[row])] = 0
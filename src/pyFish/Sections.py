@@ -0,0 +1,85 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module reads and writes the binary files Snapshot and Archive use. A file starts with
+an 8 byte magic string naming its kind, the version of its format, the byte order of the
+machine that wrote it and a table giving the four byte name, offset and length of each section.
+Each section starts on a multiple of ALIGNMENT bytes, so arrays can be read out of a memory
+map of the file in place.
+
+>>> import io, mmap, os, tempfile
+>>> path = os.path.join(tempfile.mkdtemp(), 'example')
+>>> write(path, b'pyFishEx', 1, [(b'NAME', b'pyFish'), (b'DATA', bytes(range(4)))])
+>>> with open(path, 'rb') as example_file:
+...     view = example_file.read()
+>>> table = read_table(view, b'pyFishEx', 1)
+>>> offset, length = table[b'NAME']
+>>> view[offset:offset + length], offset % ALIGNMENT
+(b'pyFish', 0)
+>>> read_table(view, b'pyFishEx', 2) is None
+True"""
+
+import os
+import struct
+import sys
+
+#The magic, version, byte order and number of sections, then the name, offset and length of each section.
+_HEADER = struct.Struct('<8sHBxI')
+_SECTION = struct.Struct('<4sQQ')
+_BYTE_ORDERS = {'little': 0, 'big': 1}
+ALIGNMENT = 8
+
+def write(path, magic, version, sections):
+    """Write a list of (name, bytes) sections to the file. The file is replaced in one step, so a
+    reader never sees it half written."""
+    offset = align(_HEADER.size + _SECTION.size * len(sections))
+    table = []
+    for name, data in sections:
+        table.append(_SECTION.pack(name, offset, len(data)))
+        offset = align(offset + len(data))
+    temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as section_file:
+        section_file.write(_HEADER.pack(magic, version, _BYTE_ORDERS[sys.byteorder], len(sections)))
+        section_file.write(b''.join(table))
+        for name, data in sections:
+            section_file.write(bytes(align(section_file.tell()) - section_file.tell()))
+            section_file.write(data)
+    os.replace(temporary_path, path)
+
+def read_table(view, magic, version):
+    """Return a dictionary of the (offset, length) of each section of a file read or mapped into
+    view. None is returned if the file is of another kind, version or byte order, or is cut short."""
+    try:
+        file_magic, file_version, byte_order, count = _HEADER.unpack_from(view)
+        if file_magic != magic or file_version != version or byte_order != _BYTE_ORDERS[sys.byteorder]:
+            return None
+        table = {}
+        for number in range(count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + number * _SECTION.size)
+            if offset + length > len(view):
+                return None
+            table[name] = (offset, length)
+        return table
+    except struct.error:
+        return None
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,128 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local stand-in for the Warfish server, for running bots without the real one. It answers
+getDetails, getState, getHistory and doMove with games played by the Engine module. A game is
+dealt the first time its id is requested.
+
+Point a bot at it by setting Core.WARFISH_URL to the url of the server. The cookie decides which
+player a request is made for: a cookie of 'seat=1' plays as the player with id 1, and any other
+cookie plays as the player whose turn it is.
+
+    python -m pyFish.Server --port 8080 --players 3 --latency 0.05 0.2 --failure-rate 0.01"""
+
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from pyFish import Engine
+
+DEFAULT_DETAILS = os.path.join(os.path.dirname(__file__), '..', '..', 'json-examples', 'getDetails.json')
+
+class WarfishServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, details, number_of_players=3, latency=(0, 0), failure_rate=0, seed=None):
+        """details is a getDetails response used for the map and rules of every game. Each request
+        waits a random time between the two latency values in seconds, and fails with a 503 at the
+        given rate."""
+        super().__init__(address, _RequestHandler)
+        self.details = details
+        self.number_of_players = number_of_players
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.games = {}
+        self.games_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/war/services/rest'.format(*self.server_address[:2])
+
+    def game(self, game_id):
+        """Return the game with the given id, dealing a new one if it does not exist yet."""
+        with self.games_lock:
+            game = self.games.get(game_id)
+            if game is None:
+                #Games are seeded from their id so the same server seed always deals the same games.
+                seed = int(hashlib.md5('{0}:{1}'.format(self.seed, game_id).encode()).hexdigest(), 16)
+                game = Engine.Engine.new_game(self.details, self.number_of_players, seed)
+                self.games[game_id] = game
+            return game
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    #The headers and body are written separately, so Nagle's algorithm would hold back every response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        if server.latency[1] > 0:
+            time.sleep(server.random.uniform(*server.latency))
+        if server.random.random() < server.failure_rate:
+            self.send_body(503, b'Service Unavailable')
+            return
+
+        parameters = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        player_id = Engine.player_id_for_cookie(self.headers.get('Cookie'))
+        self.send_body(200, Engine.encode_request(server.game(parameters.get('gid')), parameters, player_id))
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Warfish server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--details', default=DEFAULT_DETAILS, help='getDetails response with the map and rules to play on')
+    parser.add_argument('--players', type=int, default=3)
+    parser.add_argument('--latency', type=float, nargs=2, default=(0, 0), metavar=('MIN', 'MAX'), help='seconds added to every request')
+    parser.add_argument('--failure-rate', type=float, default=0, help='fraction of requests answered with a 503')
+    parser.add_argument('--seed', type=int)
+    arguments = parser.parse_args()
+    with open(arguments.details, encoding='utf-8') as details_file:
+        details = json.load(details_file)
+    server = WarfishServer((arguments.host, arguments.port), details, arguments.players,
+                           tuple(arguments.latency), arguments.failure_rate, arguments.seed)
+    print('Serving Warfish games at {0}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
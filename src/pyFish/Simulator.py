@@ -0,0 +1,189 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module estimates the outcome of a sequence of attacks by rolling the dice for many
+trials at once in NumPy arrays. It is meant for chains of attacks and dice rules the tables in
+the Odds module do not cover. Large numbers of trials can be split across a process pool.
+
+An attack in the sequence is made in a trial only if the attacker owns the territory it is made
+from, with at least two units on it, and does not own the territory attacked. So an attack from
+a territory that an earlier attack failed to capture is skipped."""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from pyFish.Odds import MAX_ATTACK_DICE, MAX_DEFEND_DICE
+
+#Splitting fewer trials than this across processes costs more than it saves.
+MIN_TRIALS_PER_PROCESS = 20000
+#The units that move into a captured territory when move_all is off, as Warfish does.
+CAPTURE_UNITS = 3
+
+def simulate(game_or_map, attacks, trials=10000, attack_die_sides=None, defend_die_sides=None, move_all=True, seed=None, processes=None):
+    """Simulate the AttackMoves in order and return a SimulationResult. The die sides come from
+    the rules of the game when a Game is given, and default to 6 otherwise. Each attack uses the
+    smaller of its number_of_units and the units it can attack with at that point in the trial.
+    After a capture all but one unit move in when move_all is set; otherwise CAPTURE_UNITS do,
+    as when the free transfer is skipped. With processes set to more than 1 the trials are split
+    across a process pool."""
+    map = getattr(game_or_map, 'map', game_or_map)
+    rules = getattr(game_or_map, 'rules', None)
+    if attack_die_sides is None:
+        attack_die_sides = int(rules.attack_die_sides) if rules else 6
+    if defend_die_sides is None:
+        defend_die_sides = int(rules.defend_die_sides) if rules else 6
+    plan = _Plan(map, attacks, attack_die_sides, defend_die_sides, move_all)
+
+    seeds = numpy.random.SeedSequence(seed)
+    processes = min(processes or 1, max(1, trials // MIN_TRIALS_PER_PROCESS))
+    if processes == 1:
+        return SimulationResult(plan, *_run(plan, trials, seeds))
+    chunks = [trials // processes + (1 if index < trials % processes else 0) for index in range(processes)]
+    with ProcessPoolExecutor(processes) as executor:
+        parts = list(executor.map(_run, [plan] * processes, chunks, seeds.spawn(processes)))
+    return SimulationResult(plan, *(numpy.concatenate(arrays) for arrays in zip(*parts)))
+
+"""Everything a worker needs to run trials, reduced to plain values so it pickles cheaply."""
+class _Plan:
+
+    def __init__(self, map, attacks, attack_die_sides, defend_die_sides, move_all):
+        if not attacks:
+            raise ValueError('There must be at least one attack to simulate.')
+        attacker = attacks[0].from_territory.owner
+        territories = []
+        for attack in attacks:
+            for territory in (attack.from_territory, attack.to_territory):
+                if territory not in territories:
+                    territories.append(territory)
+        self.territory_ids = [territory.id for territory in territories]
+        self.armies = numpy.array([territory.armies for territory in territories], dtype=numpy.int32)
+        self.owned = numpy.array([territory.owner is attacker for territory in territories], dtype=bool)
+        self.from_indices = [territories.index(attack.from_territory) for attack in attacks]
+        self.to_indices = [territories.index(attack.to_territory) for attack in attacks]
+        self.units = [attack.number_of_units for attack in attacks]
+        self.continuous = [attack.is_continuous for attack in attacks]
+        self.attack_die_sides = attack_die_sides
+        self.defend_die_sides = defend_die_sides
+        self.move_all = move_all
+        #A defender is eliminated when every territory they own is captured.
+        defenders = []
+        for territory in territories:
+            if territory.owner is not None and territory.owner is not attacker and territory.owner not in defenders:
+                defenders.append(territory.owner)
+        self.defender_ids = [defender.id for defender in defenders]
+        self.defender_territory_counts = numpy.array([sum(1 for territory in map.territories.values() if territory.owner is defender)
+                                                      for defender in defenders], dtype=numpy.int32)
+        self.defender_of = numpy.array([defenders.index(territory.owner) if territory.owner in defenders else -1
+                                        for territory in territories], dtype=numpy.int32)
+
+def _run(plan, trials, seed_sequence):
+    random = numpy.random.default_rng(seed_sequence)
+    armies = numpy.tile(plan.armies, (trials, 1))
+    owned = numpy.tile(plan.owned, (trials, 1))
+    captured = numpy.zeros((trials, len(plan.units)), dtype=bool)
+    for attack, (from_index, to_index) in enumerate(zip(plan.from_indices, plan.to_indices)):
+        attacking = numpy.minimum(plan.units[attack], armies[:, from_index] - 1)
+        active = owned[:, from_index] & ~owned[:, to_index] & (attacking > 0)
+        attacking = numpy.where(active, attacking, 0)
+        defending = numpy.where(active, armies[:, to_index], 0)
+        attacker_losses = numpy.zeros(trials, dtype=numpy.int32)
+        defender_losses = numpy.zeros(trials, dtype=numpy.int32)
+        while True:
+            rolling = (attacking > attacker_losses) & (defending > defender_losses)
+            if not rolling.any():
+                break
+            rows = numpy.flatnonzero(rolling)
+            attack_dice = numpy.minimum(attacking[rows] - attacker_losses[rows], MAX_ATTACK_DICE)
+            defend_dice = numpy.minimum(defending[rows] - defender_losses[rows], MAX_DEFEND_DICE)
+            attack_rolls = _roll(random, len(rows), MAX_ATTACK_DICE, attack_dice, plan.attack_die_sides)
+            defend_rolls = _roll(random, len(rows), MAX_DEFEND_DICE, defend_dice, plan.defend_die_sides)
+            comparisons = numpy.minimum(attack_dice, defend_dice)
+            for pair in range(min(MAX_ATTACK_DICE, MAX_DEFEND_DICE)):
+                compared = comparisons > pair
+                #The defender wins ties.
+                attacker_wins = attack_rolls[:, pair] > defend_rolls[:, pair]
+                defender_losses[rows] += compared & attacker_wins
+                attacker_losses[rows] += compared & ~attacker_wins
+            if not plan.continuous[attack]:
+                break
+        armies[:, from_index] -= attacker_losses
+        armies[:, to_index] -= defender_losses
+        won = active & (armies[:, to_index] == 0)
+        captured[:, attack] = won
+        owned[:, to_index] |= won
+        moved = armies[:, from_index] - 1
+        if not plan.move_all:
+            moved = numpy.minimum(moved, CAPTURE_UNITS)
+        moved = numpy.where(won, moved, 0)
+        armies[:, from_index] -= moved
+        armies[:, to_index] += moved
+    return armies, owned, captured
+
+def _roll(random, rows, most_dice, dice, sides):
+    """Roll most_dice dice for each row, sorted highest first. Dice beyond the number a row
+    rolls are 0, which sorts them last."""
+    rolls = random.integers(1, sides + 1, size=(rows, most_dice), dtype=numpy.int16)
+    rolls[numpy.arange(most_dice) >= dice[:, None]] = 0
+    return -numpy.sort(-rolls, axis=1)
+
+"""The outcome of every trial of a simulation. armies and owned have a column for each
+territory in territory_ids, and captured has a column for each attack."""
+class SimulationResult:
+
+    def __init__(self, plan, armies, owned, captured):
+        self.territory_ids = plan.territory_ids
+        self.defender_ids = plan.defender_ids
+        self.armies = armies
+        self.owned = owned
+        self.captured = captured
+        self.trials = len(armies)
+        captured_from = [(owned[:, column] & ~plan.owned[column]) for column in range(len(plan.territory_ids))]
+        #The number of territories each defender lost in each trial.
+        losses = numpy.zeros((self.trials, len(plan.defender_ids)), dtype=numpy.int32)
+        for column, defender in enumerate(plan.defender_of):
+            if defender >= 0:
+                losses[:, defender] += captured_from[column]
+        self.eliminated = losses >= plan.defender_territory_counts
+
+    def _column(self, territory):
+        return self.territory_ids.index(getattr(territory, 'id', territory))
+
+    def capture_probability(self, attack=-1):
+        """The chance that the attack at the given position in the sequence captures its territory.
+        The default is the last attack."""
+        return self.captured[:, attack].mean()
+
+    def all_captured_probability(self):
+        return self.captured.all(axis=1).mean()
+
+    def captures(self):
+        """The chance of capturing 0, 1, ... territories."""
+        return numpy.bincount(self.captured.sum(axis=1), minlength=self.captured.shape[1] + 1) / self.trials
+
+    def ownership_probability(self, territory):
+        """The chance that the attacker owns the territory, or territory id, at the end."""
+        return self.owned[:, self._column(territory)].mean()
+
+    def expected_armies(self, territory):
+        return self.armies[:, self._column(territory)].mean()
+
+    def armies_distribution(self, territory):
+        """The chance of 0, 1, ... units being left on the territory at the end."""
+        return numpy.bincount(self.armies[:, self._column(territory)]) / self.trials
+
+    def elimination_probability(self, player):
+        """The chance that the player, or player id, is eliminated."""
+        return self.eliminated[:, self.defender_ids.index(getattr(player, 'id', player))].mean()
@@ -0,0 +1,198 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module saves the whole state of a Game to a binary file and restores it, so a bot that
+is started again on a game it was just playing does not have to download and parse everything
+again. A restored game only checks the lastmod of its possible actions with Warfish, and
+catches up on whatever has changed since it was saved.
+
+    game.save_snapshot('73888572.snapshot')
+    ...
+    game = Snapshot.resume('73888572.snapshot', '73888572', cookie)
+
+A snapshot is a file of sections, as written by the Sections module: the territory and
+continent names as one block of strings, the borders, continents and board as arrays of 32 bit
+integers, the move log as the arrays of its MoveLog, and everything else as a short piece of
+JSON. Loading copies each section out of the memory mapped file. The move log arrays are copied
+whole into a MoveLog with no moves to decode, but the Map is still built again through the same
+dictionaries Core.Map is given from Warfish. The arrays are in the byte order of
+the machine that saved them, and a snapshot from a different version of the format or a
+machine with a different byte order is not loaded."""
+
+import array
+import json
+import mmap
+from pyFish import Core, Sections
+from pyFish.Moves import *
+
+MAGIC = b'pyFishSn'
+VERSION = 1
+#The MoveLog arrays in the order they are saved.
+_HISTORY_COLUMNS = ('ids', 'timestamps', 'actions', 'player_ids', 'from_territories', 'to_territories', 'units',
+                    'attackers_lost', 'defenders_lost', 'other_player_ids', 'attack_dice', 'defend_dice')
+
+def save(game, path):
+    """Write the game to a snapshot file. The file is replaced in one step, so a bot stopped part
+    way through saving leaves the last snapshot as it was."""
+    map = game.map
+    territories = sorted(map.territories.values(), key=lambda territory: territory.index)
+    continents = list(map.continents.values())
+    strings = [value for territory in territories for value in (territory.id, territory.name, territory.max_units)]
+    strings += [value for continent in continents for value in (continent.id, continent.name)]
+    borders = array.array('i', [value for territory in territories for neighbor in territory.attackable_neighbors.values()
+                                for value in (territory.index, neighbor.index)])
+    #The size of each continent, then the bonus of each, then the territories of each in turn.
+    continent_values = array.array('i', [len(continent.territories) for continent in continents])
+    continent_values.extend(continent.bonus for continent in continents)
+    continent_values.extend(territory.index for continent in continents for territory in continent.territories.values())
+    #The owner of each territory, -1 for neutral, then the armies on each.
+    board = array.array('i', [-1 if territory.owner is None else territory.owner.id for territory in territories])
+    board.extend(territory.armies for territory in territories)
+    history = game.history
+    meta = {'game_id': game.id,
+            'lastmod': game.lastmod,
+            'possible_actions': game.possible_actions,
+            'last_move': _describe_move(game.last_move),
+            'rules': vars(game.rules),
+            'players': [{name: value for name, value in vars(player).items() if name != 'territories'} for player in game.players.values()],
+            'distance_cache_directory': map.distance_cache_directory,
+            'moves': len(history) if history is not None else None,
+            'extras': {str(row): extras for row, extras in history.extras.items()} if history is not None else {}}
+    sections = [(b'META', json.dumps(meta, separators=(',', ':')).encode()),
+                (b'STRS', '\0'.join(strings).encode()),
+                (b'BORD', borders.tobytes()),
+                (b'CONT', continent_values.tobytes()),
+                (b'STAT', board.tobytes())]
+    if history is not None:
+        sections += [('H{0:03d}'.format(number).encode(), bytes(getattr(history, column))) for number, column in enumerate(_HISTORY_COLUMNS)]
+    Sections.write(path, MAGIC, VERSION, sections)
+
+def load(path, cookie, transport=None):
+    """Return the Game saved in the snapshot file, playing with the given cookie and sending moves
+    over the given transport or the shared default transport. The cookie is never saved in a
+    snapshot. None is returned if there is no snapshot or it can not be read."""
+    try:
+        with open(path, 'rb') as snapshot_file, mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            table = Sections.read_table(view, MAGIC, VERSION)
+            if table is None:
+                return None
+            sections = {name: view[offset:offset + length] for name, (offset, length) in table.items()}
+    except (FileNotFoundError, ValueError):
+        return None
+    try:
+        return _restore(sections, cookie, transport)
+    except (KeyError, IndexError, ValueError):
+        return None
+
+def _restore(sections, cookie, transport):
+    meta = json.loads(sections[b'META'])
+    strings = sections[b'STRS'].decode().split('\0')
+    players = {}
+    for values in meta['players']:
+        player = Core.Player.__new__(Core.Player)
+        player.__dict__.update(values)
+        player.cards = tuple(player.cards)
+        player.territories = []
+        players[str(player.id)] = player
+    rules = Core.Rules.__new__(Core.Rules)
+    rules.__dict__.update(meta['rules'])
+
+    board = _integers(sections[b'STAT'])
+    size = len(board) // 2
+    territory_ids = strings[0:3 * size:3]
+    map_dictionary = [{'id': territory_id, 'name': name, 'maxunits': max_units}
+                      for territory_id, name, max_units in zip(territory_ids, strings[1:3 * size:3], strings[2:3 * size:3])]
+    borders = _integers(sections[b'BORD'])
+    board_dictionary = [{'a': territory_ids[borders[position]], 'b': territory_ids[borders[position + 1]]} for position in range(0, len(borders), 2)]
+    continent_values = _integers(sections[b'CONT'])
+    continent_strings = strings[3 * size:]
+    number_of_continents = len(continent_strings) // 2
+    continents_dictionary = []
+    position = 2 * number_of_continents
+    for number in range(number_of_continents):
+        members = continent_values[position:position + continent_values[number]]
+        position += continent_values[number]
+        continents_dictionary.append({'id': continent_strings[2 * number], 'name': continent_strings[2 * number + 1],
+                                      'units': str(continent_values[number_of_continents + number]),
+                                      'cids': ','.join(territory_ids[index] for index in members)})
+    board_state = [{'id': territory_id, 'playerid': str(owner), 'units': str(armies)}
+                   for territory_id, owner, armies in zip(territory_ids, board[:size], board[size:])]
+    map = Core.Map(map_dictionary, board_dictionary, continents_dictionary, board_state, players)
+    map.distance_cache_directory = meta['distance_cache_directory']
+
+    history = None
+    if meta['moves'] is not None:
+        history = History.MoveLog()
+        for number, column in enumerate(_HISTORY_COLUMNS):
+            values, data = getattr(history, column), sections['H{0:03d}'.format(number).encode()]
+            #The dice are kept in bytearrays and the rest in arrays.
+            if isinstance(values, bytearray):
+                values.extend(data)
+            else:
+                values.frombytes(data)
+        history.extras = {int(row): extras for row, extras in meta['extras'].items()}
+        if len(history) != meta['moves']:
+            return None
+    game = Core.Game(meta['game_id'], map, players, rules, history, cookie, meta['possible_actions'], transport, meta['lastmod'])
+    game.last_move = _restore_move(meta['last_move'], map)
+    return game
+
+def resume(path, game_id, cookie, transport=None, **options):
+    """Return the game from the snapshot brought up to date with Warfish, or a game from
+    Core.initialize_game, given the options, if the snapshot is missing, unreadable or of another
+    game. Only the lastmod of the possible actions is requested unless the game has changed; then
+    the board and the moves made since the snapshot are requested."""
+    game = load(path, cookie, transport)
+    if game is None or game.id != game_id:
+        return Core.initialize_game(game_id, cookie, transport=transport, **options)
+    if game.refresh() and game.history is not None:
+        start = game.history.ids[-1] + 1 if len(game.history) else 0
+        game.history.extend(Core.sync_history(game_id, cookie, start=start, transport=transport))
+    return game
+
+def _integers(data):
+    values = array.array('i')
+    values.frombytes(data)
+    return values
+
+def _describe_move(move):
+    """The move as a list of plain values, starting with its action."""
+    if isinstance(move, Moves.AttackMove):
+        return [move.action_id, move.from_territory.id, move.to_territory.id, move.number_of_units, move.is_continuous]
+    if isinstance(move, Moves.PlaceUnitsMove):
+        return [move.action_id, {territory.id: units for territory, units in move.territory_dict.items()}]
+    if isinstance(move, Moves.FreeTransferMove):
+        return [move.action_id, move.number_of_armies]
+    if isinstance(move, Moves.TransferMove):
+        return [move.action_id, move.from_territory.id, move.to_territory.id, move.number_of_units]
+    if isinstance(move, Moves.EndTurnMove):
+        return [move.action_id]
+    return None
+
+def _restore_move(description, map):
+    if not description:
+        return None
+    action, territories = description[0], map.territories
+    if action == 'attack':
+        return Moves.AttackMove(territories[description[1]], territories[description[2]], description[3], description[4])
+    if action == 'placeunits':
+        return Moves.PlaceUnitsMove({territories[territory_id]: units for territory_id, units in description[1].items()})
+    if action == 'freetransfer':
+        return Moves.FreeTransferMove(description[1])
+    if action == 'transfer':
+        return Moves.TransferMove(territories[description[1]], territories[description[2]], description[3])
+    return Moves.EndTurnMove()
@@ -0,0 +1,177 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module sends requests to Warfish. A transport is any object with a get(url, headers)
+method that returns the body of the response as bytes, so a fake one can be used in place
+of the network. A transport can also have an open(url, headers) method for reading a large
+response as it arrives; see open_url. A transport that answers requests in the same process,
+like Engine.EngineTransport, can have a request(url, headers) method that returns the response
+as a dictionary, so it is not encoded as JSON only to be decoded again."""
+
+import contextlib
+import gzip
+import http.client
+import io
+import queue
+import threading
+import urllib.error
+import urllib.parse
+
+"""Sends requests over persistent keep-alive connections. Connections are pooled per host and
+reused between requests, so one transport can be shared by every Game in a process."""
+class HTTPTransport:
+
+    def __init__(self, pool_size=4, timeout=60, accept_gzip=True):
+        """pool_size is the maximum number of connections open to each host at once."""
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.accept_gzip = accept_gzip
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        """Make a GET request and return the body of the response."""
+        pool, connection, response = self._request(url, headers)
+        try:
+            body = response.read()
+        except BaseException:
+            connection.close()
+            pool.release(connection)
+            raise
+        self._release(pool, connection, response)
+        _check_status(url, response)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    @contextlib.contextmanager
+    def open(self, url, headers=None):
+        """Make a GET request and return a context manager giving the body of the response as a
+        binary file, which is read from the connection as it is used. The connection is reused
+        only if the whole body was read."""
+        pool, connection, response = self._request(url, headers)
+        try:
+            if response.status >= 400:
+                response.read()
+                _check_status(url, response)
+            if response.getheader('Content-Encoding') == 'gzip':
+                yield gzip.GzipFile(fileobj=response)
+            else:
+                yield response
+        finally:
+            if not response.isclosed():
+                #What is left of the body would have to be read before the connection could be used again.
+                connection.close()
+            self._release(pool, connection, response)
+
+    def _request(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        request_headers = {'Connection': 'keep-alive'}
+        if self.accept_gzip:
+            request_headers['Accept-Encoding'] = 'gzip'
+        if headers:
+            request_headers.update(headers)
+
+        pool = self._pool(parts.scheme, parts.netloc)
+        connection, reused = pool.acquire()
+        try:
+            try:
+                response = self._send(connection, path, request_headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                #The server closed an idle connection. Only a reused connection is retried.
+                if not reused:
+                    raise
+                connection.close()
+                response = self._send(connection, path, request_headers)
+        except BaseException:
+            connection.close()
+            pool.release(connection)
+            raise
+        return pool, connection, response
+
+    def _release(self, pool, connection, response):
+        if response.will_close:
+            connection.close()
+        pool.release(connection)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def _send(self, connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        return connection.getresponse()
+
+    def _pool(self, scheme, host):
+        with self._lock:
+            pool = self._pools.get((scheme, host))
+            if pool is None:
+                connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+                pool = _ConnectionPool(lambda: connection_class(host, timeout=self.timeout), self.pool_size)
+                self._pools[(scheme, host)] = pool
+            return pool
+
+def _check_status(url, response):
+    if response.status >= 400:
+        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+@contextlib.contextmanager
+def open_url(transport, url, headers=None):
+    """Return a context manager giving the body of a response as a binary file. Transports with an
+    open method, like HTTPTransport, stream the body; the body from any other transport's get is
+    read in full and wrapped in a file."""
+    if hasattr(transport, 'open'):
+        with transport.open(url, headers) as body:
+            yield body
+    else:
+        yield io.BytesIO(transport.get(url, headers))
+
+"""A fixed number of connections to a single host. Callers wait for a connection when all of
+them are in use."""
+class _ConnectionPool:
+
+    def __init__(self, connection_factory, size):
+        self.connection_factory = connection_factory
+        self.available = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def acquire(self):
+        """Return a connection and whether it has been used before."""
+        self.available.acquire()
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_factory(), False
+
+    def release(self, connection):
+        #http.client reopens a closed connection on its next request, so closed ones are kept too.
+        self.idle.put(connection)
+        self.available.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+#Shared by every request that is not given its own transport.
+default_transport = HTTPTransport()
@@ -0,0 +1,116 @@
+#Copyright 2009 Brian Meeker
+#
+#This file is part of pyFish.
+#
+#pyFish is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pyFish is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pyFish.  If not, see <http://www.gnu.org/licenses/>.
+
+"""This module identifies board positions with 64 bit Zobrist hashes. Every combination of
+territory, owner and army count has a random key, and the hash of a board is the exclusive or
+of the keys of its territories, so changing one territory changes the hash by two exclusive
+ors instead of hashing the whole board again. Map keeps its hash up to date in zobrist_hash.
+
+Keys are worked out from their territory index, owner id and army count rather than drawn
+from a random generator, so the same position has the same hash in every process. Army counts
+are used exactly, so boards that differ only in the size of a large stack hash differently and
+an evaluation stored for one is never given for the other.
+
+>>> owners, armies = [0, 1, -1], [3, 1, 2]
+>>> board = board_hash(owners, armies)
+>>> moved = update(board, 1, 1, 1, 0, 4)
+>>> moved == board_hash([0, 0, -1], [3, 4, 2])
+True
+>>> table = TranspositionTable(2)
+>>> table.lookup(board, lambda: 'evaluated')
+'evaluated'
+>>> board in table, table.hits, table.misses
+(True, 0, 1)
+>>> board_hash([0, 1], [20, 5]) == board_hash([0, 1], [31, 5])
+False"""
+
+import collections
+
+#The owner id of neutral territories.
+NEUTRAL = -1
+#The number of evaluations a TranspositionTable keeps by default.
+DEFAULT_TABLE_SIZE = 100000
+_MASK = (1 << 64) - 1
+
+def key(index, owner_id, armies):
+    """The key of a territory with the given index held by the player with owner_id, or NEUTRAL,
+    with armies units."""
+    #splitmix64 of the three values packed together.
+    value = (index * 0x9E3779B97F4A7C15 + (owner_id + 2) * 0xBF58476D1CE4E5B9 + armies * 0x94D049BB133111EB) & _MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+def board_hash(owners, armies):
+    """The hash of a whole board given as lists of owner ids and armies by territory index."""
+    result = 0
+    for index, (owner_id, units) in enumerate(zip(owners, armies)):
+        result ^= key(index, owner_id, units)
+    return result
+
+def update(board, index, previous_owner_id, previous_armies, owner_id, armies):
+    """The hash of the board after one territory changes."""
+    return board ^ key(index, previous_owner_id, previous_armies) ^ key(index, owner_id, armies)
+
+"""Evaluations of positions keyed by their hash, or anything built from it. Once max_size are
+held the least recently used is dropped for each new one."""
+class TranspositionTable:
+
+    def __init__(self, max_size=DEFAULT_TABLE_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key, evaluate):
+        """The value stored for the key, or the result of calling evaluate, which is stored."""
+        value = self.get(key, self)
+        if value is self:
+            value = evaluate()
+            self.store(key, value)
+        return value
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()